@@ -6,6 +6,7 @@ Fallback ke LBPH jika InsightFace tidak tersedia.
 
 import os
 import sys
+import json
 import sqlite3
 import logging
 from datetime import datetime
@@ -49,6 +50,44 @@ except Exception as e:
     logger.error(f"InsightFace not available: {e}")
     raise RuntimeError("InsightFace is required for this application")
 
+# ====== MODEL WARM-UP ======
+# Only the process that serves requests loads and warms the models: right away in
+# the Werkzeug reloader's child (WERKZEUG_RUN_MAIN=true), otherwise on the first
+# request, so the reloader's file-watching parent (debug=True) never loads them.
+# A failed warm-up is started again by the next request.
+_warmup_started = False
+
+def start_warmup():
+    global _warmup_started
+    if not face_engine.FACE_ENGINE_WARMUP:
+        return
+    if not _warmup_started or face_engine.warmup_status()['state'] == 'failed':
+        _warmup_started = True
+        face_engine.warm_up()
+
+if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    start_warmup()
+
+@app.before_request
+def warmup_on_first_request():
+    start_warmup()
+
+# Reply when every inference worker is busy and the queue is full (INFERENCE_WORKERS mode)
+BUSY_MSG = "Server sedang sibuk, silakan coba lagi."
+
+# ====== WEBSOCKET (optional) ======
+# flask-sock provides the persistent /ws/check_face channel; without it kiosks
+# keep polling /api/check_face over HTTP
+try:
+    from flask_sock import Sock
+    sock = Sock(app)
+except ImportError as e:
+    sock = None
+    logger.warning(f"flask-sock not installed, /ws/check_face disabled: {e}")
+
+# Kiosks send a frame about every 350 ms; a socket silent this long (seconds) is dropped
+WS_RECEIVE_TIMEOUT = float(os.environ.get("WS_RECEIVE_TIMEOUT", "5"))
+
 # ====== ADMIN CREDENTIALS ======
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
 _default_plain = os.environ.get("ADMIN_PASSWORD_PLAIN", "Cakra@123")
@@ -137,6 +176,16 @@ def bytes_to_bgr(image_bytes: bytes):
     np_data = np.frombuffer(image_bytes, np.uint8)
     return cv2.imdecode(np_data, cv2.IMREAD_COLOR)
 
+def uploaded_frames(files=None):
+    """
+    The files[] / frames[] uploads as still-encoded frames: the engine decodes
+    each one only when it reaches it and releases it before the next, so a
+    request never holds every frame decoded (unreadable images are dropped there).
+    """
+    if files is None:
+        files = request.files.getlist("files[]") or request.files.getlist("frames[]")
+    return [face_engine.EncodedFrame(data) for data in (f.read() for f in files) if data]
+
 # ====== ROUTES (pages tetap) ======
 @app.get("/")
 def index():
@@ -225,6 +274,12 @@ def api_engine_status():
 
     return jsonify(ok=True, status=status)
 
+@app.get("/api/engine/ready")
+def api_engine_ready():
+    """Readiness probe: 200 once the models are loaded and warmed up, 503 before"""
+    warmup = face_engine.warmup_status()
+    return jsonify(ok=True, ready=warmup['ready'], warmup=warmup), (200 if warmup['ready'] else 503)
+
 # ====== API: PATIENTS (READ) untuk tabel admin ======
 @app.get("/api/patients")
 def api_patients():
@@ -298,15 +353,8 @@ def api_register():
         """, (nik, name, dob, address, now_iso))
         conn.commit()
 
-    # Convert uploaded files to BGR images
-    frames = []
-    for f in files:
-        try:
-            img = bytes_to_bgr(f.read())
-            if img is not None:
-                frames.append(img)
-        except Exception as e:
-            logger.warning(f"Failed to process frame: {e}")
+    # Frames stay encoded; the engine decodes them one at a time
+    frames = uploaded_frames(files)
 
     if not frames:
         with db_connect() as conn:
@@ -330,6 +378,9 @@ def api_register():
         with db_connect() as conn:
             conn.execute("DELETE FROM patients WHERE nik = ?", (nik,))
             conn.commit()
+        if isinstance(e, face_engine.InferenceBusy):
+            logger.warning(f"[REGISTER] Inference workers busy: {e}")
+            return jsonify(ok=False, msg=BUSY_MSG), 503
         logger.error(f"[REGISTER] InsightFace error: {e}")
         return jsonify(ok=False, msg="Error pada engine face recognition."), 500
 
@@ -352,15 +403,8 @@ def api_recognize():
     # Check if fast_mode is enabled (for auto-detection)
     fast_mode = request.form.get("fast_mode", "false").lower() == "true"
 
-    # Convert uploaded files to BGR images
-    frames = []
-    for f in files:
-        try:
-            img = bytes_to_bgr(f.read())
-            if img is not None:
-                frames.append(img)
-        except Exception:
-            pass
+    # Frames stay encoded; the engine decodes them one at a time
+    frames = uploaded_frames(files)
 
     if not frames:
         return jsonify(ok=True, found=False, msg="Tidak ada frame yang valid.")
@@ -368,35 +412,150 @@ def api_recognize():
     # Use InsightFace engine only
     try:
         result = face_engine.recognize_face_multi_frame(frames, fast_mode=fast_mode)
-        if result is not None:
-            nik = result['nik']
-            with db_connect() as conn:
-                row = conn.execute(
-                    "SELECT nik, name, dob, address FROM patients WHERE nik = ?",
-                    (nik,)
-                ).fetchone()
-
-            if row:
-                age = calculate_age(row["dob"])
-                confidence = result.get('confidence', int(result['similarity'] * 100))
-
-                logger.info(f"[RECOGNIZE] InsightFace success: NIK={nik}, sim={result['similarity']:.3f}, fast_mode={fast_mode}")
-                return jsonify(
-                    ok=True, found=True,
-                    nik=row["nik"], name=row["name"], dob=row["dob"], address=row["address"],
-                    age=age, confidence=confidence,
-                    engine="insightface",
-                    similarity=result['similarity']
-                )
-            else:
-                logger.warning(f"[RECOGNIZE] InsightFace matched NIK {nik} but not found in patients DB")
-                return jsonify(ok=True, found=False, msg="Wajah dikenali tetapi data pasien tidak ditemukan.")
-        else:
-            return jsonify(ok=True, found=False, msg="Wajah tidak dikenali.")
+        return recognition_response(result, fast_mode)
+    except face_engine.InferenceBusy as e:
+        logger.warning(f"[RECOGNIZE] Inference workers busy: {e}")
+        return jsonify(ok=False, msg=BUSY_MSG), 503
     except Exception as e:
         logger.error(f"[RECOGNIZE] InsightFace error: {e}")
         return jsonify(ok=False, msg="Error pada engine face recognition."), 500
 
+def recognition_response(result, fast_mode: bool, **extra):
+    """JSON reply of /api/recognize for an engine result (None = not recognized)"""
+    if result is None:
+        return jsonify(ok=True, found=False, msg="Wajah tidak dikenali.", **extra)
+
+    nik = result['nik']
+    with db_connect() as conn:
+        row = conn.execute(
+            "SELECT nik, name, dob, address FROM patients WHERE nik = ?",
+            (nik,)
+        ).fetchone()
+
+    if not row:
+        logger.warning(f"[RECOGNIZE] InsightFace matched NIK {nik} but not found in patients DB")
+        return jsonify(ok=True, found=False, msg="Wajah dikenali tetapi data pasien tidak ditemukan.", **extra)
+
+    age = calculate_age(row["dob"])
+    confidence = result.get('confidence', int(result['similarity'] * 100))
+
+    logger.info(f"[RECOGNIZE] InsightFace success: NIK={nik}, sim={result['similarity']:.3f}, fast_mode={fast_mode}")
+    return jsonify(
+        ok=True, found=True,
+        nik=row["nik"], name=row["name"], dob=row["dob"], address=row["address"],
+        age=age, confidence=confidence,
+        engine="insightface",
+        similarity=result['similarity'],
+        **extra
+    )
+
+# ====== API: PROGRESSIVE RECOGNITION SESSION ======
+# The kiosk opens a session, posts frames in small chunks while it is still
+# capturing, and stops as soon as a reply says done (same voting rules as
+# /api/recognize). /finish decides on whatever was received. Sessions are kept
+# in this process (see RECOGNITION_SESSION_MAX): multi-process servers need
+# sticky routing, otherwise chunks reach a process that replies 404.
+@app.post("/api/recognize/session")
+def api_recognize_session_start():
+    fast_mode = request.form.get("fast_mode", "false").lower() == "true"
+    try:
+        session_id = face_engine.start_recognition_session(fast_mode=fast_mode)
+    except Exception as e:
+        logger.error(f"[RECOGNIZE] Session start error: {e}")
+        return jsonify(ok=False, msg="Error pada engine face recognition."), 500
+    return jsonify(ok=True, session_id=session_id)
+
+@app.post("/api/recognize/session/<session_id>/frames")
+def api_recognize_session_frames(session_id: str):
+    return recognize_session_step(session_id, uploaded_frames())
+
+@app.post("/api/recognize/session/<session_id>/finish")
+def api_recognize_session_finish(session_id: str):
+    return recognize_session_step(session_id, None)
+
+def recognize_session_step(session_id: str, frames):
+    """Add a chunk of frames (or finish, frames=None) and reply with the decision once there is one"""
+    try:
+        if frames is None:
+            status = face_engine.finish_recognition_session(session_id)
+        else:
+            status = face_engine.add_session_frames(session_id, frames)
+        if status is None:
+            return jsonify(ok=False, msg="Sesi verifikasi tidak ditemukan atau sudah berakhir."), 404
+        if not status['done']:
+            return jsonify(ok=True, done=False, processed_frames=status['processed_frames'])
+        return recognition_response(status['result'], fast_mode=status['fast_mode'], done=True,
+                                    processed_frames=status['processed_frames'])
+    except face_engine.InferenceBusy as e:
+        logger.warning(f"[RECOGNIZE] Inference workers busy: {e}")
+        return jsonify(ok=False, msg=BUSY_MSG), 503
+    except Exception as e:
+        logger.error(f"[RECOGNIZE] Session error: {e}")
+        face_engine.close_recognition_session(session_id)
+        return jsonify(ok=False, msg="Error pada engine face recognition."), 500
+
+@app.post("/api/verify")
+def api_verify():
+    """
+    Verify that uploaded frames match a claimed NIK (1:1).
+    Only that NIK's embeddings are compared, so cost does not grow with the gallery.
+    """
+    nik_str = request.form.get("nik", "").strip()
+    if not nik_str:
+        return jsonify(ok=False, msg="NIK wajib diisi."), 400
+    try:
+        nik = int(nik_str)
+    except ValueError:
+        return jsonify(ok=False, msg="NIK harus angka."), 400
+
+    files = request.files.getlist("files[]")
+    if not files:
+        files = request.files.getlist("frames[]")
+
+    if not files:
+        return jsonify(ok=False, msg="Tidak ada gambar yang dikirim."), 400
+
+    fast_mode = request.form.get("fast_mode", "false").lower() == "true"
+
+    with db_connect() as conn:
+        row = conn.execute(
+            "SELECT nik, name, dob, address FROM patients WHERE nik = ?",
+            (nik,)
+        ).fetchone()
+    if not row:
+        return jsonify(ok=False, msg="NIK tidak terdaftar."), 404
+
+    # Frames stay encoded; the engine decodes them one at a time
+    frames = uploaded_frames(files)
+
+    if not frames:
+        return jsonify(ok=True, verified=False, msg="Tidak ada frame yang valid.")
+
+    try:
+        result = face_engine.verify_face_multi_frame(frames, nik, fast_mode=fast_mode)
+        if result is None:
+            return jsonify(ok=True, verified=False, nik=nik, msg="Belum ada data wajah untuk NIK ini.")
+
+        logger.info(f"[VERIFY] NIK={nik}, verified={result['verified']}, sim={result['similarity']:.3f}, "
+                    f"fast_mode={fast_mode}")
+        if not result['verified']:
+            return jsonify(ok=True, verified=False, nik=nik, similarity=result['similarity'],
+                           msg="Wajah tidak cocok dengan NIK.")
+
+        return jsonify(
+            ok=True, verified=True,
+            nik=row["nik"], name=row["name"], dob=row["dob"], address=row["address"],
+            age=calculate_age(row["dob"]), confidence=result['confidence'],
+            engine="insightface",
+            similarity=result['similarity']
+        )
+    except face_engine.InferenceBusy as e:
+        logger.warning(f"[VERIFY] Inference workers busy: {e}")
+        return jsonify(ok=False, msg=BUSY_MSG), 503
+    except Exception as e:
+        logger.error(f"[VERIFY] InsightFace error: {e}")
+        return jsonify(ok=False, msg="Error pada engine face recognition."), 500
+
 # ====== API: QUEUE (untuk sinkron Admin <-> User, tidak diubah) ======
 @app.post("/api/queue/assign")
 def api_queue_assign():
@@ -436,10 +595,14 @@ def api_queue_set():
 def retrain_after_change():
     """Retrain model after changes (placeholder - InsightFace doesn't need retraining)"""
     try:
-        # For InsightFace, we don't need to retrain like LBPH
-        # Just reload embeddings to ensure consistency
-        face_engine.load_all_embeddings()
-        return True, "Model berhasil di-reload"
+        # For InsightFace, we don't need to retrain like LBPH.
+        # The gallery is updated incrementally; only reload if it drifted from embeddings.db
+        result = face_engine.verify_gallery(repair=True)
+        if 'msg' in result:
+            return False, result['msg']
+        if result.get('reloaded'):
+            return True, "Model berhasil di-reload"
+        return True, "Gallery konsisten"
     except Exception as e:
         logger.error(f"Retrain failed: {e}")
         return False, str(e)
@@ -452,6 +615,18 @@ def admin_retrain():
     flash(("Retrain sukses." if ok else f"Retrain gagal: {msg}"), "success" if ok else "danger")
     return redirect(url_for("admin_dashboard"))
 
+@app.post("/admin/prune")
+@login_required
+def admin_prune():
+    """Keep a small diverse set of embeddings per NIK and delete the rest"""
+    result = face_engine.prune_gallery()
+    if result.get('ok'):
+        flash(f"Prune sukses: {result['deleted']} embedding dihapus dari {result['pruned_niks']} NIK "
+              f"({result['rows_before']} -> {result['rows_after']}).", "success")
+    else:
+        flash(f"Prune gagal: {result.get('msg')}", "danger")
+    return redirect(url_for("admin_dashboard"))
+
 @app.post("/admin/patient/<int:nik>/delete")
 @login_required
 def admin_delete_patient(nik: int):
@@ -539,5 +714,33 @@ def api_check_face():
         logger.warning(f"Check face error: {e}")
         return jsonify(ok=False, found=False)
 
+if sock is not None:
+    @sock.route("/ws/check_face")
+    def ws_check_face(ws):
+        """
+        Persistent check_face channel of one kiosk.
+        The kiosk sends small JPEG frames as binary messages (or the text
+        "reset" after a scan) and gets one JSON reply per frame:
+        {ok, found, held_ms, required_ms, trigger}. The presence countdown
+        lives here, so the kiosk only renders it and scans on trigger.
+        A kiosk that sends nothing for WS_RECEIVE_TIMEOUT is disconnected.
+        """
+        presence = face_engine.FacePresence()
+        while True:
+            msg = ws.receive(timeout=WS_RECEIVE_TIMEOUT)
+            if msg is None:
+                return
+            if isinstance(msg, str):
+                if msg == "reset":
+                    presence.reset()
+                continue
+            try:
+                img = bytes_to_bgr(msg)
+                found = img is not None and face_engine.detect_closest_face_opencv(img)
+                ws.send(json.dumps(dict(ok=True, **presence.update(found))))
+            except Exception as e:
+                logger.warning(f"Check face stream error: {e}")
+                ws.send(json.dumps(dict(ok=False, **presence.update(False))))
+
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=5001, debug=True)
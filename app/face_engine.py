@@ -9,12 +9,19 @@ Pipeline:
 4. Matching: Cosine similarity with threshold tuning
 """
 
+import io
 import os
+import json
+import time
+import queue
+import atexit
 import sqlite3
 import threading
 import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Tuple, List, Dict, Any
+from typing import Optional, Tuple, List, Dict, Any, Iterable, Iterator
 
 import cv2
 import numpy as np
@@ -43,6 +50,62 @@ RECOGNITION_THRESHOLD = float(os.environ.get("RECOGNITION_THRESHOLD", "0.82"))
 MIN_FACE_SIZE = int(os.environ.get("MIN_FACE_SIZE", "60"))  # Minimum face size in pixels
 EMBEDDING_DIM = 512  # ArcFace embedding dimension
 
+# Detector input size per call path: longest side in pixels (the frame's aspect
+# ratio is kept, rounded up to the detector stride). 0 = adaptive: the smallest
+# size at which a MIN_FACE_SIZE face still spans DET_MIN_FACE_PIXELS.
+DET_SIZE_FULL = int(os.environ.get("DET_SIZE_FULL", "640"))  # Full-mode recognition
+DET_SIZE_FAST = int(os.environ.get("DET_SIZE_FAST", "640"))  # Fast-mode recognition
+DET_SIZE_REGISTRATION = int(os.environ.get("DET_SIZE_REGISTRATION", "640"))  # Enrollment
+CHECK_FACE_DET_SIZE = int(os.environ.get("CHECK_FACE_DET_SIZE", "320"))  # Haar auto-trigger (/api/check_face)
+CHECK_FACE_REQUIRED_MS = int(os.environ.get("CHECK_FACE_REQUIRED_MS", "1400"))  # Face held this long triggers a scan
+DET_MIN_FACE_PIXELS = int(os.environ.get("DET_MIN_FACE_PIXELS", "24"))  # Smallest face detected reliably
+DET_STRIDE = 32  # Largest RetinaFace/SCRFD feature stride
+
+# Standard 5-point ArcFace alignment targets in a 112x112 crop
+ARCFACE_REFERENCE_POINTS = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041]
+], dtype=np.float32)
+
+# InsightFace models to load (FaceAnalysis allowed_modules). The pipeline only
+# uses detection + recognition; "all" also loads gender/age and landmark models.
+INSIGHTFACE_MODULES = os.environ.get("INSIGHTFACE_MODULES", "detection,recognition")
+INSIGHTFACE_MODULE_REPORT = os.environ.get("INSIGHTFACE_MODULE_REPORT", "0") == "1"  # Log savings at startup
+
+# ONNX Runtime session options for the InsightFace models (0 / defaults = ORT's choice)
+ORT_INTRA_OP_THREADS = int(os.environ.get("ORT_INTRA_OP_THREADS", "0"))  # 0 = all cores / cores per session
+ORT_INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+ORT_GRAPH_OPTIMIZATION = os.environ.get("ORT_GRAPH_OPTIMIZATION", "all").lower()  # disable | basic | extended | all
+ORT_EXECUTION_MODE = os.environ.get("ORT_EXECUTION_MODE", "sequential").lower()  # sequential | parallel
+# Independent model instances (own ORT sessions) that concurrent requests check out
+INFERENCE_SESSIONS = int(os.environ.get("INFERENCE_SESSIONS", "1"))
+
+# Dynamic batching: recognition crops from concurrent requests are queued and run
+# as one batch once BATCH_MAX_FACES are waiting or BATCH_MAX_WAIT_MS has passed
+DYNAMIC_BATCHING = os.environ.get("DYNAMIC_BATCHING", "0") == "1"  # Opt-in; direct calls otherwise
+BATCH_MAX_FACES = int(os.environ.get("BATCH_MAX_FACES", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+BATCH_RESULT_TIMEOUT = 30.0  # Seconds a request waits for its batch before giving up
+
+# Inference service mode: INFERENCE_WORKERS processes own the models and receive
+# decoded frames through shared memory; the web process only dispatches and waits
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))  # Opt-in; 0 = inference in this process
+INFERENCE_QUEUE_DEPTH = int(os.environ.get("INFERENCE_QUEUE_DEPTH", "8"))  # Requests waiting for a worker before rejecting
+INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", "30"))  # Seconds without a reply before a worker is restarted
+INFERENCE_START_METHOD = os.environ.get("INFERENCE_START_METHOD", "spawn")
+
+# Progressive recognition sessions: frames arrive in chunks, decision as soon as voting allows.
+# Sessions live in the memory of the process that opened them: with several web
+# worker processes, route a kiosk to one process (sticky sessions) or use /api/recognize
+RECOGNITION_SESSION_TTL = float(os.environ.get("RECOGNITION_SESSION_TTL", "30"))  # Seconds idle before a session expires
+RECOGNITION_SESSION_MAX = int(os.environ.get("RECOGNITION_SESSION_MAX", "64"))  # Open sessions (oldest evicted)
+
+# Load the models and run dummy inferences in the background at startup
+FACE_ENGINE_WARMUP = os.environ.get("FACE_ENGINE_WARMUP", "1") == "1"
+
 # Registration thresholds (stricter for 100% accuracy)
 REGISTRATION_DETECTION_THRESHOLD = float(os.environ.get("REGISTRATION_DETECTION_THRESHOLD", "0.5"))  # Higher threshold for registration
 REGISTRATION_QUALITY_THRESHOLD = float(os.environ.get("REGISTRATION_QUALITY_THRESHOLD", "0.3"))  # Higher quality threshold for registration
@@ -58,28 +121,125 @@ FAST_MODE_EARLY_VOTES = int(os.environ.get("FAST_MODE_EARLY_VOTES", "3"))  # Ear
 FAST_MODE_EARLY_SIM = float(os.environ.get("FAST_MODE_EARLY_SIM", "0.50"))  # Early stop similarity in fast mode
 FAST_MODE_MIN_VOTES = int(os.environ.get("FAST_MODE_MIN_VOTES", "2"))  # Minimum votes in fast mode
 
+# Faces per recognition-model batch after the first one (which holds the early
+# stop vote count); 0 = embed all frames of a request in one batch
+RECOGNITION_BATCH_SIZE = int(os.environ.get("RECOGNITION_BATCH_SIZE", "4"))
+
+# Pre-inference frame selection (opt-in): every frame is scored on a small
+# grayscale copy, unusable frames are dropped and only the K sharpest reach the
+# detector, still in capture order. K per endpoint, 0 = no best-K selection.
+RECOGNIZE_TOP_K = int(os.environ.get("RECOGNIZE_TOP_K", "0"))  # /api/recognize, /api/verify
+FAST_MODE_TOP_K = int(os.environ.get("FAST_MODE_TOP_K", "0"))  # Same endpoints with fast_mode
+REGISTRATION_TOP_K = int(os.environ.get("REGISTRATION_TOP_K", "0"))  # /api/register
+FRAME_GATE = os.environ.get("FRAME_GATE", "0") == "1"  # Drop unusable frames even without best-K
+FRAME_SHARPEST_FIRST = os.environ.get("FRAME_SHARPEST_FIRST", "0") == "1"  # Detect kept frames sharpest first
+FRAME_SELECT_SIZE = int(os.environ.get("FRAME_SELECT_SIZE", "160"))  # Longest side of the scoring copy
+FRAME_MIN_SHARPNESS = float(os.environ.get("FRAME_MIN_SHARPNESS", "10.0"))  # Laplacian variance
+FRAME_MIN_BRIGHTNESS = float(os.environ.get("FRAME_MIN_BRIGHTNESS", "30.0"))  # Mean gray level
+FRAME_MAX_BRIGHTNESS = float(os.environ.get("FRAME_MAX_BRIGHTNESS", "230.0"))
+FRAME_MAX_MOTION = float(os.environ.get("FRAME_MAX_MOTION", "40.0"))  # Mean abs diff to neighbour frames (0 = off)
+
+# Face tracking within a burst (opt-in): after a full-frame detection, later frames
+# are only searched in the previous face box grown by TRACK_ROI_MARGIN per side.
+# Needs frames in capture order, so it is skipped with FRAME_SHARPEST_FIRST.
+FACE_TRACKING = os.environ.get("FACE_TRACKING", "0") == "1"
+TRACK_REDETECT_EVERY = int(os.environ.get("TRACK_REDETECT_EVERY", "0"))  # Full detection every N frames (0 = only when lost)
+TRACK_ROI_MARGIN = float(os.environ.get("TRACK_ROI_MARGIN", "0.5"))
+
+# Approximate nearest-neighbour (IVF) search for very large galleries
+ANN_ENABLED = os.environ.get("ANN_ENABLED", "0") == "1"  # Opt-in; exact search otherwise
+ANN_NLIST = int(os.environ.get("ANN_NLIST", "0"))  # Coarse clusters (0 = auto, ~4*sqrt(rows))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))  # Clusters scanned per query (recall vs latency)
+ANN_MIN_GALLERY = int(os.environ.get("ANN_MIN_GALLERY", "50000"))  # Exact search below this many embeddings
+ANN_RETRAIN_GROWTH = float(os.environ.get("ANN_RETRAIN_GROWTH", "2"))  # Retrain once rows reach this x trained rows (0 = never)
+ANN_INDEX_PATH = os.path.join(MODEL_DIR, "ann_ivf.npz")
+ANN_INDEX_FORMAT = 1
+
+# Two-stage search: per-identity prototype (centroid) pass, then exact max-sim on the top candidates
+PROTOTYPE_SEARCH = os.environ.get("PROTOTYPE_SEARCH", "0") == "1"  # Opt-in; exact search otherwise
+PROTOTYPE_CANDIDATES = int(os.environ.get("PROTOTYPE_CANDIDATES", "32"))  # Identities re-scored exactly
+PROTOTYPE_MARGIN = float(os.environ.get("PROTOTYPE_MARGIN", "0.15"))  # Min gap to first excluded prototype
+PROTOTYPE_MIN_IDENTITIES = int(os.environ.get("PROTOTYPE_MIN_IDENTITIES", "1000"))  # Exact search below this
+
+# Compact gallery: in-memory search dtype and SQLite BLOB dtype (float32 | float16 | int8)
+GALLERY_DTYPE = os.environ.get("GALLERY_DTYPE", "float32").lower()  # Dtype of the in-memory gallery
+EMBEDDING_STORE_DTYPE = os.environ.get("EMBEDDING_STORE_DTYPE", "float32").lower()  # Dtype of new BLOBs
+GALLERY_RERANK = int(os.environ.get("GALLERY_RERANK", "0"))  # Re-score top-N identities in float32 (0 = off)
+GALLERY_RERANK_MARGIN = float(os.environ.get("GALLERY_RERANK_MARGIN", "0.02"))  # Re-rank below threshold too
+# float16 scoring is bound by the float16 -> float32 upcast: several times slower
+# than float32 on CPUs/NumPy builds without vectorized half-float conversion
+# (scripts/quantization_report.py measures it); int8 costs about the same as float32
+GALLERY_CHUNK_ROWS = 4096  # Rows upcast per block (into a per-thread float32 buffer) when scoring a compact gallery
+INT8_RANGE = 0.25  # int8 value 127 <-> component 0.25 (unit-norm ArcFace components stay well inside)
+_EMBEDDING_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+
+# Memory-mapped gallery snapshot (EMBEDDING_NPY_PATH + LABELS_PATH) shared by all workers on a host
+GALLERY_SNAPSHOT = os.environ.get("GALLERY_SNAPSHOT", "1") == "1"
+GALLERY_SNAPSHOT_FORMAT = 1
+
+# Incremental gallery updates leave dead rows behind (deleted / re-keyed NIKs); compact past this share
+GALLERY_COMPACT_RATIO = float(os.environ.get("GALLERY_COMPACT_RATIO", "0.25"))
+GALLERY_COMPACT_MIN_ROWS = int(os.environ.get("GALLERY_COMPACT_MIN_ROWS", "1024"))  # Never compact for fewer
+
+# Sharded exhaustive search: the gallery is split by NIK hash across worker processes (shared memory)
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", "0"))  # Opt-in; 0/1 = in-process search
+SHARD_MIN_GALLERY = int(os.environ.get("SHARD_MIN_GALLERY", "200000"))  # In-process search below this many rows
+SHARD_START_METHOD = os.environ.get("SHARD_START_METHOD", "spawn")  # spawn works on Windows and Linux
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "10"))  # Seconds without a shard reply before the pool is replaced
+
+# Gallery pruning (prune_gallery / scripts/prune_gallery.py): diverse embeddings kept per NIK
+PRUNE_KEEP = int(os.environ.get("PRUNE_KEEP", "5"))
+PRUNE_DUPLICATE_SIM = float(os.environ.get("PRUNE_DUPLICATE_SIM", "0.98"))  # Near-duplicates are never kept
+
 # Global state
 _engine_lock = threading.Lock()
 _face_app = None
-_embeddings_db = {}  # {nik: [embeddings]}
+_face_app_pool = None  # queue.Queue of INFERENCE_SESSIONS model instances (None = share _face_app)
 _embeddings_loaded = False
 
+# The in-memory gallery itself is the immutable snapshot in `_gallery` (see IN-MEMORY GALLERY)
+
+# IVF index state (coarse centroids + inverted lists over gallery rows)
+_ann_lock = threading.Lock()
+_ann_centroids = None  # (nlist, 512) float32, trained or loaded from ANN_INDEX_PATH
+_ann_assign = None  # (centroids, gallery buffers, list of each row assigned so far)
+_ann_lists = None  # (centroids, gallery version, list_offsets, row_order)
+_ann_training = None  # Thread training the centroids when none were saved (one at a time)
+_ann_trained_rows = 0  # Gallery rows the centroids were trained on (0 = unknown)
 
-def _get_face_app():
-    """Lazy load InsightFace app to avoid startup delay"""
+
+def _get_face_app(model_dir: Optional[str] = None):
+    """
+    Lazy load InsightFace app to avoid startup delay (see warm_up).
+    Thread-safe: concurrent first calls wait for one load, and _face_app is
+    only published once the app and its session pool are ready.
+    model_dir is the InsightFace root for that load (defaults to MODEL_DIR).
+    """
     global _face_app
-    if _face_app is None:
+    if _face_app is not None:
+        return _face_app
+
+    with _engine_lock:
+        if _face_app is not None:
+            return _face_app
         try:
             from insightface.app import FaceAnalysis
             logger.info("Initializing InsightFace app...")
-            _face_app = FaceAnalysis(
+            t0 = time.perf_counter()
+            app = FaceAnalysis(
                 name='buffalo_l',  # Uses RetinaFace + ArcFace
-                root=MODEL_DIR,
+                root=model_dir or MODEL_DIR,
+                allowed_modules=_allowed_modules(),  # Skip gender/age and landmark models by default
                 providers=['CPUExecutionProvider']  # Use CPU for compatibility
             )
             # ctx_id=-1 -> CPU; det_size wider for better detection
-            _face_app.prepare(ctx_id=-1, det_size=(640, 640))
-            logger.info("InsightFace app initialized successfully")
+            app.prepare(ctx_id=-1, det_size=(640, 640))
+            logger.info(f"InsightFace app initialized successfully (modules: {', '.join(sorted(app.models))}, "
+                        f"{time.perf_counter() - t0:.1f}s)")
+            if INSIGHTFACE_MODULE_REPORT:
+                _report_dropped_models(app)
+            _build_session_pool(app)
+            _face_app = app
         except ImportError as e:
             logger.warning(f"InsightFace not available in this Python environment: {e}")
             _face_app = None
@@ -89,6 +249,174 @@ def _get_face_app():
     return _face_app
 
 
+def _ort_session_options():
+    """
+    SessionOptions from the ORT_* settings, or None if they are all defaults.
+    With several sessions, intra-op threads default to cores / INFERENCE_SESSIONS
+    so concurrent requests do not oversubscribe the CPU.
+    """
+    import onnxruntime as ort
+
+    sessions = max(INFERENCE_SESSIONS, 1)
+    intra = ORT_INTRA_OP_THREADS or (max((os.cpu_count() or 1) // sessions, 1) if sessions > 1 else 0)
+    if (intra == 0 and ORT_INTER_OP_THREADS == 0 and ORT_GRAPH_OPTIMIZATION == 'all'
+            and ORT_EXECUTION_MODE == 'sequential'):
+        return None
+
+    opts = ort.SessionOptions()
+    if intra > 0:
+        opts.intra_op_num_threads = intra
+    if ORT_INTER_OP_THREADS > 0:
+        opts.inter_op_num_threads = ORT_INTER_OP_THREADS
+    opts.graph_optimization_level = {
+        'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    }.get(ORT_GRAPH_OPTIMIZATION, ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+    opts.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if ORT_EXECUTION_MODE == 'parallel'
+                           else ort.ExecutionMode.ORT_SEQUENTIAL)
+    return opts
+
+
+def _with_sessions(app, opts, copy_app: bool = True):
+    """
+    The prepared FaceAnalysis with every model on a new ORT session built from
+    opts: a shallow copy (copy_app) or the same object with its sessions replaced.
+    """
+    import copy
+    import onnxruntime as ort
+
+    target = copy.copy(app) if copy_app else app
+    models = {}
+    for taskname, model in app.models.items():
+        clone = copy.copy(model)
+        clone.session = ort.InferenceSession(model.model_file, sess_options=opts, providers=['CPUExecutionProvider'])
+        if hasattr(clone, 'center_cache'):
+            clone.center_cache = {}  # Detector anchor cache, per instance
+        models[taskname] = clone
+    target.models = models
+    target.det_model = models['detection']
+    return target
+
+
+def _build_session_pool(app):
+    """Apply the ORT_* session options to the app and add INFERENCE_SESSIONS - 1 independent copies"""
+    global _face_app_pool
+    _face_app_pool = None
+    try:
+        opts = _ort_session_options()
+        if opts is not None:
+            _with_sessions(app, opts, copy_app=False)
+        sessions = max(INFERENCE_SESSIONS, 1)
+        if sessions == 1:
+            return
+
+        pool = queue.Queue()
+        pool.put(app)
+        for _ in range(sessions - 1):
+            pool.put(_with_sessions(app, opts))
+        _face_app_pool = pool
+        logger.info(f"Inference session pool: {sessions} sessions, "
+                    f"{opts.intra_op_num_threads} intra-op threads each")
+    except Exception as e:
+        logger.error(f"Failed to build inference session pool, sharing one session: {e}")
+
+
+@contextmanager
+def _face_app_session():
+    """
+    Check out a model instance for one inference call (blocks while all
+    INFERENCE_SESSIONS are busy). Yields None if InsightFace is unavailable.
+    """
+    app = _get_face_app()
+    pool = _face_app_pool
+    if app is None or pool is None:
+        yield app
+        return
+
+    instance = pool.get()
+    try:
+        yield instance
+    finally:
+        pool.put(instance)
+
+
+def _allowed_modules() -> Optional[List[str]]:
+    """FaceAnalysis allowed_modules from INSIGHTFACE_MODULES (None = every model in the pack)"""
+    names = [m.strip() for m in INSIGHTFACE_MODULES.split(",") if m.strip()]
+    if not names or 'all' in names:
+        return None
+    if 'detection' not in names:
+        names.insert(0, 'detection')  # FaceAnalysis cannot run without a detector
+    return names
+
+
+def _process_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, if it can be read"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _report_dropped_models(app, runs: int = 10):
+    """
+    Log what the models excluded by INSIGHTFACE_MODULES would cost: each one is
+    loaded on its own, its memory and per-face latency measured, then released.
+    """
+    import gc
+    import glob
+    from insightface.model_zoo import model_zoo
+    from insightface.app.common import Face
+
+    # Synthetic 640x480 frame with one 240px face (reference points scaled into the box)
+    img = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    bbox = np.array([200, 120, 440, 360], dtype=np.float32)
+    kps = ARCFACE_REFERENCE_POINTS / 112.0 * 240.0 + bbox[:2]
+
+    rows = []
+    for onnx_file in sorted(glob.glob(os.path.join(app.model_dir, '*.onnx'))):
+        try:
+            rss_before = _process_rss()
+            model = model_zoo.get_model(onnx_file, providers=['CPUExecutionProvider'])
+            if model is None or model.taskname in app.models:
+                del model
+                continue
+            model.prepare(-1)
+            rss_after = _process_rss()
+
+            model.get(img, Face(bbox=bbox, kps=kps, det_score=0.99))  # Warm-up
+            t0 = time.perf_counter()
+            for _ in range(runs):
+                model.get(img, Face(bbox=bbox, kps=kps, det_score=0.99))
+            ms = (time.perf_counter() - t0) * 1000 / runs
+
+            # RSS delta, but never below the weights (freed pages of the previous model get reused)
+            memory = os.path.getsize(onnx_file)
+            if rss_before is not None and rss_after is not None:
+                memory = max(memory, rss_after - rss_before)
+            rows.append((model.taskname, os.path.basename(onnx_file), memory, ms))
+            del model
+            gc.collect()
+        except Exception as e:
+            logger.warning(f"Model report skipped {os.path.basename(onnx_file)}: {e}")
+
+    if not rows:
+        logger.info("Model report: no models dropped")
+        return
+    for taskname, filename, memory, ms in rows:
+        logger.info(f"Model report: dropped {taskname} ({filename}): saves {memory / 1e6:.1f} MB, "
+                    f"{ms:.1f} ms per face")
+    logger.info(f"Model report: total saved {sum(r[2] for r in rows) / 1e6:.1f} MB, "
+                f"{sum(r[3] for r in rows):.1f} ms per face per frame")
+
+
 def _normalize_embedding(embedding: np.ndarray) -> np.ndarray:
     """L2 normalize embedding vector"""
     norm = np.linalg.norm(embedding)
@@ -118,6 +446,1223 @@ def cosine_similarity(emb1: np.ndarray, emb2: np.ndarray) -> float:
     return _cosine_similarity(emb1, emb2)
 
 
+# ====== EMBEDDING QUANTIZATION ======
+
+def _resolve_dtype(name: str) -> np.dtype:
+    """Map a float32/float16/int8 setting to a numpy dtype (float32 if unknown)"""
+    if name not in _EMBEDDING_DTYPES:
+        logger.warning(f"Unknown embedding dtype '{name}', using float32")
+        name = 'float32'
+    return np.dtype(_EMBEDDING_DTYPES[name])
+
+
+def _quantize_embedding(embedding: np.ndarray, dtype: Optional[str] = None) -> np.ndarray:
+    """Convert normalized float embedding(s) to a compact dtype (defaults to GALLERY_DTYPE)"""
+    target = _resolve_dtype(dtype or GALLERY_DTYPE)
+    embedding = np.asarray(embedding)
+    if embedding.dtype == target:
+        return embedding
+    embedding = _dequantize_embedding(embedding)
+    if target == np.int8:
+        return np.clip(np.rint(embedding * (127.0 / INT8_RANGE)), -127, 127).astype(np.int8)
+    return embedding.astype(target)
+
+
+def _dequantize_embedding(stored: np.ndarray) -> np.ndarray:
+    """Convert stored embedding(s) of any supported dtype back to float32"""
+    stored = np.asarray(stored)
+    if stored.dtype == np.int8:
+        return stored.astype(np.float32) * np.float32(INT8_RANGE / 127.0)
+    return stored.astype(np.float32, copy=False)
+
+
+def _embedding_from_blob(blob: bytes) -> np.ndarray:
+    """Decode an embeddings.db BLOB; the dtype follows from its length"""
+    itemsize = len(blob) // EMBEDDING_DIM
+    dtype = {4: np.float32, 2: np.float16, 1: np.int8}.get(itemsize)
+    if dtype is None or itemsize * EMBEDDING_DIM != len(blob):
+        raise ValueError(f"Unexpected embedding BLOB size: {len(blob)} bytes")
+    return np.frombuffer(blob, dtype=dtype)
+
+
+_upcast_local = threading.local()
+
+
+def _upcast_buffer(rows: int, dim: int) -> np.ndarray:
+    """This thread's reusable float32 block for upcasting compact gallery rows, reallocated only to grow"""
+    buf = getattr(_upcast_local, 'buffer', None)
+    if buf is None or buf.shape[0] < rows or buf.shape[1] != dim:
+        buf = _upcast_local.buffer = np.empty((rows, dim), dtype=np.float32)
+    return buf
+
+
+def _gallery_dot(queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """
+    queries @ matrix.T for a gallery stored in any supported dtype.
+    Compact galleries are upcast in GALLERY_CHUNK_ROWS blocks into this
+    thread's reusable float32 buffer, so a float32 copy of the whole matrix is
+    never materialized and no block is allocated per chunk.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if matrix.dtype == np.float32:
+        return queries @ matrix.T
+
+    out = np.empty(queries.shape[:-1] + (matrix.shape[0],), dtype=np.float32)
+    scratch = _upcast_buffer(min(GALLERY_CHUNK_ROWS, matrix.shape[0]), matrix.shape[1])
+    for start in range(0, matrix.shape[0], GALLERY_CHUNK_ROWS):
+        block = matrix[start:start + GALLERY_CHUNK_ROWS]
+        upcast = scratch[:block.shape[0]]
+        upcast[...] = block
+        out[..., start:start + block.shape[0]] = queries @ upcast.T
+    if matrix.dtype == np.int8:
+        out *= np.float32(INT8_RANGE / 127.0)
+    return out
+
+
+def _load_float32_rows(niks: List[int]) -> Dict[int, np.ndarray]:
+    """Fetch the stored embeddings of a few NIKs from embeddings.db as float32 matrices"""
+    rows = {}
+    if not niks:
+        return rows
+    try:
+        conn = sqlite3.connect(EMBEDDING_DB_PATH)
+        placeholders = ",".join("?" * len(niks))
+        cursor = conn.execute(f"SELECT nik, embedding FROM embeddings WHERE nik IN ({placeholders})", niks)
+        for nik, blob in cursor:
+            rows.setdefault(int(nik), []).append(_dequantize_embedding(_embedding_from_blob(blob)))
+        conn.close()
+    except Exception as e:
+        logger.error(f"Failed to load float32 embeddings for re-rank: {e}")
+    return {nik: np.vstack(embs) for nik, embs in rows.items()}
+
+
+def _rerank_float32(
+    queries: np.ndarray,
+    identity_idx: np.ndarray,
+    identity_sims: np.ndarray,
+    gallery: "_Gallery",
+    threshold: float
+) -> np.ndarray:
+    """
+    Re-score the best GALLERY_RERANK identities per query (those within
+    GALLERY_RERANK_MARGIN of the threshold or above) using the float32 rows in
+    embeddings.db. identity_sims is (len(identity_idx),) for one query or
+    (F, len(identity_idx)) for stacked queries; returns a re-scored copy.
+    """
+    if GALLERY_RERANK <= 0 or gallery.dtype == np.float32 or identity_idx.size == 0:
+        return identity_sims
+
+    single = np.ndim(identity_sims) == 1
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    identity_sims = np.atleast_2d(identity_sims).copy()
+
+    selected = []
+    for sims in identity_sims:
+        eligible = np.flatnonzero(sims >= threshold - GALLERY_RERANK_MARGIN)
+        if eligible.size > GALLERY_RERANK:
+            eligible = eligible[np.argpartition(-sims[eligible], GALLERY_RERANK - 1)[:GALLERY_RERANK]]
+        selected.append(eligible)
+
+    niks = gallery.niks
+    wanted = np.unique(np.concatenate(selected))
+    rows = _load_float32_rows([int(niks[identity_idx[i]]) for i in wanted])
+    for f, eligible in enumerate(selected):
+        for i in eligible:
+            embs = rows.get(int(niks[identity_idx[i]]))
+            if embs is not None:
+                identity_sims[f, i] = float(np.max(embs @ queries[f]))
+    return identity_sims[0] if single else identity_sims
+
+
+# ====== IN-MEMORY GALLERY ======
+
+def _grow(array: np.ndarray, needed: int) -> np.ndarray:
+    """Return array (or a larger copy of it) with capacity for at least `needed` leading entries"""
+    if needed <= array.shape[0]:
+        return array
+    capacity = max(needed, 2 * array.shape[0], 64)
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+
+class _GalleryBuffers:
+    """
+    Append-only storage shared by successive gallery snapshots.
+
+    Rows, segment starts, segment NIKs and prototypes are only ever appended
+    past the lengths of every published snapshot, and a buffer that must grow
+    is copied rather than resized, so older snapshots keep seeing exactly the
+    data they were published with. Only one writer may append at a time.
+    """
+
+    def __init__(self, base: np.ndarray, niks: np.ndarray, counts: np.ndarray, prototypes: np.ndarray):
+        self.base = base  # Immutable (N0, 512) rows, possibly a read-only mmap
+        self.delta = np.empty((0, EMBEDDING_DIM), dtype=base.dtype)  # Rows appended after base
+        self.offsets = np.cumsum(counts) - counts  # Global first row of each segment
+        self.niks = np.asarray(niks, dtype=np.int64)  # NIK of each segment
+        self.prototypes = np.ascontiguousarray(prototypes, dtype=np.float32)  # Finalized segment prototypes
+
+    def append_rows(self, start: int, rows: np.ndarray):
+        """Write rows at delta position start (past every published snapshot)"""
+        self.delta = _grow(self.delta, start + rows.shape[0])
+        self.delta[start:start + rows.shape[0]] = rows
+
+    def append_segment(self, index: int, first_row: int, nik: int):
+        self.offsets = _grow(self.offsets, index + 1)
+        self.niks = _grow(self.niks, index + 1)
+        self.offsets[index] = first_row
+        self.niks[index] = nik
+
+    def set_prototype(self, index: int, prototype: np.ndarray):
+        self.prototypes = _grow(self.prototypes, index + 1)
+        self.prototypes[index] = prototype
+
+
+class _Gallery:
+    """
+    Immutable snapshot of the in-memory gallery.
+
+    Rows are grouped in segments, one per NIK, so per-identity max similarity
+    is a np.maximum.reduceat over `offsets`. Deleted or re-keyed NIKs leave
+    dead segments behind (scored as -inf) until the next compaction; the last
+    segment may still grow, so its prototype is kept on the snapshot itself.
+    Readers take `_gallery` once and use that object for the whole request.
+    """
+
+    def __init__(
+        self,
+        buffers: _GalleryBuffers,
+        num_rows: int,
+        num_segments: int,
+        alive: np.ndarray,
+        segment_of: Dict[int, int],
+        tail_sum: Optional[np.ndarray],
+        dead_rows: int,
+        version: int
+    ):
+        self.buffers = buffers
+        self.base = buffers.base
+        self.delta = buffers.delta[:num_rows - buffers.base.shape[0]]
+        self.num_rows = num_rows
+        self.offsets = buffers.offsets[:num_segments]
+        self.niks = buffers.niks[:num_segments]
+        self.alive = alive  # (num_segments,) bool
+        self.segment_of = segment_of  # {nik: live segment}
+        self.tail_sum = tail_sum  # float64 sum of the last segment's rows
+        self.dead_rows = dead_rows
+        self.version = version
+        # Prototypes of all but the last segment live in the shared buffer
+        self._prototypes = buffers.prototypes[:max(num_segments - 1, 0)]
+        self._tail_prototype = _normalize_embedding(tail_sum).astype(np.float32) if tail_sum is not None else None
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.base.dtype
+
+    @property
+    def num_identities(self) -> int:
+        return len(self.segment_of)
+
+    def segment_end(self, segment: int) -> int:
+        return int(self.offsets[segment + 1]) if segment + 1 < self.offsets.size else self.num_rows
+
+    def dot(self, queries: np.ndarray) -> np.ndarray:
+        """Similarity of queries (D,) or (Q, D) with every stored row"""
+        if self.delta.shape[0] == 0:
+            return _gallery_dot(queries, self.base)
+        if self.base.shape[0] == 0:
+            return _gallery_dot(queries, self.delta)
+        return np.concatenate([_gallery_dot(queries, self.base), _gallery_dot(queries, self.delta)], axis=-1)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Stored rows at sorted global row indices"""
+        split = np.searchsorted(rows, self.base.shape[0])
+        if split == rows.size:
+            return self.base[rows]
+        delta_rows = self.delta[rows[split:] - self.base.shape[0]]
+        if split == 0:
+            return delta_rows
+        return np.concatenate([self.base[rows[:split]], delta_rows])
+
+    def mask_dead(self, segment_sims: np.ndarray) -> np.ndarray:
+        """Set dead segments to -inf (in place) so they can never match or vote"""
+        if not self.alive.all():
+            segment_sims[..., ~self.alive] = -np.inf
+        return segment_sims
+
+    def embeddings_for(self, nik: int) -> np.ndarray:
+        """Stored rows of a NIK (empty if not enrolled)"""
+        segment = self.segment_of.get(nik)
+        if segment is None:
+            return np.empty((0, EMBEDDING_DIM), dtype=self.dtype)
+        return self.take(np.arange(self.offsets[segment], self.segment_end(segment)))
+
+    def prototype_sims(self, query: np.ndarray) -> np.ndarray:
+        """Similarity of one query with every segment prototype (dead segments -inf)"""
+        sims = np.empty(self.offsets.size, dtype=np.float32)
+        if self.offsets.size:
+            sims[:-1] = self._prototypes @ query
+            sims[-1] = self._tail_prototype @ query
+        return self.mask_dead(sims)
+
+    def prototypes(self) -> np.ndarray:
+        """(num_segments, 512) prototype table (copy)"""
+        if self.offsets.size == 0:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return np.vstack([self._prototypes, self._tail_prototype[None]])
+
+
+def _segment_sums(matrix: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Per-segment float64 sums of consecutive row groups, in one chunked pass"""
+    sums = np.zeros((counts.size, EMBEDDING_DIM), dtype=np.float64)
+    segment = np.repeat(np.arange(counts.size), counts)
+    for start in range(0, matrix.shape[0], GALLERY_CHUNK_ROWS):
+        block = _dequantize_embedding(matrix[start:start + GALLERY_CHUNK_ROWS])
+        block_ids = segment[start:start + block.shape[0]]
+        starts = np.flatnonzero(np.r_[True, block_ids[1:] != block_ids[:-1]])
+        sums[block_ids[starts]] += np.add.reduceat(block, starts, axis=0)
+    return sums
+
+
+def _empty_gallery() -> _Gallery:
+    dtype = _resolve_dtype(GALLERY_DTYPE)
+    buffers = _GalleryBuffers(
+        np.empty((0, EMBEDDING_DIM), dtype=dtype),
+        np.empty(0, dtype=np.int64),
+        np.empty(0, dtype=np.int64),
+        np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    )
+    return _Gallery(buffers, 0, 0, np.empty(0, dtype=bool), {}, None, 0, 0)
+
+
+# Published gallery snapshot; replaced atomically, never mutated
+_gallery = _empty_gallery()
+_gallery_write_lock = threading.Lock()  # Serializes writers; readers never lock
+
+
+def _get_gallery() -> _Gallery:
+    """Current gallery snapshot (lock-free)"""
+    return _gallery
+
+
+def _publish_gallery(gallery: _Gallery):
+    """Atomically make gallery the snapshot seen by new readers"""
+    global _gallery
+    _gallery = gallery
+
+
+def _replace_gallery(matrix: np.ndarray, niks: np.ndarray, counts: np.ndarray):
+    """
+    Publish a freshly built gallery from rows grouped per NIK.
+    matrix is used as-is (it may be a read-only mmap) and must already be in GALLERY_DTYPE.
+    """
+    niks = np.asarray(niks, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    sums = _segment_sums(matrix, counts)
+    prototypes = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+    with _gallery_write_lock:
+        buffers = _GalleryBuffers(matrix, niks, counts, prototypes[:-1] if niks.size else prototypes)
+        _publish_gallery(_Gallery(
+            buffers,
+            num_rows=matrix.shape[0],
+            num_segments=niks.size,
+            alive=np.ones(niks.size, dtype=bool),
+            segment_of={int(nik): i for i, nik in enumerate(niks)},
+            tail_sum=sums[-1] if niks.size else None,
+            dead_rows=0,
+            version=_gallery.version + 1
+        ))
+
+
+def _compact_gallery_locked(g: _Gallery) -> _Gallery:
+    """Copy only live segments into a fresh private gallery (caller holds the write lock)"""
+    live = np.flatnonzero(g.alive)
+    counts = np.array([g.segment_end(s) - g.offsets[s] for s in live], dtype=np.int64)
+    rows = np.concatenate([np.arange(g.offsets[s], g.segment_end(s)) for s in live]) if live.size else \
+        np.empty(0, dtype=np.int64)
+    matrix = np.ascontiguousarray(g.take(rows)) if rows.size else np.empty((0, EMBEDDING_DIM), dtype=g.dtype)
+    niks = g.niks[live].copy()
+
+    sums = _segment_sums(matrix, counts)
+    prototypes = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    buffers = _GalleryBuffers(matrix, niks, counts, prototypes[:-1] if niks.size else prototypes)
+    logger.info(f"Gallery compacted: dropped {g.dead_rows} dead rows, {matrix.shape[0]} rows remain")
+    return _Gallery(buffers, matrix.shape[0], niks.size, np.ones(niks.size, dtype=bool),
+                    {int(nik): i for i, nik in enumerate(niks)}, sums[-1] if niks.size else None, 0, g.version + 1)
+
+
+def _append_segment_locked(
+    g: _Gallery,
+    nik: int,
+    rows: np.ndarray,
+    alive: np.ndarray,
+    segment_of: Dict[int, int],
+    dead_rows: int
+) -> _Gallery:
+    """Append rows as a new last segment for nik (caller holds the write lock)"""
+    buffers = g.buffers
+    index = g.offsets.size
+    if index:
+        # The old last segment is final now; move its prototype into the shared buffer
+        buffers.set_prototype(index - 1, g._tail_prototype)
+    buffers.append_rows(g.num_rows - buffers.base.shape[0], rows)
+    buffers.append_segment(index, g.num_rows, nik)
+
+    segment_of = dict(segment_of)
+    segment_of[nik] = index
+    return _Gallery(
+        buffers,
+        num_rows=g.num_rows + rows.shape[0],
+        num_segments=index + 1,
+        alive=np.append(alive, True),
+        segment_of=segment_of,
+        tail_sum=np.sum(_dequantize_embedding(rows), axis=0, dtype=np.float64),
+        dead_rows=dead_rows,
+        version=g.version + 1
+    )
+
+
+def _finish_write_locked(g: _Gallery):
+    """Compact if dead rows dominate, then publish (caller holds the write lock)"""
+    if g.dead_rows > max(GALLERY_COMPACT_MIN_ROWS, GALLERY_COMPACT_RATIO * g.num_rows):
+        g = _compact_gallery_locked(g)
+    _publish_gallery(g)
+
+
+def _gallery_add(nik: int, embeddings: np.ndarray):
+    """Add stored embeddings for nik and publish a new snapshot"""
+    rows = _quantize_embedding(np.atleast_2d(embeddings))
+    with _gallery_write_lock:
+        g = _gallery
+        segment = g.segment_of.get(nik)
+        last = g.offsets.size - 1
+
+        if segment is not None and segment == last:
+            # Grow the last segment in place: rows land past every published snapshot
+            g.buffers.append_rows(g.num_rows - g.buffers.base.shape[0], rows)
+            tail_sum = g.tail_sum + np.sum(_dequantize_embedding(rows), axis=0, dtype=np.float64)
+            _publish_gallery(_Gallery(g.buffers, g.num_rows + rows.shape[0], g.offsets.size, g.alive,
+                                      g.segment_of, tail_sum, g.dead_rows, g.version + 1))
+            return
+
+        alive = g.alive
+        dead_rows = g.dead_rows
+        if segment is not None:
+            # Move the NIK to a new last segment so its rows stay contiguous
+            rows = np.concatenate([g.embeddings_for(nik), rows])
+            alive = alive.copy()
+            alive[segment] = False
+            dead_rows += g.segment_end(segment) - int(g.offsets[segment])
+
+        _finish_write_locked(_append_segment_locked(g, nik, rows, alive, g.segment_of, dead_rows))
+
+
+def _gallery_delete(nik: int):
+    """Drop nik from the gallery and publish a new snapshot"""
+    with _gallery_write_lock:
+        g = _gallery
+        segment = g.segment_of.get(nik)
+        if segment is None:
+            return
+        alive = g.alive.copy()
+        alive[segment] = False
+        segment_of = dict(g.segment_of)
+        del segment_of[nik]
+        dead_rows = g.dead_rows + g.segment_end(segment) - int(g.offsets[segment])
+        _finish_write_locked(_Gallery(g.buffers, g.num_rows, g.offsets.size, alive, segment_of,
+                                      g.tail_sum, dead_rows, g.version + 1))
+
+
+def _gallery_rekey(old_nik: int, new_nik: int):
+    """Move old_nik's embeddings to new_nik and publish a new snapshot"""
+    with _gallery_write_lock:
+        g = _gallery
+        if old_nik not in g.segment_of or old_nik == new_nik:
+            return
+        rows = np.concatenate([g.embeddings_for(new_nik), g.embeddings_for(old_nik)])
+        alive = g.alive.copy()
+        segment_of = dict(g.segment_of)
+        dead_rows = g.dead_rows
+        for nik in (old_nik, new_nik):
+            segment = segment_of.pop(nik, None)
+            if segment is not None:
+                alive[segment] = False
+                dead_rows += g.segment_end(segment) - int(g.offsets[segment])
+        _finish_write_locked(_append_segment_locked(g, new_nik, rows, alive, segment_of, dead_rows))
+
+
+# ====== GALLERY SNAPSHOT ======
+
+def _db_fingerprint() -> Optional[Dict[str, int]]:
+    """Size and mtime of embeddings.db; any committed write changes at least one"""
+    try:
+        st = os.stat(EMBEDDING_DB_PATH)
+        return {'db_size': st.st_size, 'db_mtime_ns': st.st_mtime_ns}
+    except OSError:
+        return None
+
+
+def _write_gallery_snapshot(matrix: np.ndarray, niks: np.ndarray, counts: np.ndarray, fingerprint: Dict[str, int]):
+    """
+    Write the gallery matrix to EMBEDDING_NPY_PATH and its labels/metadata to
+    LABELS_PATH. Each file is written to a temp path and atomically replaced;
+    the labels record the .npy size/mtime so a half-updated pair is rejected.
+    """
+    npy_tmp = f"{EMBEDDING_NPY_PATH}.{os.getpid()}.tmp"
+    with open(npy_tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(matrix))
+    os.replace(npy_tmp, EMBEDDING_NPY_PATH)
+
+    st = os.stat(EMBEDDING_NPY_PATH)
+    meta = dict(fingerprint)
+    meta.update({
+        'format': GALLERY_SNAPSHOT_FORMAT,
+        'dtype': matrix.dtype.name,
+        'rows': int(matrix.shape[0]),
+        'npy_size': st.st_size,
+        'npy_mtime_ns': st.st_mtime_ns,
+        'niks': [int(n) for n in niks],
+        'counts': [int(c) for c in counts]
+    })
+
+    labels_tmp = f"{LABELS_PATH}.{os.getpid()}.tmp"
+    with open(labels_tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(labels_tmp, LABELS_PATH)
+    logger.info(f"Gallery snapshot written: {matrix.shape[0]} rows, {len(niks)} NIKs")
+
+
+def _open_gallery_snapshot(fingerprint: Optional[Dict[str, int]]) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Open the snapshot read-only with np.load(mmap_mode='r') if it matches the
+    current embeddings.db and GALLERY_DTYPE. Returns (matrix, niks, counts) or None.
+    """
+    if fingerprint is None or not (os.path.exists(EMBEDDING_NPY_PATH) and os.path.exists(LABELS_PATH)):
+        return None
+    try:
+        with open(LABELS_PATH) as f:
+            meta = json.load(f)
+        st = os.stat(EMBEDDING_NPY_PATH)
+        if (meta.get('format') != GALLERY_SNAPSHOT_FORMAT or
+                meta.get('dtype') != _resolve_dtype(GALLERY_DTYPE).name or
+                meta.get('db_size') != fingerprint['db_size'] or
+                meta.get('db_mtime_ns') != fingerprint['db_mtime_ns'] or
+                meta.get('npy_size') != st.st_size or
+                meta.get('npy_mtime_ns') != st.st_mtime_ns):
+            return None
+
+        matrix = np.load(EMBEDDING_NPY_PATH, mmap_mode='r')
+        niks = np.asarray(meta['niks'], dtype=np.int64)
+        counts = np.asarray(meta['counts'], dtype=np.int64)
+        if matrix.shape != (meta['rows'], EMBEDDING_DIM) or int(counts.sum()) != matrix.shape[0]:
+            return None
+        return matrix, niks, counts
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable gallery snapshot: {e}")
+        return None
+
+
+def _score_identities(query_embeddings: np.ndarray, gallery: _Gallery) -> np.ndarray:
+    """
+    Score queries against every identity in one matrix product.
+    query_embeddings is (D,) or (Q, D); returns per-identity max similarity
+    with shape (num_segments,) or (Q, num_segments), -inf for dead segments.
+    """
+    sims = gallery.dot(query_embeddings)
+    return gallery.mask_dead(np.maximum.reduceat(sims, gallery.offsets, axis=-1))
+
+
+def _top_k_identities(
+    identity_sims: np.ndarray,
+    niks: np.ndarray,
+    threshold: float,
+    top_k: int
+) -> List[Tuple[int, float]]:
+    """Select up to top_k identities at or above threshold, highest similarity first"""
+    candidates = np.flatnonzero(identity_sims >= threshold)
+    if candidates.size == 0 or top_k <= 0:
+        return []
+
+    if candidates.size > top_k:
+        values = identity_sims[candidates]
+        kth_value = values[np.argpartition(-values, top_k - 1)[top_k - 1]]
+        # Keep everything above the k-th value, then fill ties in gallery order
+        above = candidates[values > kth_value]
+        ties = candidates[values == kth_value][:top_k - above.size]
+        candidates = np.sort(np.concatenate([above, ties]))
+
+    # Stable order on ties (gallery order), same as sorting the legacy match list
+    order = np.argsort(-identity_sims[candidates], kind='stable')
+    return [(int(niks[i]), float(identity_sims[i])) for i in candidates[order]]
+
+
+# ====== APPROXIMATE SEARCH (IVF) ======
+
+def _default_nlist(num_rows: int) -> int:
+    """Heuristic number of coarse clusters for a gallery of num_rows embeddings"""
+    if ANN_NLIST > 0:
+        return ANN_NLIST
+    return int(max(1, min(num_rows, round(4 * np.sqrt(num_rows)))))
+
+
+def _train_ivf_centroids(
+    data: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    sample_size: int = 50000,
+    seed: int = 0
+) -> np.ndarray:
+    """Spherical k-means on (a sample of) unit-norm gallery rows"""
+    rng = np.random.default_rng(seed)
+    if data.shape[0] > sample_size:
+        data = data[rng.choice(data.shape[0], sample_size, replace=False)]
+    data = _dequantize_embedding(data)
+
+    nlist = min(nlist, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        present = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(data[order], np.cumsum(counts)[present] - counts[present])
+
+        # Re-seed empty clusters with random points so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = data[rng.choice(data.shape[0], empty.size, replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    return centroids
+
+
+def build_ann_index(
+    nlist: Optional[int] = None,
+    iterations: int = 10,
+    save: bool = True,
+    sample_size: int = 50000
+) -> Dict[str, Any]:
+    """
+    Train IVF coarse centroids on the current gallery and persist them next to embeddings.db.
+    Returns a summary dict.
+    """
+    global _ann_centroids, _ann_lists, _ann_trained_rows
+
+    if not _embeddings_loaded:
+        load_all_embeddings()
+
+    gallery = _get_gallery()
+    if gallery.num_rows == 0:
+        return {'ok': False, 'msg': 'Gallery is empty'}
+
+    if nlist is None:
+        nlist = _default_nlist(gallery.num_rows)
+
+    # Sample rows up front so a large (possibly mmapped) gallery is never copied whole
+    rng = np.random.default_rng(0)
+    rows = np.arange(gallery.num_rows)
+    if rows.size > sample_size:
+        rows = np.sort(rng.choice(rows.size, sample_size, replace=False))
+    centroids = _train_ivf_centroids(gallery.take(rows), nlist, iterations=iterations, sample_size=sample_size)
+
+    with _ann_lock:
+        _ann_centroids = centroids
+        _ann_lists = None
+        _ann_trained_rows = gallery.num_rows
+
+    if save:
+        try:
+            np.savez(
+                ANN_INDEX_PATH,
+                format=np.int64(ANN_INDEX_FORMAT),
+                centroids=centroids,
+                trained_rows=np.int64(gallery.num_rows)
+            )
+        except Exception as e:
+            logger.error(f"Failed to save ANN index: {e}")
+
+    logger.info(f"ANN index built: nlist={centroids.shape[0]}, rows={gallery.num_rows}")
+    return {'ok': True, 'nlist': int(centroids.shape[0]), 'rows': int(gallery.num_rows)}
+
+
+def _load_ann_centroids() -> Optional[Tuple[np.ndarray, int]]:
+    """Load persisted (IVF centroids, rows they were trained on) if present and compatible"""
+    if not os.path.exists(ANN_INDEX_PATH):
+        return None
+    try:
+        with np.load(ANN_INDEX_PATH) as data:
+            if int(data['format']) != ANN_INDEX_FORMAT:
+                return None
+            centroids = np.ascontiguousarray(data['centroids'], dtype=np.float32)
+            trained_rows = int(data['trained_rows']) if 'trained_rows' in data else 0
+        if centroids.ndim != 2 or centroids.shape[1] != EMBEDDING_DIM:
+            return None
+        return centroids, trained_rows
+    except Exception as e:
+        logger.warning(f"Failed to load ANN index: {e}")
+        return None
+
+
+def _train_ann_background():
+    global _ann_training
+    try:
+        build_ann_index()
+    except Exception as e:
+        logger.error(f"ANN index training failed: {e}")
+    finally:
+        with _ann_lock:
+            _ann_training = None
+
+
+def _start_ann_training():
+    """Train the centroids in a background thread (caller holds _ann_lock)"""
+    global _ann_training
+    _ann_training = threading.Thread(target=_train_ann_background, name='ann-train', daemon=True)
+    _ann_training.start()
+
+
+def _ann_grown(num_rows: Optional[int]) -> bool:
+    """Whether the gallery outgrew the rows the centroids (and their nlist) were trained on"""
+    return (ANN_RETRAIN_GROWTH > 0 and num_rows is not None and _ann_trained_rows > 0
+            and num_rows >= ANN_RETRAIN_GROWTH * _ann_trained_rows)
+
+
+def _ann_ready_centroids(wait: bool = False, num_rows: Optional[int] = None) -> Optional[np.ndarray]:
+    """
+    IVF centroids, loaded from ANN_INDEX_PATH or else trained once in a
+    background thread (concurrent callers never train twice). Returns None
+    while they are being trained, unless wait. Once a gallery of num_rows has
+    grown past ANN_RETRAIN_GROWTH, they are retrained in the background while
+    the current ones keep serving.
+    """
+    global _ann_centroids, _ann_trained_rows
+
+    centroids = _ann_centroids
+    if centroids is not None and not _ann_grown(num_rows):
+        return centroids
+
+    with _ann_lock:
+        if _ann_training is None:
+            if _ann_centroids is None:
+                loaded = _load_ann_centroids()
+                if loaded is not None:
+                    _ann_centroids, _ann_trained_rows = loaded
+                else:
+                    logger.info("No saved ANN index: training it in the background (exact search meanwhile)")
+                    _start_ann_training()
+            if _ann_centroids is not None and _ann_grown(num_rows):
+                logger.info(f"Gallery grew to {num_rows} rows from {_ann_trained_rows}: "
+                            f"retraining the ANN index in the background")
+                _start_ann_training()
+        centroids, training = _ann_centroids, _ann_training
+
+    if centroids is None and wait and training is not None:
+        training.join()
+        centroids = _ann_centroids
+    return centroids
+
+
+def _get_ann_lists(gallery: _Gallery) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Get (centroids, list_offsets, row_order) for a gallery snapshot, waiting
+    for the centroids if they are still being trained. Rows are append-only
+    within one set of gallery buffers, so only rows added since the last call
+    are assigned to lists (one matmul, no re-training).
+    """
+    global _ann_lists, _ann_assign
+
+    if _ann_ready_centroids(wait=True, num_rows=gallery.num_rows) is None:
+        raise RuntimeError("ANN index could not be trained")
+
+    with _ann_lock:
+        centroids = _ann_centroids
+        if _ann_lists is None or _ann_lists[0] is not centroids or _ann_lists[1] != gallery.version:
+            if _ann_assign is None or _ann_assign[0] is not centroids or _ann_assign[1] is not gallery.buffers:
+                _ann_assign = (centroids, gallery.buffers, np.empty(0, dtype=np.int64))
+            assign = _ann_assign[2]
+            if assign.size < gallery.num_rows:
+                new_rows = np.arange(assign.size, gallery.num_rows)
+                assign = np.concatenate([assign] + [
+                    np.argmax(_gallery_dot(centroids, gallery.take(new_rows[start:start + GALLERY_CHUNK_ROWS])), axis=0)
+                    for start in range(0, new_rows.size, GALLERY_CHUNK_ROWS)
+                ])
+                _ann_assign = (centroids, gallery.buffers, assign)
+            assign = assign[:gallery.num_rows]
+            row_order = np.argsort(assign, kind='stable')
+            list_offsets = np.searchsorted(assign[row_order], np.arange(centroids.shape[0] + 1))
+            _ann_lists = (centroids, gallery.version, list_offsets, row_order)
+        _, _, list_offsets, row_order = _ann_lists
+
+    return centroids, list_offsets, row_order
+
+
+def _ann_score_identities(
+    query_embedding: np.ndarray,
+    gallery: _Gallery,
+    nprobe: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate per-identity max similarity using only the nprobe closest IVF lists.
+    Returns (identity_indices, identity_sims) for identities with at least one probed row.
+    """
+    if nprobe is None:
+        nprobe = ANN_NPROBE
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    centroids, list_offsets, row_order = _get_ann_lists(gallery)
+
+    nprobe = max(1, min(nprobe, centroids.shape[0]))
+    centroid_sims = centroids @ query
+    probe = np.argpartition(-centroid_sims, nprobe - 1)[:nprobe]
+
+    rows = np.concatenate([row_order[list_offsets[p]:list_offsets[p + 1]] for p in probe])
+    if rows.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rows.sort()
+
+    sims = _gallery_dot(query, gallery.take(rows))
+    identity = np.searchsorted(gallery.offsets, rows, side='right') - 1
+    starts = np.flatnonzero(np.r_[True, identity[1:] != identity[:-1]])
+    identity = identity[starts]
+    live = gallery.alive[identity]
+    return identity[live], np.maximum.reduceat(sims, starts)[live]
+
+
+def _use_ann(gallery: _Gallery) -> bool:
+    """IVF search for this gallery; exact search until the centroids are ready"""
+    return (ANN_ENABLED and gallery.num_rows >= ANN_MIN_GALLERY
+            and _ann_ready_centroids(num_rows=gallery.num_rows) is not None)
+
+
+# ====== TWO-STAGE PROTOTYPE SEARCH ======
+
+def _use_prototypes(gallery: _Gallery) -> bool:
+    return PROTOTYPE_SEARCH and gallery.num_identities >= PROTOTYPE_MIN_IDENTITIES
+
+
+def _prototype_score_identities(
+    query_embedding: np.ndarray,
+    gallery: _Gallery,
+    num_candidates: Optional[int] = None,
+    margin: Optional[float] = None
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Coarse pass over per-identity prototypes, then exact per-embedding max
+    similarity for the top candidates only.
+    Returns (identity_indices, identity_sims), or None when prototype scores
+    are ambiguous and the caller should fall back to exhaustive search.
+    """
+    if num_candidates is None:
+        num_candidates = PROTOTYPE_CANDIDATES
+    if margin is None:
+        margin = PROTOTYPE_MARGIN
+
+    if num_candidates >= gallery.num_identities:
+        return None
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    proto_sims = gallery.prototype_sims(query)
+
+    # Top candidates plus the best excluded identity, to judge the gap
+    # (dead segments are -inf, so with more live identities than candidates both are live)
+    part = np.argpartition(-proto_sims, num_candidates)
+    candidates = part[:num_candidates]
+    best_excluded = proto_sims[part[num_candidates]]
+    if proto_sims[candidates].max() - best_excluded < margin:
+        return None
+
+    candidates = np.sort(candidates)
+    offsets = gallery.offsets
+    ends = np.append(offsets[1:], gallery.num_rows)
+    counts = ends[candidates] - offsets[candidates]
+    local_starts = np.cumsum(counts) - counts
+    rows = np.repeat(offsets[candidates] - local_starts, counts) + np.arange(counts.sum())
+
+    sims = _gallery_dot(query, gallery.take(rows))
+    return candidates, np.maximum.reduceat(sims, local_starts)
+
+
+# ====== SHARDED SEARCH ======
+
+# Environment for shard worker processes: spawned children re-import this
+# module, so they must not initialize the engine or start their own BLAS pools
+_SHARD_CHILD_ENV = {'FACE_ENGINE_INIT': '0', 'OMP_NUM_THREADS': '1', 'OPENBLAS_NUM_THREADS': '1', 'MKL_NUM_THREADS': '1'}
+
+
+_child_environment_lock = threading.Lock()
+
+
+@contextmanager
+def _child_environment(env: Dict[str, str]):
+    """
+    Temporarily set env vars so worker processes started inside inherit them.
+    Spawned children read them while re-importing this module, before any
+    Process argument reaches them, so they have to be in os.environ when the
+    process starts. Pools start lazily from request threads: the lock keeps
+    two pool starts from applying or restoring each other's variables.
+    """
+    with _child_environment_lock:
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            yield
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def _shard_of(niks: np.ndarray, num_shards: int) -> np.ndarray:
+    """Shard of each NIK (multiplicative hash, so sequential NIKs spread evenly)"""
+    mixed = np.asarray(niks).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return ((mixed >> np.uint64(32)) % np.uint64(num_shards)).astype(np.int64)
+
+
+def _shard_search(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    offsets: np.ndarray,
+    segments: np.ndarray,
+    cutoff: float,
+    limit: Optional[int]
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Per query, the (segments, sims) of shard identities at or above cutoff (best `limit` only)"""
+    if matrix.shape[0] == 0:
+        return [(segments[:0], np.empty(0, dtype=np.float32)) for _ in range(queries.shape[0])]
+
+    sims = np.maximum.reduceat(_gallery_dot(queries, matrix), offsets, axis=-1)
+    results = []
+    for row in sims:
+        hits = np.flatnonzero(row >= cutoff)
+        if limit is not None and hits.size > limit:
+            hits = np.sort(hits[np.argpartition(-row[hits], limit - 1)[:limit]])
+        results.append((segments[hits], row[hits]))
+    return results
+
+
+def _shard_worker(conn):
+    """Worker process loop: exhaustive search over one shard held in shared memory"""
+    from multiprocessing import shared_memory
+
+    shm = None
+    matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    offsets = segments = np.empty(0, dtype=np.int64)
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        cmd = msg[0]
+        if cmd == 'load':
+            _, name, num_rows, dtype, offsets, segments = msg
+            old = shm
+            shm = shared_memory.SharedMemory(name=name) if name else None
+            if shm is not None:
+                matrix = np.ndarray((num_rows, EMBEDDING_DIM), dtype=np.dtype(dtype), buffer=shm.buf)
+            else:
+                matrix = np.empty((0, EMBEDDING_DIM), dtype=np.dtype(dtype))
+            if old is not None:
+                old.close()
+            conn.send('ok')
+        elif cmd == 'search':
+            _, queries, cutoff, limit = msg
+            conn.send(_shard_search(queries, matrix, offsets, segments, cutoff, limit))
+        else:
+            break
+
+    matrix = None
+    if shm is not None:
+        shm.close()
+
+
+class _ShardPool:
+    """
+    Worker processes that each hold one NIK-hash shard of a gallery snapshot in
+    shared memory. Queries are sent to every shard and the per-shard hits are
+    merged (scatter-gather). One search runs at a time; each uses every worker.
+    A pipe error or a reply timeout leaves the pool broken: callers discard it
+    (_discard_shard_pool) and the next request spawns a fresh one.
+    """
+
+    def __init__(self, num_workers: int):
+        import multiprocessing
+
+        ctx = multiprocessing.get_context(SHARD_START_METHOD)
+        self.lock = threading.Lock()
+        self.version = None  # Gallery version the shards were loaded from
+        self._conns = []
+        self._procs = []
+        self._shms = []
+
+        with _child_environment(_SHARD_CHILD_ENV):
+            for i in range(num_workers):
+                parent_conn, child_conn = ctx.Pipe()
+                proc = ctx.Process(target=_shard_worker, args=(child_conn,), name=f"gallery-shard-{i}", daemon=True)
+                proc.start()
+                child_conn.close()
+                self._conns.append(parent_conn)
+                self._procs.append(proc)
+
+    @property
+    def num_workers(self) -> int:
+        return len(self._conns)
+
+    def load(self, gallery: _Gallery):
+        """Copy the live segments of a gallery snapshot into per-shard shared memory"""
+        from multiprocessing import shared_memory
+
+        live = np.flatnonzero(gallery.alive)
+        shard = _shard_of(gallery.niks[live], self.num_workers)
+        ends = np.append(gallery.offsets[1:], gallery.num_rows)
+
+        shms = []
+        messages = []
+        for s in range(self.num_workers):
+            segments = live[shard == s]
+            counts = ends[segments] - gallery.offsets[segments]
+            local_offsets = np.cumsum(counts) - counts
+            rows = np.repeat(gallery.offsets[segments] - local_offsets, counts) + np.arange(counts.sum())
+
+            name = None
+            if rows.size:
+                shm = shared_memory.SharedMemory(create=True, size=rows.size * EMBEDDING_DIM * gallery.dtype.itemsize)
+                view = np.ndarray((rows.size, EMBEDDING_DIM), dtype=gallery.dtype, buffer=shm.buf)
+                for start in range(0, rows.size, GALLERY_CHUNK_ROWS):
+                    view[start:start + GALLERY_CHUNK_ROWS] = gallery.take(rows[start:start + GALLERY_CHUNK_ROWS])
+                del view
+                shms.append(shm)
+                name = shm.name
+            messages.append(('load', name, int(rows.size), gallery.dtype.str, local_offsets, segments))
+
+        with self.lock:
+            try:
+                for conn, msg in zip(self._conns, messages):
+                    conn.send(msg)
+                self._recv_all()
+            except Exception:
+                for shm in shms:
+                    shm.close()
+                    shm.unlink()
+                raise
+            old, self._shms = self._shms, shms
+            self.version = gallery.version
+
+        for shm in old:
+            shm.close()
+            shm.unlink()
+
+    def search(
+        self,
+        queries: np.ndarray,
+        version: int,
+        cutoff: float,
+        limit: Optional[int] = None
+    ) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+        """Merged per-query (segments, sims) hits, or None if the shards hold another gallery version"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        with self.lock:
+            if self.version != version:
+                return None
+            for conn in self._conns:
+                conn.send(('search', queries, cutoff, limit))
+            per_shard = self._recv_all()
+
+        merged = []
+        for q in range(queries.shape[0]):
+            segments = np.concatenate([hits[q][0] for hits in per_shard])
+            sims = np.concatenate([hits[q][1] for hits in per_shard])
+            merged.append((segments, sims))
+        return merged
+
+    def _recv_all(self) -> list:
+        """One reply per worker (caller holds self.lock); TimeoutError if a worker stops replying"""
+        replies = []
+        for i, conn in enumerate(self._conns):
+            if not conn.poll(SHARD_TIMEOUT):
+                raise TimeoutError(f"No reply from shard worker {i} in {SHARD_TIMEOUT:.0f}s")
+            replies.append(conn.recv())
+        return replies
+
+    def close(self, timeout: float = 5):
+        with self.lock:
+            for conn in self._conns:
+                try:
+                    conn.send(('stop',))
+                except (OSError, ValueError):
+                    pass
+            for proc in self._procs:
+                proc.join(timeout=timeout)
+                if proc.is_alive():
+                    proc.kill()  # Also ends a stopped/hung worker, which SIGTERM would not
+                    proc.join(timeout=5)
+            for conn in self._conns:
+                conn.close()
+            for shm in self._shms:
+                shm.close()
+                shm.unlink()
+            self._shms = []
+            self.version = None
+
+
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+_shard_loading = False
+
+
+def _use_shards(gallery: _Gallery) -> bool:
+    return SHARD_WORKERS > 1 and gallery.num_rows >= SHARD_MIN_GALLERY
+
+
+def build_shard_pool(num_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Start the shard worker pool (if needed) and load the current gallery into it.
+    Blocks until every shard is loaded. Returns a summary dict.
+    """
+    global _shard_pool
+
+    if num_workers is None:
+        num_workers = SHARD_WORKERS
+    if not _embeddings_loaded:
+        load_all_embeddings()
+
+    with _shard_pool_lock:
+        pool = _shard_pool
+        if pool is not None and pool.num_workers != num_workers:
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = _ShardPool(num_workers)
+            _shard_pool = pool
+
+    gallery = _get_gallery()
+    t0 = time.perf_counter()
+    try:
+        pool.load(gallery)
+    except Exception:
+        _discard_shard_pool(pool)
+        raise
+    logger.info(f"Gallery shards loaded: workers={num_workers}, rows={gallery.num_rows}, "
+                f"version={gallery.version}, {time.perf_counter() - t0:.2f}s")
+    return {'ok': True, 'workers': num_workers, 'rows': int(gallery.num_rows), 'version': gallery.version}
+
+
+def _load_shards_in_background():
+    global _shard_loading
+    try:
+        build_shard_pool()
+    except Exception as e:
+        logger.error(f"Failed to load gallery shards: {e}")
+    finally:
+        _shard_loading = False
+
+
+def _get_shard_pool(gallery: _Gallery) -> Optional[_ShardPool]:
+    """
+    Shard pool holding this gallery version, or None. A stale or missing pool is
+    (re)loaded in the background; requests use in-process search meanwhile.
+    """
+    global _shard_loading
+
+    with _shard_pool_lock:
+        pool = _shard_pool
+        if pool is not None and pool.version == gallery.version:
+            return pool
+        if _shard_loading:
+            return None
+        _shard_loading = True
+
+    threading.Thread(target=_load_shards_in_background, name="gallery-shard-loader", daemon=True).start()
+    return None
+
+
+def _discard_shard_pool(pool: _ShardPool):
+    """Stop a broken pool (dead or hung worker) so the next request spawns a fresh one"""
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is pool:
+            _shard_pool = None
+    pool.close(timeout=0)
+    logger.warning("Gallery shard pool discarded; it is restarted on the next request")
+
+
+def shutdown_shard_pool():
+    """Stop shard workers and release their shared memory"""
+    global _shard_pool
+    with _shard_pool_lock:
+        pool, _shard_pool = _shard_pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown_shard_pool)
+
+
+def _exhaustive_identity_sims(
+    queries: np.ndarray,
+    gallery: _Gallery,
+    threshold: float,
+    limit: Optional[int] = None
+) -> np.ndarray:
+    """
+    Exact (Q, num_segments) per-identity similarity for stacked queries.
+    With SHARD_WORKERS the gallery is scanned by the shard pool; identities it
+    does not return (below the threshold / re-rank cutoff) are -inf.
+    """
+    queries = np.atleast_2d(queries)
+    if _use_shards(gallery):
+        cutoff = threshold
+        if GALLERY_RERANK > 0 and gallery.dtype != np.float32:
+            cutoff -= GALLERY_RERANK_MARGIN
+        pool = _get_shard_pool(gallery)
+        try:
+            hits = pool.search(queries, gallery.version, cutoff, limit) if pool is not None else None
+        except Exception as e:
+            logger.error(f"Sharded search failed, searching in-process: {e}")
+            _discard_shard_pool(pool)
+            hits = None
+        if hits is not None:
+            rows = np.full((queries.shape[0], gallery.offsets.size), -np.inf, dtype=np.float32)
+            for i, (segments, sims) in enumerate(hits):
+                rows[i, segments] = sims
+            return rows
+
+    return _score_identities(queries, gallery)
+
+
+def _score_frames(embeddings: np.ndarray, gallery: _Gallery, threshold: float) -> np.ndarray:
+    """
+    Dense (F, num_segments) similarity rows for stacked frame embeddings.
+    Uses the IVF index or the prototype pass on large galleries; identities
+    that were not scored (or are dead) get -inf so they can never vote.
+    """
+    num_segments = gallery.offsets.size
+    if _use_ann(gallery):
+        rows = np.full((embeddings.shape[0], num_segments), -np.inf, dtype=np.float32)
+        for i, embedding in enumerate(embeddings):
+            identity_idx, identity_sims = _ann_score_identities(embedding, gallery)
+            rows[i, identity_idx] = identity_sims
+    elif _use_prototypes(gallery):
+        rows = np.full((embeddings.shape[0], num_segments), -np.inf, dtype=np.float32)
+        for i, embedding in enumerate(embeddings):
+            scored = _prototype_score_identities(embedding, gallery)
+            if scored is None:
+                rows[i] = _exhaustive_identity_sims(embedding, gallery, threshold)[0]
+            else:
+                rows[i, scored[0]] = scored[1]
+    else:
+        rows = _exhaustive_identity_sims(embeddings, gallery, threshold)
+
+    return _rerank_float32(embeddings, np.arange(num_segments), rows, gallery, threshold)
+
+
 # ====== EMBEDDING DATABASE ======
 
 def init_embedding_db():
@@ -148,58 +1693,131 @@ def init_embedding_db():
 
 
 def save_embedding(nik: int, embedding: np.ndarray, quality_score: float = 0.0) -> bool:
-    """Save embedding to database"""
+    """Save embedding to database and add it to the in-memory gallery"""
     try:
         conn = sqlite3.connect(EMBEDDING_DB_PATH)
-        normalized = _normalize_embedding(embedding)
-        blob = normalized.astype(np.float32).tobytes()
+        normalized = _normalize_embedding(_dequantize_embedding(embedding))
+        blob = _quantize_embedding(normalized, EMBEDDING_STORE_DTYPE).tobytes()
         conn.execute(
             "INSERT INTO embeddings (nik, embedding, created_at, quality_score) VALUES (?, ?, ?, ?)",
             (nik, blob, datetime.now().isoformat(), quality_score)
         )
         conn.commit()
         conn.close()
+        if _embeddings_loaded:
+            _gallery_add(nik, _embedding_from_blob(blob))
         return True
     except Exception as e:
         logger.error(f"Failed to save embedding: {e}")
         return False
 
 
-def load_all_embeddings() -> Dict[int, List[np.ndarray]]:
-    """Load all embeddings from database into memory"""
-    global _embeddings_db, _embeddings_loaded
+def load_all_embeddings() -> Dict[int, int]:
+    """
+    (Re)load all embeddings from database into a new gallery snapshot.
+    Normal enroll/delete/update calls keep the gallery in sync incrementally;
+    this is for startup and for verify_gallery() repairs.
+    Returns {nik: embedding count}.
+    """
+    global _embeddings_loaded
     try:
         if not os.path.exists(EMBEDDING_DB_PATH):
             init_embedding_db()
             _embeddings_loaded = True
+            _publish_gallery(_empty_gallery())
             return {}
 
+        # Fingerprint before reading, so writes during the load invalidate the snapshot
+        fingerprint = _db_fingerprint()
+        if GALLERY_SNAPSHOT:
+            snapshot = _open_gallery_snapshot(fingerprint)
+            if snapshot is not None:
+                _replace_gallery(*snapshot)
+                _embeddings_loaded = True
+                logger.info(f"Loaded {snapshot[0].shape[0]} embeddings for {snapshot[1].size} unique NIKs "
+                            f"from gallery snapshot")
+                return {int(nik): int(c) for nik, c in zip(snapshot[1], snapshot[2])}
+
         conn = sqlite3.connect(EMBEDDING_DB_PATH)
         cursor = conn.execute("SELECT nik, embedding FROM embeddings ORDER BY quality_score DESC")
 
-        _embeddings_db = {}
+        grouped = {}  # {nik: [rows]}, NIKs in first-seen order
         count = 0
         for row in cursor:
-            nik = int(row[0])
-            emb = np.frombuffer(row[1], dtype=np.float32)
-            if nik not in _embeddings_db:
-                _embeddings_db[nik] = []
-            _embeddings_db[nik].append(emb)
+            grouped.setdefault(int(row[0]), []).append(_embedding_from_blob(row[1]))
             count += 1
-
         conn.close()
+
+        niks = np.fromiter(grouped.keys(), dtype=np.int64, count=len(grouped))
+        counts = np.fromiter((len(rows) for rows in grouped.values()), dtype=np.int64, count=len(grouped))
+        if count:
+            matrix = np.ascontiguousarray(_quantize_embedding(np.vstack(
+                [_dequantize_embedding(r) for rows in grouped.values() for r in rows]
+            )))
+        else:
+            matrix = np.empty((0, EMBEDDING_DIM), dtype=_resolve_dtype(GALLERY_DTYPE))
+        del grouped
+
+        if GALLERY_SNAPSHOT and count and fingerprint is not None:
+            try:
+                _write_gallery_snapshot(matrix, niks, counts, fingerprint)
+                # Re-open through mmap so this worker shares the page cache too
+                snapshot = _open_gallery_snapshot(fingerprint)
+                if snapshot is not None:
+                    matrix = snapshot[0]
+            except Exception as e:
+                logger.warning(f"Failed to write gallery snapshot: {e}")
+
+        _replace_gallery(matrix, niks, counts)
         _embeddings_loaded = True
-        logger.info(f"Loaded {count} embeddings for {len(_embeddings_db)} unique NIKs")
-        return _embeddings_db
+        logger.info(f"Loaded {count} embeddings for {niks.size} unique NIKs")
+        return {int(nik): int(c) for nik, c in zip(niks, counts)}
     except Exception as e:
         logger.error(f"Failed to load embeddings: {e}")
         _embeddings_loaded = True
         return {}
 
 
+def verify_gallery(repair: bool = True) -> Dict[str, Any]:
+    """
+    Consistency check of the in-memory gallery against embeddings.db
+    (per-NIK embedding counts). Reloads the gallery on mismatch if repair is set.
+    """
+    if not _embeddings_loaded:
+        load_all_embeddings()
+        return {'consistent': True, 'reloaded': True, 'missing': 0, 'extra': 0, 'mismatched': 0}
+
+    try:
+        conn = sqlite3.connect(EMBEDDING_DB_PATH)
+        db_counts = {int(nik): int(c) for nik, c in
+                     conn.execute("SELECT nik, COUNT(*) FROM embeddings GROUP BY nik")}
+        conn.close()
+    except Exception as e:
+        logger.error(f"Failed to verify gallery: {e}")
+        return {'consistent': False, 'reloaded': False, 'msg': str(e)}
+
+    g = _get_gallery()
+    mem_counts = {nik: g.segment_end(s) - int(g.offsets[s]) for nik, s in g.segment_of.items()}
+
+    missing = len(db_counts.keys() - mem_counts.keys())
+    extra = len(mem_counts.keys() - db_counts.keys())
+    mismatched = sum(1 for nik, c in mem_counts.items() if nik in db_counts and db_counts[nik] != c)
+    consistent = missing == 0 and extra == 0 and mismatched == 0
+
+    reloaded = False
+    if not consistent:
+        logger.warning(f"Gallery out of sync with embeddings.db: {missing} missing, {extra} extra, "
+                       f"{mismatched} mismatched NIKs")
+        if repair:
+            load_all_embeddings()
+            reloaded = True
+
+    return {'consistent': consistent, 'reloaded': reloaded, 'missing': missing, 'extra': extra,
+            'mismatched': mismatched}
+
+
 def delete_embeddings_for_nik(nik: int) -> int:
     """Delete all embeddings for a given NIK"""
-    global _embeddings_db
     try:
         conn = sqlite3.connect(EMBEDDING_DB_PATH)
         cursor = conn.execute("DELETE FROM embeddings WHERE nik = ?", (nik,))
@@ -207,8 +1825,7 @@ def delete_embeddings_for_nik(nik: int) -> int:
         conn.commit()
         conn.close()
 
-        if nik in _embeddings_db:
-            del _embeddings_db[nik]
+        _gallery_delete(nik)
 
         logger.info(f"Deleted {deleted} embeddings for NIK {nik}")
         return deleted
@@ -219,7 +1836,6 @@ def delete_embeddings_for_nik(nik: int) -> int:
 
 def update_nik_in_embeddings(old_nik: int, new_nik: int) -> int:
     """Update NIK in embeddings database"""
-    global _embeddings_db
     try:
         conn = sqlite3.connect(EMBEDDING_DB_PATH)
         cursor = conn.execute(
@@ -230,8 +1846,7 @@ def update_nik_in_embeddings(old_nik: int, new_nik: int) -> int:
         conn.commit()
         conn.close()
 
-        if old_nik in _embeddings_db:
-            _embeddings_db[new_nik] = _embeddings_db.pop(old_nik)
+        _gallery_rekey(old_nik, new_nik)
 
         logger.info(f"Updated {updated} embeddings from NIK {old_nik} to {new_nik}")
         return updated
@@ -270,15 +1885,153 @@ def get_unique_nik_count() -> int:
         return 0
 
 
+# ====== GALLERY PRUNING ======
+
+def _load_embeddings_by_nik(niks: Optional[List[int]] = None) -> Dict[int, Tuple[List[int], np.ndarray]]:
+    """Stored embeddings per NIK from embeddings.db as {nik: (row ids, float32 matrix)}, best quality first"""
+    grouped = {}
+    conn = sqlite3.connect(EMBEDDING_DB_PATH)
+    try:
+        if niks:
+            placeholders = ",".join("?" * len(niks))
+            cursor = conn.execute(f"SELECT id, nik, embedding FROM embeddings WHERE nik IN ({placeholders}) "
+                                  f"ORDER BY quality_score DESC", list(niks))
+        else:
+            cursor = conn.execute("SELECT id, nik, embedding FROM embeddings ORDER BY quality_score DESC")
+        for row_id, nik, blob in cursor:
+            ids, embs = grouped.setdefault(int(nik), ([], []))
+            ids.append(int(row_id))
+            embs.append(_dequantize_embedding(_embedding_from_blob(blob)))
+    finally:
+        conn.close()
+    return {nik: (ids, np.vstack(embs)) for nik, (ids, embs) in grouped.items()}
+
+
+def _select_representatives(embeddings: np.ndarray, keep: int, duplicate_sim: float) -> np.ndarray:
+    """
+    Farthest-point selection: start from the medoid (highest total similarity
+    to the others), then repeatedly add the embedding least similar to all
+    selected ones. Stops early once everything left is a near-duplicate
+    (>= duplicate_sim) of a selected embedding. Returns sorted row indices.
+    """
+    n = embeddings.shape[0]
+    if n <= 1:
+        return np.arange(n)
+
+    sims = embeddings @ embeddings.T
+    first = int(np.argmax(sims.sum(axis=1)))
+    selected = [first]
+    closest = sims[first].copy()  # Max similarity of each row to the selected set
+    closest[first] = np.inf
+    while len(selected) < min(keep, n):
+        candidate = int(np.argmin(closest))
+        if closest[candidate] >= duplicate_sim:
+            break
+        selected.append(candidate)
+        np.maximum(closest, sims[candidate], out=closest)
+        closest[candidate] = np.inf
+    return np.sort(np.asarray(selected, dtype=np.int64))
+
+
+def prune_gallery(
+    keep: Optional[int] = None,
+    niks: Optional[List[int]] = None,
+    duplicate_sim: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Keep at most `keep` diverse embeddings per NIK (see _select_representatives)
+    and delete the rest from embeddings.db, then reload the gallery once.
+    Returns a summary dict.
+    """
+    if keep is None:
+        keep = PRUNE_KEEP
+    if duplicate_sim is None:
+        duplicate_sim = PRUNE_DUPLICATE_SIM
+    if keep < 1:
+        return {'ok': False, 'msg': 'keep must be at least 1'}
+
+    try:
+        grouped = _load_embeddings_by_nik(niks)
+        doomed = []
+        pruned_niks = 0
+        for nik, (ids, embs) in grouped.items():
+            kept = _select_representatives(embs, keep, duplicate_sim)
+            if kept.size < len(ids):
+                drop = np.setdiff1d(np.arange(len(ids)), kept)
+                doomed.extend(ids[i] for i in drop)
+                pruned_niks += 1
+
+        rows_before = sum(len(ids) for ids, _ in grouped.values())
+        if doomed:
+            conn = sqlite3.connect(EMBEDDING_DB_PATH)
+            for start in range(0, len(doomed), 500):
+                chunk = doomed[start:start + 500]
+                conn.execute(f"DELETE FROM embeddings WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            conn.commit()
+            conn.close()
+
+            # Bulk change: rebuild the gallery (and its mmap snapshot) once
+            if _embeddings_loaded:
+                load_all_embeddings()
+
+        logger.info(f"Gallery pruned: {len(doomed)} of {rows_before} embeddings deleted "
+                    f"from {pruned_niks} NIKs (keep={keep})")
+        return {
+            'ok': True,
+            'niks': len(grouped),
+            'pruned_niks': pruned_niks,
+            'rows_before': rows_before,
+            'rows_after': rows_before - len(doomed),
+            'deleted': len(doomed)
+        }
+    except Exception as e:
+        logger.error(f"Failed to prune gallery: {e}")
+        return {'ok': False, 'msg': str(e)}
+
+
 # ====== FACE DETECTION ======
 
-def detect_faces(img_bgr: np.ndarray, detection_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+def _det_scale(img_shape: Tuple[int, ...], det_size: int) -> float:
+    """Resize factor that makes the longest image side det_size (0 = adaptive from MIN_FACE_SIZE)"""
+    longest = max(img_shape[:2])
+    if det_size <= 0:
+        det_size = longest * DET_MIN_FACE_PIXELS / max(MIN_FACE_SIZE, 1)
+    return det_size / longest
+
+
+def _det_input_size(app, img_bgr: np.ndarray, det_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Detector input (width, height) for a frame, or None to use the size the
+    app was prepared with (detector exported with a fixed input shape).
+    """
+    input_shape = getattr(app.det_model, 'input_shape', None)
+    if input_shape is not None and not isinstance(input_shape[2], str):
+        return None
+    h, w = img_bgr.shape[:2]
+    scale = _det_scale(img_bgr.shape, det_size)
+    return (max(DET_STRIDE, int(np.ceil(w * scale / DET_STRIDE)) * DET_STRIDE),
+            max(DET_STRIDE, int(np.ceil(h * scale / DET_STRIDE)) * DET_STRIDE))
+
+
+def detect_faces(
+    img_bgr: np.ndarray,
+    detection_threshold: Optional[float] = None,
+    compute_embedding: bool = True,
+    det_size: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     Detect faces using InsightFace (with OpenCV Haar Cascade as fallback).
     Only returns the closest (largest) face to ensure single face detection.
+
+    Only the detector runs on the whole frame; the recognition model runs on
+    the selected face alone (skipped when compute_embedding is False, see
+    _analyze_face). det_size is the detector's longest side (defaults to
+    DET_SIZE_FULL, 0 = adaptive).
     """
     if detection_threshold is None:
         detection_threshold = DETECTION_THRESHOLD
+    if det_size is None:
+        det_size = DET_SIZE_FULL
 
     app = _get_face_app()
     if app is None:
@@ -304,38 +2057,115 @@ def detect_faces(img_bgr: np.ndarray, detection_threshold: Optional[float] = Non
         return results[:1] if results else []
 
     try:
-        faces = app.get(img_bgr)
-        results = []
-        for face in faces:
-            if face.det_score < detection_threshold:
+        with _face_app_session() as session_app:
+            bboxes, kpss = session_app.det_model.detect(img_bgr, input_size=_det_input_size(app, img_bgr, det_size),
+                                                        max_num=0, metric='default')
+
+        # Keep the closest (largest) usable face, by box size alone
+        best = None
+        best_area = -1
+        for i in range(bboxes.shape[0]):
+            if bboxes[i, 4] < detection_threshold:
                 continue
 
-            bbox = face.bbox.astype(int).tolist()
+            bbox = bboxes[i, :4].astype(int).tolist()
             w = bbox[2] - bbox[0]
             h = bbox[3] - bbox[1]
 
             if w < MIN_FACE_SIZE or h < MIN_FACE_SIZE:
                 continue
 
-            results.append({
-                'bbox': bbox,
-                'landmarks': face.kps.tolist() if getattr(face, 'kps', None) is not None else None,
-                'det_score': float(face.det_score),
-                'embedding': _normalize_embedding(face.embedding) if getattr(face, 'embedding', None) is not None else None,
-                'age': getattr(face, 'age', None),
-                'gender': getattr(face, 'gender', None)
-            })
+            if w * h > best_area:
+                best, best_area = i, w * h
 
-        # Sort by face size (largest first = closest to camera)
-        results.sort(key=lambda x: (x['bbox'][2]-x['bbox'][0]) * (x['bbox'][3]-x['bbox'][1]), reverse=True)
+        if best is None:
+            return []
 
-        # Only keep the closest (largest) face
-        return results[:1]
+        result = {
+            'bbox': bboxes[best, :4].astype(int).tolist(),
+            'landmarks': kpss[best].tolist() if kpss is not None else None,
+            'det_score': float(bboxes[best, 4]),
+            'embedding': None,
+            'age': None,
+            'gender': None
+        }
+        if compute_embedding:
+            _analyze_face(img_bgr, result)
+        return [result]
 
     except Exception as e:
         logger.error(f"InsightFace detection failed: {e}")
         # Fallback to Haar
-        return _detect_faces_fallback(img_bgr)[:1] if _detect_faces_fallback(img_bgr) else []
+        return _detect_faces_fallback(img_bgr)[:1]
+
+
+def _analyze_face(img_bgr: np.ndarray, face_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the per-face models (recognition, plus gender/age if loaded) on one
+    detected face and fill in its embedding/age/gender.
+    Same per-face step as FaceAnalysis.get (alignment from the 5 landmarks),
+    so embeddings match the ones stored at enrollment.
+    """
+    app = _get_face_app()
+    if app is None or face_dict.get('landmarks') is None or face_dict.get('embedding') is not None:
+        return face_dict
+
+    try:
+        from insightface.app.common import Face
+        face = Face(
+            bbox=np.asarray(face_dict['bbox'], dtype=np.float32),
+            kps=np.asarray(face_dict['landmarks'], dtype=np.float32),
+            det_score=face_dict.get('det_score', 0.0)
+        )
+        with _face_app_session() as session_app:
+            for taskname, model in session_app.models.items():
+                if taskname != 'detection':
+                    model.get(img_bgr, face)
+
+        if getattr(face, 'embedding', None) is not None:
+            face_dict['embedding'] = _normalize_embedding(face.embedding)
+        face_dict['age'] = getattr(face, 'age', None)
+        face_dict['gender'] = getattr(face, 'gender', None)
+    except Exception as e:
+        logger.warning(f"Failed to analyze detected face: {e}")
+    return face_dict
+
+
+# Per-thread Haar state: a CascadeClassifier must not be shared between
+# threads, and check_face is polled several times a second per kiosk
+_haar_local = threading.local()
+
+
+def _haar_cascade() -> cv2.CascadeClassifier:
+    """This thread's Haar cascade, parsed from disk once per thread"""
+    detector = getattr(_haar_local, 'detector', None)
+    if detector is None:
+        cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        detector = cv2.CascadeClassifier(cascade_path)
+        if detector.empty():
+            raise RuntimeError(f"Failed to load Haar cascade from {cascade_path}")
+        _haar_local.detector = detector
+    return detector
+
+
+def _haar_buffer(name: str, shape: Tuple[int, ...]) -> np.ndarray:
+    """This thread's reusable uint8 image buffer, reallocated only when the frame size changes"""
+    buf = getattr(_haar_local, name, None)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, dtype=np.uint8)
+        setattr(_haar_local, name, buf)
+    return buf
+
+
+def _haar_gray(img_bgr: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    """Grayscale (optionally resized) frame written into this thread's buffers"""
+    if scale != 1.0:
+        h, w = img_bgr.shape[:2]
+        size = (int(round(w * scale)), int(round(h * scale)))
+        img_bgr = cv2.resize(img_bgr, size, dst=_haar_buffer('small', (size[1], size[0]) + img_bgr.shape[2:]))
+    if img_bgr.ndim == 2:
+        return img_bgr
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY, dst=_haar_buffer('gray', img_bgr.shape[:2]))
 
 
 def detect_closest_face_opencv(img_bgr: np.ndarray) -> bool:
@@ -345,20 +2175,21 @@ def detect_closest_face_opencv(img_bgr: np.ndarray) -> bool:
     This is used for quick auto-trigger detection before full InsightFace processing.
     """
     try:
-        cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
-        detector = cv2.CascadeClassifier(cascade_path)
+        detector = _haar_cascade()
         
-        # Use smaller image for faster detection
-        scale = 0.5
-        small_img = cv2.resize(img_bgr, None, fx=scale, fy=scale)
-        gray = cv2.cvtColor(small_img, cv2.COLOR_BGR2GRAY)
+        # Use smaller image for faster detection (CHECK_FACE_DET_SIZE longest side)
+        scale = _det_scale(img_bgr.shape, CHECK_FACE_DET_SIZE)
+        gray = _haar_gray(img_bgr, scale)
         
+        # MIN_FACE_SIZE in the scaled image, but not below the 24px cascade window
+        min_side = max(int(MIN_FACE_SIZE * scale), 24)
+
         # Detect faces with aggressive parameters for speed
         faces = detector.detectMultiScale(
             gray, 
             scaleFactor=1.1, 
             minNeighbors=3,  # Lower for faster but less precise
-            minSize=(30, 30)  # Smaller minimum size for scaled image
+            minSize=(min_side, min_side)
         )
         
         return len(faces) > 0
@@ -367,13 +2198,40 @@ def detect_closest_face_opencv(img_bgr: np.ndarray) -> bool:
         return False
 
 
+class FacePresence:
+    """
+    "Hold still" countdown of one kiosk's auto-trigger, kept on the server:
+    how long check_face has found a face without a miss (server clock).
+    update() reports trigger once it was held for required_ms, then the
+    countdown restarts.
+    """
+
+    def __init__(self, required_ms: Optional[int] = None):
+        self.required_ms = CHECK_FACE_REQUIRED_MS if required_ms is None else required_ms
+        self.since = None  # time.monotonic() of the first hit of the current run
+
+    def reset(self):
+        self.since = None
+
+    def update(self, found: bool) -> Dict[str, Any]:
+        now = time.monotonic()
+        if not found:
+            self.since = None
+        elif self.since is None:
+            self.since = now
+        held_ms = int((now - self.since) * 1000) if self.since is not None else 0
+        trigger = found and held_ms >= self.required_ms
+        if trigger:
+            self.since = None
+        return {'found': bool(found), 'held_ms': held_ms, 'required_ms': self.required_ms, 'trigger': trigger}
+
+
 def _detect_faces_fallback(img_bgr: np.ndarray) -> List[Dict[str, Any]]:
     """Fallback face detection using Haar Cascade when InsightFace is unavailable"""
     try:
-        cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
-        detector = cv2.CascadeClassifier(cascade_path)
+        detector = _haar_cascade()
 
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        gray = _haar_gray(img_bgr)
         faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(MIN_FACE_SIZE, MIN_FACE_SIZE))
 
         results = []
@@ -387,24 +2245,156 @@ def _detect_faces_fallback(img_bgr: np.ndarray) -> List[Dict[str, Any]]:
                 'gender': None
             })
 
-        return results
-    except Exception as e:
-        logger.error(f"Fallback detection failed: {e}")
-        return []
+        return results
+    except Exception as e:
+        logger.error(f"Fallback detection failed: {e}")
+        return []
+
+
+def detect_largest_face(
+    img_bgr: np.ndarray,
+    detection_threshold: Optional[float] = None,
+    compute_embedding: bool = True,
+    det_size: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Detect and return the largest face in the image.
+
+    Args:
+        img_bgr: BGR image array
+        detection_threshold: Optional custom detection threshold (defaults to DETECTION_THRESHOLD)
+        compute_embedding: Run the recognition model on the face; pass False to
+            gate on the box first and call _analyze_face only if it is kept
+        det_size: Detector longest side (defaults to DET_SIZE_FULL, 0 = adaptive)
+    """
+    faces = detect_faces(img_bgr, detection_threshold=detection_threshold,
+                         compute_embedding=compute_embedding, det_size=det_size)
+    if not faces:
+        return None
+    return faces[0]  # Already sorted by size
+
+
+class _FaceTrack:
+    """
+    Tracks the face across the frames of one burst, in capture order (frames
+    ~25 ms apart).
+    The first frame gets a full-frame detection; later frames are detected only
+    inside the previous box expanded by TRACK_ROI_MARGIN, at the same pixel
+    scale as the full frame. Falls back to full-frame detection when the face
+    is lost in the ROI, and every TRACK_REDETECT_EVERY frames if set.
+    """
+
+    def __init__(self, det_size: int, detection_threshold: Optional[float] = None):
+        self.det_size = det_size
+        self.detection_threshold = detection_threshold
+        self.box = None
+        self.since_full = 0
+        self.full_detections = 0
+        self.roi_detections = 0
+
+    def _detect_roi(self, frame: np.ndarray) -> Optional[Dict[str, Any]]:
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = self.box
+        mx = int((x2 - x1) * TRACK_ROI_MARGIN)
+        my = int((y2 - y1) * TRACK_ROI_MARGIN)
+        rx1, ry1 = max(x1 - mx, 0), max(y1 - my, 0)
+        rx2, ry2 = min(x2 + mx, w), min(y2 + my, h)
+        if rx2 - rx1 < MIN_FACE_SIZE or ry2 - ry1 < MIN_FACE_SIZE:
+            return None
+
+        # Keep the full frame's detector scale so the ROI costs only its area
+        roi = frame[ry1:ry2, rx1:rx2]
+        det_size = max(int(round(max(roi.shape[:2]) * _det_scale(frame.shape, self.det_size))), DET_STRIDE)
+        face = detect_largest_face(roi, detection_threshold=self.detection_threshold,
+                                   compute_embedding=False, det_size=det_size)
+        if face is None:
+            return None
 
+        # Back to full-frame coordinates
+        bx1, by1, bx2, by2 = face['bbox']
+        face['bbox'] = [bx1 + rx1, by1 + ry1, bx2 + rx1, by2 + ry1]
+        if face.get('landmarks') is not None:
+            face['landmarks'] = [[x + rx1, y + ry1] for x, y in face['landmarks']]
+        return face
+
+    def detect(self, frame: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Largest face of the next frame (not embedded), or None"""
+        if self.box is not None and (TRACK_REDETECT_EVERY <= 0 or self.since_full < TRACK_REDETECT_EVERY):
+            face = self._detect_roi(frame)
+            if face is not None:
+                self.roi_detections += 1
+                self.since_full += 1
+                self.box = face['bbox']
+                return face
+
+        face = detect_largest_face(frame, detection_threshold=self.detection_threshold,
+                                   compute_embedding=False, det_size=self.det_size)
+        self.full_detections += 1
+        self.since_full = 0
+        self.box = face['bbox'] if face is not None else None
+        return face
+
+
+def _new_track(fast_mode: bool = False) -> Optional[_FaceTrack]:
+    """A track for one burst, or None when FACE_TRACKING is off or frames are not in capture order"""
+    if not FACE_TRACKING or FRAME_SHARPEST_FIRST:
+        return None
+    return _FaceTrack(DET_SIZE_FAST if fast_mode else DET_SIZE_FULL)
 
-def detect_largest_face(img_bgr: np.ndarray, detection_threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
-    """
-    Detect and return the largest face in the image.
 
-    Args:
-        img_bgr: BGR image array
-        detection_threshold: Optional custom detection threshold (defaults to DETECTION_THRESHOLD)
+# ====== FRAME DECODING ======
+
+_REDUCED_GRAYSCALE = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                      (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+
+class EncodedFrame:
     """
-    faces = detect_faces(img_bgr, detection_threshold=detection_threshold)
-    if not faces:
+    An uploaded frame kept as its encoded (JPEG/PNG) bytes. The multi-frame
+    entry points accept these in place of BGR arrays: frame selection scores a
+    reduced-resolution grayscale decode, and the full frame is only decoded
+    when detection reaches it and released after it (frames after an early
+    stop are never decoded).
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def decode(self) -> Optional[np.ndarray]:
+        """Full-resolution BGR image, or None if the bytes are not a readable image"""
+        return cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+
+    def preview(self, max_side: int) -> Optional[np.ndarray]:
+        """Grayscale image decoded at the coarsest JPEG scale (1/8, 1/4, 1/2) whose longest side is >= max_side"""
+        flag = cv2.IMREAD_GRAYSCALE
+        size = _encoded_size(self.data)
+        if size is not None:
+            for factor, reduced in _REDUCED_GRAYSCALE:
+                if max(size) // factor >= max_side:
+                    flag = reduced
+                    break
+        return cv2.imdecode(np.frombuffer(self.data, np.uint8), flag)
+
+
+def _encoded_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the image header without decoding it, if Pillow can read it"""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
         return None
-    return faces[0]  # Already sorted by size
+
+
+def _decoded(frames: Iterable[Any]) -> Iterator[np.ndarray]:
+    """BGR arrays of frames, decoding EncodedFrames one at a time as they are reached (unreadable ones skipped)"""
+    for frame in frames:
+        if isinstance(frame, EncodedFrame):
+            frame = frame.decode()
+            if frame is None:
+                continue
+        yield frame
 
 
 # ====== IMAGE QUALITY ASSESSMENT ======
@@ -442,36 +2432,130 @@ def calculate_quality_score(face_dict: Dict[str, Any], img_bgr: np.ndarray) -> f
     return min(score, 1.0)
 
 
+def _frame_scores(frames: List[Any]) -> np.ndarray:
+    """
+    Cheap per-frame (sharpness, brightness, motion) on FRAME_SELECT_SIZE grayscale
+    copies: Laplacian variance, mean gray level, and mean absolute difference
+    to the neighbouring frames in capture order.
+    EncodedFrames are scored from a reduced decode (EncodedFrame.preview);
+    unreadable ones score 0 and are dropped as too dark.
+    """
+    scores = np.zeros((len(frames), 3), dtype=np.float64)
+    smalls = []
+    for i, frame in enumerate(frames):
+        if isinstance(frame, EncodedFrame):
+            frame = frame.preview(FRAME_SELECT_SIZE)
+            if frame is None:
+                smalls.append(None)
+                continue
+        scale = min(_det_scale(frame.shape, FRAME_SELECT_SIZE), 1.0)
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        scores[i, 0] = cv2.Laplacian(gray, cv2.CV_64F).var()
+        scores[i, 1] = gray.mean()
+        smalls.append(gray)
+
+    # Motion: difference to the previous/next frame (frames of one burst share a size)
+    diffs = [float(cv2.absdiff(a, b).mean()) if a is not None and b is not None and a.shape == b.shape else 0.0
+             for a, b in zip(smalls, smalls[1:])]
+    for i in range(len(frames)):
+        near = diffs[max(i - 1, 0):i + 1]
+        scores[i, 2] = float(np.mean(near)) if near else 0.0
+    return scores
+
+
+def _select_frames(frames: Iterable[Any], top_k: int = 0) -> List[Any]:
+    """
+    Drop frames that are too blurry, too dark/bright or taken while moving, and
+    return the top_k sharpest of the rest (0 = all) in capture order, or
+    sharpest first with FRAME_SHARPEST_FIRST. Without top_k or FRAME_GATE the
+    frames are returned unchanged.
+    Frames are BGR arrays or EncodedFrames (returned still encoded).
+    """
+    frames = list(frames)
+    if not frames or (top_k <= 0 and not FRAME_GATE):
+        return frames
+
+    scores = _frame_scores(frames)
+    usable = ((scores[:, 0] >= FRAME_MIN_SHARPNESS) &
+              (scores[:, 1] >= FRAME_MIN_BRIGHTNESS) & (scores[:, 1] <= FRAME_MAX_BRIGHTNESS))
+    if FRAME_MAX_MOTION > 0:
+        usable &= scores[:, 2] <= FRAME_MAX_MOTION
+
+    keep = np.flatnonzero(usable)
+    keep = keep[np.argsort(-scores[keep, 0], kind='stable')]
+    if top_k > 0:
+        keep = keep[:top_k]
+    if not FRAME_SHARPEST_FIRST:
+        keep.sort()  # Capture order: early stop, tie-breaks and tracking assume it
+
+    if keep.size < len(frames):
+        logger.info(f"Frame selection: {keep.size}/{len(frames)} frames kept "
+                    f"({int(np.count_nonzero(usable))} usable, top_k={top_k})")
+    return [frames[i] for i in keep]
+
+
 # ====== FACE ALIGNMENT ======
 
-def align_face(img_bgr: np.ndarray, landmarks: Optional[List[List[float]]] = None) -> np.ndarray:
+def _similarity_transform(src: np.ndarray, dst: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Least-squares similarity transform (Umeyama) mapping src points onto dst,
+    as a 2x3 matrix; the same estimate InsightFace's norm_crop uses.
+    None for degenerate (coincident) points.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=0)
+    dst_mean = dst.mean(axis=0)
+    src_c = src - src_mean
+    dst_c = dst - dst_mean
+
+    src_var = src_c.var(axis=0).sum()
+    if src_var <= 0:
+        return None
+
+    A = dst_c.T @ src_c / src.shape[0]
+    d = np.ones(2)
+    if np.linalg.det(A) < 0:
+        d[1] = -1
+    U, S, Vt = np.linalg.svd(A)
+    R = U @ np.diag(d) @ Vt
+    scale = float(S @ d) / src_var
+
+    M = np.empty((2, 3))
+    M[:, :2] = scale * R
+    M[:, 2] = dst_mean - scale * R @ src_mean
+    return M
+
+
+def align_face(
+    img_bgr: np.ndarray,
+    landmarks: Optional[List[List[float]]] = None,
+    image_size: int = 112
+) -> np.ndarray:
     """
-    Align face using 5-point landmarks.
+    Align face using 5-point landmarks into an image_size x image_size ArcFace crop.
+    Matches InsightFace's norm_crop, so embeddings of these crops are
+    comparable with the ones FaceAnalysis computed at enrollment.
     If landmarks not provided, return original image.
     """
     if landmarks is None or len(landmarks) < 5:
         return img_bgr
 
     try:
-        # Standard face alignment target points (112x112)
-        src_pts = np.array([
-            [38.2946, 51.6963],
-            [73.5318, 51.5014],
-            [56.0252, 71.7366],
-            [41.5493, 92.3655],
-            [70.7299, 92.2041]
-        ], dtype=np.float32)
+        # Standard face alignment target points (112x112), scaled to the crop size
+        dst_pts = ARCFACE_REFERENCE_POINTS * (image_size / 112.0)
 
-        dst_pts = np.array(landmarks[:5], dtype=np.float32)
+        src_pts = np.asarray(landmarks[:5], dtype=np.float32)
 
         # Estimate transformation matrix
-        M = cv2.estimateAffinePartial2D(dst_pts, src_pts, method=cv2.RANSAC)[0]
+        M = _similarity_transform(src_pts, dst_pts)
 
         if M is None:
             return img_bgr
 
         # Apply transformation
-        aligned = cv2.warpAffine(img_bgr, M, (112, 112), borderMode=cv2.BORDER_REPLICATE)
+        aligned = cv2.warpAffine(img_bgr, M, (image_size, image_size), borderValue=0.0)
         return aligned
     except Exception as e:
         logger.warning(f"Face alignment failed: {e}")
@@ -480,50 +2564,192 @@ def align_face(img_bgr: np.ndarray, landmarks: Optional[List[List[float]]] = Non
 
 # ====== FACE RECOGNITION ======
 
+def _embed_aligned(crops: List[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Run only the recognition model on aligned face crops, as one
+    N x 3 x 112 x 112 batch (shared with concurrent requests when
+    DYNAMIC_BATCHING is on). Returns (N, 512) L2-normalized embeddings, or
+    None if the recognition model is unavailable.
+    """
+    if not crops:
+        return None
+    if DYNAMIC_BATCHING:
+        return _get_batcher().embed(crops)
+    return _recognize_crops(crops)
+
+
+def _recognize_crops(crops: List[np.ndarray]) -> Optional[np.ndarray]:
+    """_embed_aligned without batching: one recognition-model call on this thread"""
+    with _face_app_session() as app:
+        rec = app.models.get('recognition') if app is not None else None
+        if rec is None:
+            return None
+        if rec.input_shape[0] == 1:
+            # Exported with a fixed batch of one
+            feats = np.vstack([rec.get_feat(crop) for crop in crops])
+        else:
+            feats = rec.get_feat(crops)
+    return np.vstack([_normalize_embedding(feat.flatten()) for feat in feats])
+
+
+class _InferenceBatcher:
+    """
+    Background scheduler that merges the aligned crops of concurrent requests
+    into one recognition-model batch.
+    A request enqueues its crops and waits on a Future; a worker takes the
+    first waiting request, keeps collecting until BATCH_MAX_FACES crops are
+    queued or BATCH_MAX_WAIT_MS has passed, runs one batch and hands each
+    request its slice. One worker per inference session.
+    """
+
+    def __init__(self, num_workers: int = 1):
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.faces = 0
+        self.workers = [
+            threading.Thread(target=self._run, name=f'face-engine-batcher-{i}', daemon=True)
+            for i in range(max(num_workers, 1))
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def embed(self, crops: List[np.ndarray]) -> Optional[np.ndarray]:
+        future = Future()
+        self.queue.put((crops, future))
+        try:
+            return future.result(timeout=BATCH_RESULT_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()  # Still queued: no worker embeds crops nobody waits for
+            raise
+
+    def _collect(self) -> List[Tuple[List[np.ndarray], Future]]:
+        """
+        Block for the first request, then gather more until the size or wait
+        limit. Requests whose caller gave up (cancelled) are skipped.
+        """
+        batch = []
+        while not batch:
+            item = self.queue.get()
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+        total = len(batch[0][0])
+        deadline = time.perf_counter() + BATCH_MAX_WAIT_MS / 1000.0
+        while total < BATCH_MAX_FACES:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+                total += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                feats = _recognize_crops([crop for crops, _ in batch for crop in crops])
+                start = 0
+                for crops, future in batch:
+                    future.set_result(None if feats is None else feats[start:start + len(crops)])
+                    start += len(crops)
+                self.batches += 1
+                self.faces += start
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _get_batcher() -> _InferenceBatcher:
+    """The dynamic batching scheduler, started on first use"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = _InferenceBatcher(INFERENCE_SESSIONS)
+    return _batcher
+
+
+def _recognition_input_size() -> int:
+    """Side of the recognition model's square input (112 for ArcFace)"""
+    app = _get_face_app()
+    rec = app.models.get('recognition') if app is not None else None
+    return rec.input_size[0] if rec is not None else 112
+
+
 def get_embedding(img_bgr: np.ndarray, face_dict: Optional[Dict[str, Any]] = None) -> Optional[np.ndarray]:
     """
     Get face embedding from image.
-    If face_dict is provided, use its embedding if available.
-    Otherwise, detect face and compute embedding.
+    If face_dict is provided, use its embedding if available, else align the
+    crop from its landmarks and run only the recognition model.
+    Detection runs again only when there are no landmarks (Haar fallback).
     """
     # Use provided embedding if available
     if face_dict is not None and face_dict.get('embedding') is not None:
         return face_dict['embedding']
 
-    # If face_dict has bbox but no embedding, try to extract face region
+    # Align from the detector's landmarks; no second detection pass
+    if face_dict is not None and face_dict.get('landmarks') is not None:
+        try:
+            aligned = align_face(img_bgr, face_dict['landmarks'], _recognition_input_size())
+            embeddings = _embed_aligned([aligned])
+            if embeddings is not None:
+                return embeddings[0]
+        except Exception as e:
+            logger.warning(f"Failed to get embedding from aligned face: {e}")
+
+    if _get_face_app() is None:
+        return None
+
+    # No landmarks: detect inside the face box first (smaller image), then the full image
     if face_dict is not None and face_dict.get('bbox') is not None:
-        bbox = face_dict['bbox']
-        x1, y1, x2, y2 = bbox
+        x1, y1, x2, y2 = [max(int(v), 0) for v in face_dict['bbox']]
         face_img = img_bgr[y1:y2, x1:x2]
         if face_img.size > 0:
-            app = _get_face_app()
-            if app is not None:
-                try:
-                    faces = app.get(face_img)
-                    if faces and getattr(faces[0], 'embedding', None) is not None:
-                        return _normalize_embedding(faces[0].embedding)
-                except Exception as e:
-                    logger.warning(f"Failed to get embedding from cropped face: {e}")
+            face = detect_largest_face(face_img)
+            if face is not None and face.get('embedding') is not None:
+                return face['embedding']
 
-    # Fallback: Detect face and get embedding from full image
-    app = _get_face_app()
-    if app is None:
+    face = detect_largest_face(img_bgr)
+    if face is None:
         return None
+    return face.get('embedding')
 
-    try:
-        faces = app.get(img_bgr)
-        if not faces:
-            return None
 
-        # Get largest face embedding
-        largest = max(faces, key=lambda f: (f.bbox[2]-f.bbox[0]) * (f.bbox[3]-f.bbox[1]))
-        if getattr(largest, 'embedding', None) is None:
-            return None
+def _embed_faces(images: List[np.ndarray], faces: List[Dict[str, Any]]) -> List[Optional[np.ndarray]]:
+    """
+    Embeddings of detected faces (faces[i] found in images[i]).
+    Crops are aligned from the 5-point landmarks (align_face), then the
+    recognition model runs once on the N x 3 x 112 x 112 batch.
+    Faces without landmarks (Haar fallback) go through get_embedding.
+    None where no embedding could be computed.
+    """
+    embeddings = [face.get('embedding') for face in faces]
+    todo = [i for i, face in enumerate(faces) if embeddings[i] is None and face.get('landmarks') is not None]
 
-        return _normalize_embedding(largest.embedding)
-    except Exception as e:
-        logger.error(f"Failed to get embedding: {e}")
-        return None
+    if todo and _get_face_app() is not None:
+        try:
+            size = _recognition_input_size()
+            feats = _embed_aligned([align_face(images[i], faces[i]['landmarks'], size) for i in todo])
+            if feats is not None:
+                for i, feat in zip(todo, feats):
+                    embeddings[i] = feat
+        except Exception as e:
+            logger.warning(f"Batched embedding failed: {e}")
+
+    for i, face in enumerate(faces):
+        if embeddings[i] is None:
+            embeddings[i] = get_embedding(images[i], face)
+    return embeddings
 
 
 def find_matching_identity(
@@ -535,29 +2761,34 @@ def find_matching_identity(
     Find matching identity from database.
     Returns list of (nik, similarity) tuples sorted by similarity.
     """
-    global _embeddings_db, _embeddings_loaded
-
     if threshold is None:
         threshold = RECOGNITION_THRESHOLD
 
     if not _embeddings_loaded:
         load_all_embeddings()
 
-    if not _embeddings_db:
+    # One snapshot for the whole request; concurrent enrollments publish a new one
+    gallery = _get_gallery()
+    if gallery.num_identities == 0:
         return []
 
-    matches = []
-    for nik, embeddings in _embeddings_db.items():
-        # Calculate similarity with all embeddings for this NIK
-        similarities = [_cosine_similarity(query_embedding, emb) for emb in embeddings]
-        max_sim = max(similarities) if similarities else 0.0
+    scored = None
+    if _use_ann(gallery):
+        # Very large gallery: only scan the closest IVF lists
+        scored = _ann_score_identities(query_embedding, gallery)
+    elif _use_prototypes(gallery):
+        # Prototype pass first; None (ambiguous) falls through to exhaustive search
+        scored = _prototype_score_identities(query_embedding, gallery)
 
-        if max_sim >= threshold:
-            matches.append((nik, max_sim))
+    if scored is None:
+        # One matrix-vector product (or one per shard), then max over each NIK's rows
+        limit = top_k + max(GALLERY_RERANK, 0)
+        scored = (np.arange(gallery.offsets.size),
+                  _exhaustive_identity_sims(query_embedding, gallery, threshold, limit)[0])
 
-    # Sort by similarity (highest first)
-    matches.sort(key=lambda x: x[1], reverse=True)
-    return matches[:top_k]
+    identity_idx, identity_sims = scored
+    identity_sims = _rerank_float32(query_embedding, identity_idx, identity_sims, gallery, threshold)
+    return _top_k_identities(identity_sims, gallery.niks[identity_idx], threshold, top_k)
 
 
 def recognize_face_in_image(
@@ -586,117 +2817,232 @@ def recognize_face_in_image(
     return None
 
 
+class _VoteTally:
+    """
+    Running multi-frame vote state over all gallery identities.
+
+    Keeps vote counts, similarity sums and first-vote order as arrays so the
+    per-frame update and early-stop check are O(identities) NumPy operations
+    instead of Python loops over a {nik: [similarities]} dict.
+    """
+
+    def __init__(self, niks: np.ndarray, threshold: float, fast_mode: bool = False):
+        self.niks = niks
+        self.threshold = threshold
+        self.fast_mode = fast_mode
+        self.counts = np.zeros(niks.size, dtype=np.int64)
+        self.sums = np.zeros(niks.size, dtype=np.float64)
+        # Order in which each identity received its first vote (ties resolve
+        # to the earliest voter, like iterating an insertion-ordered dict)
+        self.first_vote = np.full(niks.size, np.iinfo(np.int64).max, dtype=np.int64)
+        self.processed = 0
+        self.early_votes = EARLY_VOTES_REQUIRED if not fast_mode else FAST_MODE_EARLY_VOTES
+        self.early_sim = EARLY_SIM_THRESHOLD if not fast_mode else FAST_MODE_EARLY_SIM
+
+    def _best(self, scores: np.ndarray) -> int:
+        """Index of the highest score among voted identities, earliest voter on ties"""
+        voted = np.flatnonzero(self.counts)
+        voted_scores = scores[voted]
+        tied = voted[voted_scores == voted_scores.max()]
+        return int(tied[np.argmin(self.first_vote[tied])])
+
+    def _means(self) -> np.ndarray:
+        means = np.zeros_like(self.sums)
+        np.divide(self.sums, self.counts, out=means, where=self.counts > 0)
+        return means
+
+    def add_frames(self, identity_sims: np.ndarray) -> bool:
+        """
+        Add scored frames (F, num_identities) in order.
+        Returns True as soon as the early-stop rule fires; later rows are ignored.
+        """
+        for row in np.atleast_2d(identity_sims):
+            hits = row >= self.threshold
+            new_voters = hits & (self.counts == 0)
+            self.first_vote[new_voters] = self.processed * self.niks.size + np.flatnonzero(new_voters)
+            self.counts[hits] += 1
+            self.sums[hits] += row[hits].astype(np.float64)
+            self.processed += 1
+
+            if self.has_votes() and self.should_stop():
+                return True
+        return False
+
+    def has_votes(self) -> bool:
+        return bool(self.counts.any())
+
+    def should_stop(self) -> bool:
+        """Early stop if confident (more aggressive in fast mode)"""
+        means = self._means()
+        best = self._best(means)
+        vote_count = int(self.counts[best])
+        vote_share = vote_count / self.processed
+        avg_sim = means[best]
+        if (vote_share >= VOTE_MIN_SHARE and
+                vote_count >= self.early_votes and
+                avg_sim >= self.early_sim):
+            logger.info(f"Early stop: NIK={int(self.niks[best])}, sim={avg_sim:.3f}, votes={vote_count}")
+            return True
+        return False
+
+    def winner(self) -> Optional[Dict[str, Any]]:
+        """Find winner by vote count and average similarity"""
+        if self.processed == 0 or not self.has_votes():
+            return None
+        means = self._means()
+        best = self._best(self.counts * means)  # Combined score
+        vote_count = int(self.counts[best])
+        avg_sim = means[best]
+        return {
+            'nik': int(self.niks[best]),
+            'similarity': float(avg_sim),
+            'vote_count': vote_count,
+            'vote_share': vote_count / self.processed,
+            'processed_frames': self.processed,
+            'confidence': int(min(avg_sim * 100, 100))
+        }
+
+
+def _usable_face(
+    frame: np.ndarray,
+    fast_mode: bool = False,
+    track: Optional[_FaceTrack] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Largest face of a frame if it passes the recognition checks (not embedded
+    yet), else None. With a track, the face is searched near the previous one.
+    """
+    if track is not None:
+        face = track.detect(frame)
+    else:
+        det_size = DET_SIZE_FAST if fast_mode else DET_SIZE_FULL
+        face = detect_largest_face(frame, compute_embedding=False, det_size=det_size)
+    if face is None:
+        return None
+
+    # Skip quality check in fast mode for speed
+    if not fast_mode:
+        # Check quality
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+        bbox = face.get('bbox', [0, 0, 0, 0])
+        face_gray = gray[max(bbox[1], 0):bbox[3], max(bbox[0], 0):bbox[2]]
+        if face_gray.size > 0 and is_blurry(face_gray, 50.0):
+            return None
+
+    return face
+
+
+def _iter_frame_embeddings(
+    frames: Iterable[Any],
+    fast_mode: bool = False,
+    first_batch: int = 1,
+    track: Optional[_FaceTrack] = None
+):
+    """
+    Yield (B, 512) embedding batches of the largest usable face per frame, in
+    frame order, skipping unusable frames.
+    Frames are detected one by one and their faces embedded in one
+    recognition-model batch: first_batch faces first (the earliest the vote
+    can stop), then RECOGNITION_BATCH_SIZE at a time (0 = all the rest). When
+    the caller stops iterating, later frames are neither decoded, detected
+    nor embedded; at most one batch of decoded frames is held at a time.
+    With FACE_TRACKING, frames after the first are detected in a ROI (_FaceTrack;
+    pass one to continue tracking from an earlier call). With INFERENCE_WORKERS,
+    all of this runs in a worker process (see INFERENCE WORKERS), which tracks
+    within the frames of each call only.
+    """
+    if track is None:
+        track = _new_track(fast_mode)
+
+    pool = _get_inference_pool()
+    if pool is not None:
+        yield from pool.stream('frames', frames, fast_mode, first_batch, track is not None)
+        return
+
+    batch_size = first_batch
+    images, faces = [], []
+    for frame in _decoded(frames):
+        face = _usable_face(frame, fast_mode, track)
+        if face is None:
+            continue
+        images.append(frame)
+        faces.append(face)
+        if 0 < batch_size <= len(faces):
+            embeddings = [e for e in _embed_faces(images, faces) if e is not None]
+            images, faces = [], []
+            batch_size = RECOGNITION_BATCH_SIZE
+            if embeddings:
+                yield np.vstack(embeddings)
+
+    if faces:
+        embeddings = [e for e in _embed_faces(images, faces) if e is not None]
+        if embeddings:
+            yield np.vstack(embeddings)
+
+
+def _accept_winner(winner: Dict[str, Any], threshold: float, fast_mode: bool = False) -> bool:
+    """Validate minimum requirements (relaxed in fast mode)"""
+    min_votes = MIN_VALID_FRAMES if not fast_mode else FAST_MODE_MIN_VOTES
+    return (winner['vote_share'] >= VOTE_MIN_SHARE and
+            winner['vote_count'] >= min_votes and
+            winner['similarity'] >= threshold)
+
+
 def recognize_face_multi_frame(
-    frames: List[np.ndarray],
+    frames: Iterable[Any],
     threshold: float = None,
-    fast_mode: bool = False
+    fast_mode: bool = False,
+    top_k: Optional[int] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Recognize face across multiple frames with voting.
     Returns result dict with nik, similarity, confidence, etc.
     
     Args:
-        frames: List of BGR image frames
+        frames: BGR image frames or EncodedFrames (decoded one at a time, only
+            as far as the vote gets)
         threshold: Recognition threshold (defaults to RECOGNITION_THRESHOLD)
         fast_mode: If True, uses optimizations for speed (parallel processing)
+        top_k: Sharpest frames sent to the network (defaults to RECOGNIZE_TOP_K /
+            FAST_MODE_TOP_K, 0 = no best-K selection, see _select_frames)
     """
-    global _embeddings_db, _embeddings_loaded
-
     if threshold is None:
         threshold = RECOGNITION_THRESHOLD
+    if top_k is None:
+        top_k = FAST_MODE_TOP_K if fast_mode else RECOGNIZE_TOP_K
 
     if not _embeddings_loaded:
         load_all_embeddings()
 
-    if not _embeddings_db:
+    # Every frame is scored against the same snapshot, even if an enrollment lands meanwhile
+    gallery = _get_gallery()
+    if gallery.num_identities == 0:
         logger.info("No embeddings in database")
         return None
 
-    from collections import defaultdict
-    votes = defaultdict(list)  # nik -> list of similarities
-    processed = 0
+    tally = _VoteTally(gallery.niks, threshold, fast_mode)
+    frames = _select_frames(frames, top_k)
 
-    # Pre-compute all NIKs and embeddings for faster lookup
-    nik_list = list(_embeddings_db.keys())
-    
-    for frame in frames:
-        face = detect_largest_face(frame)
-        if face is None:
-            continue
-
-        # Skip quality check in fast mode for speed
-        if not fast_mode:
-            # Check quality
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
-            bbox = face.get('bbox', [0, 0, 0, 0])
-            face_gray = gray[bbox[1]:bbox[3], bbox[0]:bbox[2]]
-            if face_gray.size > 0 and is_blurry(face_gray, 50.0):
-                continue
-
-        embedding = face.get('embedding')
-        if embedding is None:
-            embedding = get_embedding(frame, face)
-            if embedding is None:
-                continue
+    # Each embedding batch is scored frames x gallery in one matmul. The first
+    # batch holds early_votes frames (early stop cannot fire before that), so
+    # batching changes neither when nor whether it fires, only how many extra
+    # frames of the last batch were processed.
+    for embeddings in _iter_frame_embeddings(frames, fast_mode, tally.early_votes):
+        if tally.add_frames(_score_frames(embeddings, gallery, threshold)):
+            break
 
-        processed += 1
-
-        # Find matches - optimized with numpy operations
-        for nik in nik_list:
-            embs = _embeddings_db[nik]
-            # Vectorized similarity computation
-            similarities = [_cosine_similarity(embedding, emb) for emb in embs]
-            max_sim = max(similarities) if similarities else 0.0
-            if max_sim >= threshold:
-                votes[nik].append(max_sim)
-
-        # Early stop if confident (more aggressive in fast mode)
-        if votes:
-            best_nik = max(votes.keys(), key=lambda k: np.mean(votes[k]))
-            vote_share = len(votes[best_nik]) / processed
-            avg_sim = np.mean(votes[best_nik])
-
-            early_votes = EARLY_VOTES_REQUIRED if not fast_mode else FAST_MODE_EARLY_VOTES
-            early_sim = EARLY_SIM_THRESHOLD if not fast_mode else FAST_MODE_EARLY_SIM
-            
-            if (vote_share >= VOTE_MIN_SHARE and
-                    len(votes[best_nik]) >= early_votes and
-                    avg_sim >= early_sim):
-                logger.info(f"Early stop: NIK={best_nik}, sim={avg_sim:.3f}, votes={len(votes[best_nik])}")
-                break
-
-    if processed == 0 or not votes:
-        logger.info(f"Recognition failed: processed={processed}, votes={len(votes)}")
-        return None
+    return _recognition_result(tally, threshold, fast_mode)
 
-    # Find winner by vote count and average similarity
-    winner = None
-    best_score = -1
-
-    for nik, sims in votes.items():
-        vote_count = len(sims)
-        avg_sim = np.mean(sims)
-        score = vote_count * avg_sim  # Combined score
-
-        if score > best_score:
-            best_score = score
-            winner = {
-                'nik': nik,
-                'similarity': float(avg_sim),
-                'vote_count': vote_count,
-                'vote_share': vote_count / processed,
-                'processed_frames': processed,
-                'confidence': int(min(avg_sim * 100, 100))
-            }
 
+def _recognition_result(tally: _VoteTally, threshold: float, fast_mode: bool = False) -> Optional[Dict[str, Any]]:
+    """Winner of a finished recognition vote if it passes _accept_winner, else None"""
+    processed = tally.processed
+    winner = tally.winner()
     if winner is None:
+        logger.info(f"Recognition failed: processed={processed}, votes={int(np.count_nonzero(tally.counts))}")
         return None
 
-    # Validate minimum requirements (relaxed in fast mode)
-    min_votes = MIN_VALID_FRAMES if not fast_mode else FAST_MODE_MIN_VOTES
-    if (winner['vote_share'] < VOTE_MIN_SHARE or
-            winner['vote_count'] < min_votes or
-            winner['similarity'] < threshold):
+    if not _accept_winner(winner, threshold, fast_mode):
         logger.info(f"Recognition rejected: {winner}")
         return None
 
@@ -704,80 +3050,324 @@ def recognize_face_multi_frame(
     return winner
 
 
+def verify_face_multi_frame(
+    frames: Iterable[Any],
+    nik: int,
+    threshold: float = None,
+    fast_mode: bool = False,
+    top_k: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    1:1 verification of a claimed NIK across multiple frames.
+    Frames are scored only against that NIK's embeddings (cost independent of
+    gallery size) and go through the same frame selection and voting/early
+    stop as recognize_face_multi_frame.
+    Returns result dict with verified, similarity, votes, etc., or None if the
+    NIK has no enrolled embeddings.
+    """
+    if threshold is None:
+        threshold = RECOGNITION_THRESHOLD
+    if top_k is None:
+        top_k = FAST_MODE_TOP_K if fast_mode else RECOGNIZE_TOP_K
+
+    if not _embeddings_loaded:
+        load_all_embeddings()
+
+    stored = _get_gallery().embeddings_for(nik)
+    if stored.shape[0] == 0:
+        logger.info(f"Verification: NIK {nik} has no embeddings")
+        return None
+    if GALLERY_RERANK > 0 and stored.dtype != np.float32:
+        # Only one NIK: score it at full precision straight away
+        stored = _load_float32_rows([nik]).get(nik, stored)
+    reference = _dequantize_embedding(stored)
+
+    tally = _VoteTally(np.array([nik], dtype=np.int64), threshold, fast_mode)
+    frames = _select_frames(frames, top_k)
+    best_sim = -1.0
+    for embeddings in _iter_frame_embeddings(frames, fast_mode, tally.early_votes):
+        sims = np.max(embeddings.astype(np.float32) @ reference.T, axis=1)
+        best_sim = max(best_sim, float(sims.max()))
+        if tally.add_frames(sims[:, None]):
+            break
+
+    winner = tally.winner()
+    if winner is None:
+        result = {
+            'nik': int(nik),
+            'similarity': max(best_sim, 0.0),
+            'vote_count': 0,
+            'vote_share': 0.0,
+            'processed_frames': tally.processed,
+            'confidence': 0
+        }
+    else:
+        result = dict(winner)
+    result['verified'] = winner is not None and _accept_winner(winner, threshold, fast_mode)
+
+    logger.info(f"Verification {'success' if result['verified'] else 'rejected'}: NIK={nik}, "
+                f"sim={result['similarity']:.3f}, votes={result['vote_count']}/{result['processed_frames']}")
+    return result
+
+
+# ====== PROGRESSIVE RECOGNITION SESSIONS ======
+
+class _RecognitionSession:
+    """
+    recognize_face_multi_frame over frames that arrive in chunks while the
+    kiosk is still capturing. The vote, the gallery snapshot and the face
+    track persist between chunks (with INFERENCE_WORKERS the track restarts
+    each chunk), so the early-stop rule can fire before the last frame is
+    captured or uploaded.
+    """
+
+    def __init__(self, threshold: float, fast_mode: bool, top_k: int):
+        self.lock = threading.Lock()
+        self.gallery = _get_gallery()
+        self.threshold = threshold
+        self.fast_mode = fast_mode
+        self.top_k = top_k
+        self.tally = _VoteTally(self.gallery.niks, threshold, fast_mode)
+        self.track = _new_track(fast_mode)
+        self.sent = 0  # Frames passed to the network so far
+        self.done = False
+        self.touched = time.monotonic()
+
+    def add(self, frames: Iterable[Any]) -> bool:
+        """Vote on a chunk of frames; True once the decision is final"""
+        if self.done:
+            return True
+        # Frames can only be ranked within the chunk, so top_k caps the total
+        # sent to the network instead of choosing the best of the burst
+        frames = _select_frames(frames)
+        if self.top_k > 0:
+            frames = frames[:self.top_k - self.sent]
+        self.sent += len(frames)
+
+        first_batch = max(self.tally.early_votes - self.tally.processed, 1)
+        for embeddings in _iter_frame_embeddings(frames, self.fast_mode, first_batch, self.track):
+            if self.tally.add_frames(_score_frames(embeddings, self.gallery, self.threshold)):
+                self.done = True
+                break
+        if self.top_k > 0 and self.sent >= self.top_k:
+            self.done = True
+        return self.done
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'done': self.done,
+            'result': _recognition_result(self.tally, self.threshold, self.fast_mode) if self.done else None,
+            'processed_frames': self.tally.processed,
+            'fast_mode': self.fast_mode
+        }
+
+
+_recognition_sessions = {}  # session id -> _RecognitionSession, oldest first
+_recognition_sessions_lock = threading.Lock()
+
+
+def start_recognition_session(threshold: float = None, fast_mode: bool = False, top_k: Optional[int] = None) -> str:
+    """
+    Open a progressive recognition session (see add_session_frames) and return its id.
+    Sessions live in this process; idle ones expire after RECOGNITION_SESSION_TTL seconds.
+    """
+    import uuid
+
+    if threshold is None:
+        threshold = RECOGNITION_THRESHOLD
+    if top_k is None:
+        top_k = FAST_MODE_TOP_K if fast_mode else RECOGNIZE_TOP_K
+    if not _embeddings_loaded:
+        load_all_embeddings()
+
+    session_id = uuid.uuid4().hex
+    session = _RecognitionSession(threshold, fast_mode, top_k)
+    now = time.monotonic()
+    with _recognition_sessions_lock:
+        for sid in [sid for sid, s in _recognition_sessions.items() if now - s.touched > RECOGNITION_SESSION_TTL]:
+            del _recognition_sessions[sid]
+        while len(_recognition_sessions) >= max(RECOGNITION_SESSION_MAX, 1):
+            del _recognition_sessions[next(iter(_recognition_sessions))]
+        _recognition_sessions[session_id] = session
+    return session_id
+
+
+def _get_recognition_session(session_id: str) -> Optional[_RecognitionSession]:
+    with _recognition_sessions_lock:
+        session = _recognition_sessions.get(session_id)
+        if session is not None and time.monotonic() - session.touched > RECOGNITION_SESSION_TTL:
+            del _recognition_sessions[session_id]
+            session = None
+        if session is not None:
+            session.touched = time.monotonic()
+    return session
+
+
+def add_session_frames(session_id: str, frames: Iterable[Any]) -> Optional[Dict[str, Any]]:
+    """
+    Add a chunk of frames to a recognition session.
+    Returns {'done', 'result', 'processed_frames', 'fast_mode'}: once done, result is what
+    recognize_face_multi_frame would return (None = not recognized) and the
+    client can stop capturing. Returns None for an unknown or expired session.
+    """
+    session = _get_recognition_session(session_id)
+    if session is None:
+        return None
+    with session.lock:
+        if session.gallery.num_identities == 0:
+            session.done = True
+        else:
+            session.add(frames)
+        status = session.status()
+    if status['done']:
+        close_recognition_session(session_id)
+    return status
+
+
+def finish_recognition_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """Decide on the frames received so far and close the session (None for an unknown session)"""
+    session = _get_recognition_session(session_id)
+    if session is None:
+        return None
+    with session.lock:
+        session.done = True
+        status = session.status()
+    close_recognition_session(session_id)
+    return status
+
+
+def close_recognition_session(session_id: str):
+    with _recognition_sessions_lock:
+        _recognition_sessions.pop(session_id, None)
+
+
 # ====== REGISTRATION / ENROLLMENT ======
 
-def enroll_face(
-    img_bgr: np.ndarray,
-    nik: int
-) -> Tuple[bool, str, Optional[np.ndarray]]:
+def _registration_face(img_bgr: np.ndarray) -> Tuple[Optional[Dict[str, Any]], float, str]:
     """
-    Enroll a single face image to database.
-    Returns (success, message, embedding).
+    Detect and quality-check the face to enroll (not embedded yet).
+    Returns (face, quality, message); face is None if the frame is rejected.
 
     Uses relaxed detection and quality thresholds for easier registration.
     """
     # Use relaxed detection threshold for registration
-    face = detect_largest_face(img_bgr, detection_threshold=REGISTRATION_DETECTION_THRESHOLD)
+    face = detect_largest_face(img_bgr, detection_threshold=REGISTRATION_DETECTION_THRESHOLD,
+                               compute_embedding=False, det_size=DET_SIZE_REGISTRATION)
     if face is None:
-        return False, "No face detected", None
+        return None, 0.0, "No face detected"
 
     # Check quality with relaxed threshold for registration
     quality = calculate_quality_score(face, img_bgr)
     if quality < REGISTRATION_QUALITY_THRESHOLD:
-        return False, f"Face quality too low: {quality:.2f}", None
+        return None, quality, f"Face quality too low: {quality:.2f}"
 
-    # If detection embedding missing, try to compute explicitly
-    embedding = face.get('embedding')
+    return face, quality, ""
+
+
+def _registration_embeddings(frames: Iterable[Any], limit: int) -> List[Tuple[np.ndarray, float]]:
+    """
+    (embedding, quality) of up to limit accepted registration faces, in frame order.
+    Accepts just enough faces to reach the limit; another round only runs if
+    some of them could not be embedded.
+    """
+    pool = _get_inference_pool()
+    if pool is not None:
+        return pool.call('register', frames, limit)
+
+    accepted = []
+    remaining = _decoded(frames)
+    size = _recognition_input_size()
+    while len(accepted) < limit:
+        # Only the aligned crop of an accepted face is kept, so each decoded
+        # frame is released before the next one is read
+        crops, qualities = [], []
+        for frame in remaining:
+            face, quality, _ = _registration_face(frame)
+            if face is None:
+                continue
+            if face.get('landmarks') is not None:
+                crops.append(align_face(frame, face['landmarks'], size))
+                qualities.append(quality)
+            else:
+                embedding = get_embedding(frame, face)  # Haar fallback face: no landmarks to align
+                if embedding is not None:
+                    accepted.append((embedding, quality))
+            if len(accepted) + len(crops) >= limit:
+                break
+        if not crops:
+            break
+
+        try:
+            feats = _embed_aligned(crops)
+        except Exception as e:
+            logger.warning(f"Batched embedding failed: {e}")
+            feats = None
+        if feats is not None:
+            accepted.extend(zip(feats, qualities))
+    return accepted
+
+
+def enroll_face(
+    img_bgr: np.ndarray,
+    nik: int
+) -> Tuple[bool, str, Optional[np.ndarray]]:
+    """
+    Enroll a single face image to database.
+    Returns (success, message, embedding).
+    """
+    face, quality, msg = _registration_face(img_bgr)
+    if face is None:
+        return False, msg, None
+
+    embedding = _embed_faces([img_bgr], [face])[0]
     if embedding is None:
-        embedding = get_embedding(img_bgr, face)
-        if embedding is None:
-            return False, "Could not extract embedding (is InsightFace installed and models downloaded?)", None
+        return False, "Could not extract embedding (is InsightFace installed and models downloaded?)", None
 
-    # Save embedding
+    # Save embedding (also publishes it to the in-memory gallery)
     if save_embedding(nik, embedding, quality):
-        # Update in-memory cache
-        global _embeddings_db
-        if nik not in _embeddings_db:
-            _embeddings_db[nik] = []
-        _embeddings_db[nik].append(embedding)
-
         return True, f"Enrolled with quality {quality:.2f}", embedding
 
     return False, "Failed to save embedding", None
 
 
 def enroll_multiple_frames(
-    frames: List[np.ndarray],
+    frames: Iterable[Any],
     nik: int,
-    min_embeddings: int = 5
+    min_embeddings: int = 5,
+    top_k: Optional[int] = None
 ) -> Tuple[int, str]:
     """
     Enroll multiple frames for a single NIK.
     Returns (num_enrolled, message).
+
+    With top_k (defaults to REGISTRATION_TOP_K) or FRAME_GATE, unusable frames
+    are dropped before inference (see _select_frames). The rest are detected
+    and quality-checked, and the aligned crops of the accepted faces embedded
+    in one recognition-model batch (see _registration_embeddings). Frames may
+    be EncodedFrames.
     """
-    enrolled = 0
+    if top_k is None:
+        top_k = REGISTRATION_TOP_K
 
-    for frame in frames:
-        success, msg, _ = enroll_face(frame, nik)
-        if success:
+    max_enrolled = 20  # Max 20 embeddings per person
+    enrolled = 0
+    for embedding, quality in _registration_embeddings(_select_frames(frames, top_k), max_enrolled):
+        if save_embedding(nik, embedding, quality):
             enrolled += 1
-            if enrolled >= 20:  # Max 20 embeddings per person
-                break
 
     # Augment if needed (by duplicating best embeddings)
-    global _embeddings_db
-    if enrolled > 0 and enrolled < min_embeddings and nik in _embeddings_db:
-        current_count = len(_embeddings_db[nik])
+    current = _get_gallery().embeddings_for(nik)
+    if enrolled > 0 and enrolled < min_embeddings and current.shape[0] > 0:
+        current_count = current.shape[0]
         needed = min_embeddings - current_count
 
         # Add slightly noisy versions of existing embeddings
         for i in range(needed):
             idx = i % current_count
-            base_emb = _embeddings_db[nik][idx]
+            base_emb = _dequantize_embedding(current[idx])
             noise = np.random.normal(0, 0.01, base_emb.shape)
             augmented = _normalize_embedding(base_emb + noise)
             save_embedding(nik, augmented, 0.5)
-            _embeddings_db[nik].append(augmented)
             enrolled += 1
 
     if enrolled == 0:
@@ -786,6 +3376,336 @@ def enroll_multiple_frames(
     return enrolled, f"Successfully enrolled {enrolled} embeddings"
 
 
+# ====== INFERENCE WORKERS ======
+
+class InferenceBusy(RuntimeError):
+    """Every inference worker is busy and INFERENCE_QUEUE_DEPTH requests are already waiting"""
+
+
+class _SharedFrames:
+    """
+    The frames of one worker request in a shared memory block with a slot per
+    frame, sized from the EncodedFrame image headers (decoded BGR is always
+    width x height x 3 bytes). A frame is only decoded, copied into its slot
+    and released when the worker asks for it (write), so frames after an early
+    stop are never decoded and their slots never get memory pages.
+    """
+
+    def __init__(self, frames: Iterable[Any]):
+        from multiprocessing import shared_memory
+
+        self.frames = list(frames)
+        self.offsets = []
+        self.sizes = []
+        offset = 0
+        for i, frame in enumerate(self.frames):
+            size = _encoded_size(frame.data) if isinstance(frame, EncodedFrame) else None
+            if size is not None:
+                nbytes = size[0] * size[1] * 3
+            else:
+                if isinstance(frame, EncodedFrame):
+                    frame = self.frames[i] = frame.decode()  # Header Pillow cannot read: decode now for the size
+                nbytes = frame.nbytes if frame is not None else 0
+            self.offsets.append(offset)
+            self.sizes.append(nbytes)
+            offset += nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def write(self, index: int) -> Optional[Tuple[Tuple[int, ...], str]]:
+        """Decode frame index into its slot; (shape, dtype) for the worker, or None to skip it"""
+        frame, self.frames[index] = self.frames[index], None
+        if isinstance(frame, EncodedFrame):
+            frame = frame.decode()
+        if frame is None:
+            return None
+        if frame.nbytes != self.sizes[index]:
+            logger.warning(f"Frame {index} decoded to {frame.shape}, which does not fit its slot: skipped")
+            return None
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf, offset=self.offsets[index])[...] = frame
+        return frame.shape, frame.dtype.str
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _slot_frames(conn, shm, offsets: List[int]) -> Iterator[np.ndarray]:
+    """Worker side of _SharedFrames: each frame is asked from the parent when reached, then read in place"""
+    for index, offset in enumerate(offsets):
+        conn.send(('frame', index))
+        meta = conn.recv()
+        if meta is not None:
+            shape, dtype = meta
+            yield np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+
+def _inference_worker(conn, model_dir: str):
+    """
+    Worker process loop: owns the models and runs one request at a time on
+    frames read (not copied) from the shared memory block named in the request.
+    Replies are ('frame', i) / ('item', x)* then ('done', result) or ('error',
+    message). The parent answers each frame request once frame i is in its
+    slot, and each item with 'next' or 'stop' (early stop).
+    """
+    from multiprocessing import shared_memory
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        cmd = msg[0]
+        if cmd == 'stop':
+            break
+
+        shm = frames = None
+        try:
+            # The first call loads the models from the parent's model_dir; later
+            # calls (and the pipeline's own _get_face_app calls) get the loaded app
+            app = _get_face_app(model_dir)
+            if cmd == 'warmup':
+                if app is None:
+                    raise RuntimeError("InsightFace models could not be loaded")
+                _warmup_inference()
+                conn.send(('done', sorted(app.models)))
+                continue
+
+            _, name, offsets, *args = msg
+            shm = shared_memory.SharedMemory(name=name)
+            frames = _slot_frames(conn, shm, offsets)
+            if cmd == 'frames':
+                fast_mode, first_batch, tracking = args
+                track = _FaceTrack(DET_SIZE_FAST if fast_mode else DET_SIZE_FULL) if tracking else None
+                for embeddings in _iter_frame_embeddings(frames, fast_mode, first_batch, track):
+                    conn.send(('item', embeddings))
+                    if conn.recv() != 'next':
+                        break
+                conn.send(('done', None))
+            elif cmd == 'register':
+                conn.send(('done', _registration_embeddings(frames, *args)))
+            else:
+                conn.send(('error', f"Unknown command {cmd!r}"))
+        except Exception as e:
+            conn.send(('error', str(e)))
+        finally:
+            frames = None
+            if shm is not None:
+                shm.close()
+
+
+class _InferencePool:
+    """
+    Worker processes that each hold their own copy of the models. A request
+    checks out an idle worker (waiting if all are busy, rejected with
+    InferenceBusy once INFERENCE_QUEUE_DEPTH requests are already waiting),
+    decodes its frames into shared memory as the worker reaches them and
+    exchanges only small messages and embeddings over the worker's pipe.
+    A worker that fails or stops replying is restarted.
+    """
+
+    def __init__(self, num_workers: int, queue_depth: int):
+        import multiprocessing
+
+        self._ctx = multiprocessing.get_context(INFERENCE_START_METHOD)
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._workers = {}  # index -> (process, parent connection)
+        self.num_workers = num_workers
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.modules = []
+        for i in range(num_workers):
+            self._spawn(i)
+
+    def _spawn(self, index: int):
+        # Tracking is switched per request ('frames' command), not by the worker's environment
+        env = {'FACE_ENGINE_INIT': '0', 'FACE_ENGINE_WARMUP': '0', 'INFERENCE_WORKERS': '0', 'FACE_TRACKING': '0'}
+        if ORT_INTRA_OP_THREADS == 0 and self.num_workers > 1:
+            env['ORT_INTRA_OP_THREADS'] = str(max((os.cpu_count() or 1) // self.num_workers, 1))
+        parent_conn, child_conn = self._ctx.Pipe()
+        with _child_environment(env):
+            proc = self._ctx.Process(target=_inference_worker, args=(child_conn, MODEL_DIR),
+                                     name=f"inference-worker-{index}", daemon=True)
+            proc.start()
+        child_conn.close()
+        self._workers[index] = (proc, parent_conn)
+        self._idle.put(index)
+
+    def _restart(self, index: int):
+        proc, conn = self._workers.pop(index)
+        conn.close()
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(timeout=5)
+        self.restarts += 1
+        logger.warning(f"Inference worker {index} restarted")
+        self._spawn(index)
+
+    def _acquire(self, timeout: Optional[float]) -> int:
+        """Index of an idle worker, reserved for one request"""
+        with self._lock:
+            if self.in_flight >= self.num_workers + self.queue_depth:
+                self.rejected += 1
+                raise InferenceBusy(f"{self.in_flight} inference requests in flight")
+            self.in_flight += 1
+        try:
+            return self._idle.get(timeout=timeout)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise InferenceBusy("No inference worker became free")
+
+    def _release(self, index: int, healthy: bool):
+        if healthy:
+            self._idle.put(index)
+        else:
+            self._restart(index)
+        with self._lock:
+            self.in_flight -= 1
+
+    def _recv(self, index: int, timeout: Optional[float]):
+        conn = self._workers[index][1]
+        if not conn.poll(timeout):
+            raise TimeoutError(f"No reply from inference worker {index} in {timeout:.0f}s")
+        return conn.recv()
+
+    def _send(self, index: int, msg):
+        self._workers[index][1].send(msg)
+
+    def _reply(self, index: int, shared: _SharedFrames):
+        """Next reply of a worker that is not a frame request, writing the frames it asks for meanwhile"""
+        kind, payload = self._recv(index, INFERENCE_TIMEOUT)
+        while kind == 'frame':
+            self._send(index, shared.write(payload))
+            kind, payload = self._recv(index, INFERENCE_TIMEOUT)
+        return kind, payload
+
+    def stream(self, cmd: str, frames: Iterable[Any], *args):
+        """Yield the items a worker produces for frames; closing the generator stops the worker early"""
+        shared = _SharedFrames(frames)
+        if len(shared) == 0:
+            shared.close()
+            return
+        index = healthy = None
+        try:
+            index = self._acquire(INFERENCE_TIMEOUT)
+            healthy = False
+            self._send(index, (cmd, shared.shm.name, shared.offsets) + args)
+            kind, payload = self._reply(index, shared)
+            while kind == 'item':
+                try:
+                    yield payload
+                except GeneratorExit:
+                    # Early stop: the worker skips the remaining frames and confirms
+                    self._send(index, 'stop')
+                    healthy = self._recv(index, INFERENCE_TIMEOUT)[0] == 'done'
+                    raise
+                self._send(index, 'next')
+                kind, payload = self._reply(index, shared)
+            healthy = True  # The worker is back at its loop, even after an error reply
+            if kind == 'error':
+                raise RuntimeError(f"Inference worker failed: {payload}")
+        finally:
+            if index is not None:
+                self._release(index, healthy)
+            shared.close()
+
+    def call(self, cmd: str, frames: Iterable[Any], *args):
+        """Result of one non-streaming worker command on frames"""
+        shared = _SharedFrames(frames)
+        if len(shared) == 0:
+            shared.close()
+            return []
+        index = None
+        healthy = False
+        try:
+            index = self._acquire(INFERENCE_TIMEOUT)
+            self._send(index, (cmd, shared.shm.name, shared.offsets) + args)
+            kind, payload = self._reply(index, shared)
+            healthy = True
+            if kind == 'error':
+                raise RuntimeError(f"Inference worker failed: {payload}")
+            return payload
+        finally:
+            if index is not None:
+                self._release(index, healthy)
+            shared.close()
+
+    def warm_up(self):
+        """Load the models and run the warm-up inferences in every worker (each checked out once)"""
+        held = {}
+        try:
+            for _ in range(self.num_workers):
+                index = self._acquire(None)
+                held[index] = False
+                self._send(index, ('warmup',))
+            for index in held:
+                kind, payload = self._recv(index, None)
+                held[index] = True
+                if kind == 'error':
+                    raise RuntimeError(f"Inference worker warm-up failed: {payload}")
+                self.modules = payload
+        finally:
+            for index, healthy in held.items():
+                self._release(index, healthy)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'workers': self.num_workers,
+            'alive': sum(proc.is_alive() for proc, _ in self._workers.values()),
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'rejected': self.rejected,
+            'restarts': self.restarts
+        }
+
+    def close(self):
+        for index, (proc, conn) in list(self._workers.items()):
+            try:
+                conn.send(('stop',))
+            except (OSError, ValueError):
+                pass
+        for proc, conn in self._workers.values():
+            proc.join(timeout=5)
+            conn.close()
+        self._workers = {}
+
+
+_inference_pool = None
+_inference_pool_lock = threading.Lock()
+
+
+def _get_inference_pool() -> Optional[_InferencePool]:
+    """The inference worker pool (started on first use), or None when inference runs in this process"""
+    global _inference_pool
+    if INFERENCE_WORKERS <= 0:
+        return None
+    if _inference_pool is None:
+        with _inference_pool_lock:
+            if _inference_pool is None:
+                _inference_pool = _InferencePool(INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH)
+                logger.info(f"Inference workers started: {INFERENCE_WORKERS} processes, "
+                            f"queue depth {INFERENCE_QUEUE_DEPTH}")
+    return _inference_pool
+
+
+def shutdown_inference_pool():
+    """Stop the inference worker processes"""
+    global _inference_pool
+    with _inference_pool_lock:
+        pool, _inference_pool = _inference_pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown_inference_pool)
+
+
 # ====== THRESHOLD TUNING ======
 
 def log_threshold_performance(
@@ -811,23 +3731,22 @@ def suggest_threshold() -> float:
     Suggest optimal threshold based on embedding distribution.
     Analyzes intra-class and inter-class distances.
     """
-    global _embeddings_db, _embeddings_loaded
-
     if not _embeddings_loaded:
         load_all_embeddings()
 
-    if len(_embeddings_db) < 2:
+    gallery = _get_gallery()
+    if gallery.num_identities < 2:
         return RECOGNITION_THRESHOLD
 
     try:
         intra_sims = []  # Same person similarities
         inter_sims = []  # Different person similarities
 
-        niks = list(_embeddings_db.keys())
+        niks = list(gallery.segment_of.keys())
 
         # Calculate intra-class similarities
         for nik in niks:
-            embs = _embeddings_db[nik]
+            embs = _dequantize_embedding(gallery.embeddings_for(nik))
             for i in range(len(embs)):
                 for j in range(i+1, len(embs)):
                     intra_sims.append(_cosine_similarity(embs[i], embs[j]))
@@ -836,8 +3755,8 @@ def suggest_threshold() -> float:
         import random
         for _ in range(min(1000, len(niks) * len(niks))):
             nik1, nik2 = random.sample(niks, 2)
-            emb1 = random.choice(_embeddings_db[nik1])
-            emb2 = random.choice(_embeddings_db[nik2])
+            emb1 = _dequantize_embedding(random.choice(gallery.embeddings_for(nik1)))
+            emb2 = _dequantize_embedding(random.choice(gallery.embeddings_for(nik2)))
             inter_sims.append(_cosine_similarity(emb1, emb2))
 
         if not intra_sims or not inter_sims:
@@ -861,18 +3780,119 @@ def suggest_threshold() -> float:
 _initialized = False
 _init_lock = threading.Lock()
 
+# Background warm-up progress (see warm_up / warmup_status)
+_warmup_lock = threading.Lock()
+_warmup = {'state': 'idle', 'phase': None, 'phases': {}, 'error': None, 'started_at': None, 'finished_at': None}
+
+
+def _warmup_phase(name: str, fn):
+    """Run one warm-up phase, recording and logging its duration"""
+    with _warmup_lock:
+        _warmup['phase'] = name
+    t0 = time.perf_counter()
+    fn()
+    ms = (time.perf_counter() - t0) * 1000
+    with _warmup_lock:
+        _warmup['phases'][name] = round(ms, 1)
+    logger.info(f"Warm-up phase '{name}': {ms:.0f} ms")
+
+
+def _warmup_inference():
+    """
+    Dummy inferences on a synthetic frame with every model instance, at each
+    configured detector size and recognition batch size, so ORT's first-run
+    allocations for those shapes do not land on a patient's request.
+    """
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    crops = [frame[:112, :112].copy()] * max(EARLY_VOTES_REQUIRED, FAST_MODE_EARLY_VOTES, RECOGNITION_BATCH_SIZE, 1)
+    det_sizes = sorted({DET_SIZE_FULL, DET_SIZE_FAST, DET_SIZE_REGISTRATION})
+    batch_sizes = sorted({1, EARLY_VOTES_REQUIRED, FAST_MODE_EARLY_VOTES, RECOGNITION_BATCH_SIZE} - {0})
+
+    pool = _face_app_pool
+    instances = [pool.get() for _ in range(max(INFERENCE_SESSIONS, 1))] if pool is not None else [_face_app]
+    try:
+        for app in instances:
+            for det_size in det_sizes:
+                app.det_model.detect(frame, input_size=_det_input_size(app, frame, det_size), max_num=0)
+            rec = app.models.get('recognition')
+            if rec is not None:
+                for batch in batch_sizes:
+                    rec.get_feat(crops[:batch])
+    finally:
+        if pool is not None:
+            for app in instances:
+                pool.put(app)
+
+
+def _run_warmup():
+    with _warmup_lock:
+        _warmup.update(state='running', started_at=datetime.now().isoformat(timespec='seconds'))
+    t0 = time.perf_counter()
+    try:
+        if INFERENCE_WORKERS > 0:
+            # The models live in the worker processes; each loads and warms its own
+            _warmup_phase('start_workers', _get_inference_pool)
+            _warmup_phase('inference', lambda: _get_inference_pool().warm_up())
+        else:
+            _warmup_phase('load_models', _get_face_app)
+            if _face_app is None:
+                raise RuntimeError("InsightFace models could not be loaded")
+            _warmup_phase('inference', _warmup_inference)
+        if ANN_ENABLED and _get_gallery().num_rows >= ANN_MIN_GALLERY:
+            # Load (or start training) the IVF centroids now rather than on the first query
+            _warmup_phase('ann_index', _ann_ready_centroids)
+        state, error = 'ready', None
+        logger.info(f"Warm-up complete in {time.perf_counter() - t0:.1f}s")
+    except Exception as e:
+        state, error = 'failed', str(e)
+        logger.error(f"Warm-up failed: {e}")
+    with _warmup_lock:
+        _warmup.update(state=state, phase=None, error=error,
+                       finished_at=datetime.now().isoformat(timespec='seconds'))
+
+
+def warm_up(blocking: bool = False) -> Dict[str, Any]:
+    """
+    Load the models and run dummy inferences (once). Runs in a background
+    thread unless blocking; returns warmup_status().
+    """
+    with _warmup_lock:
+        start = _warmup['state'] in ('idle', 'failed')
+        if start:
+            _warmup.update(state='running', phase=None, phases={}, error=None)
+    if start:
+        if blocking:
+            _run_warmup()
+        else:
+            threading.Thread(target=_run_warmup, name='face-engine-warmup', daemon=True).start()
+    return warmup_status()
+
+
+def warmup_status() -> Dict[str, Any]:
+    """Warm-up progress: state (idle|running|ready|failed), current phase, phase timings in ms"""
+    with _warmup_lock:
+        status = dict(_warmup)
+        status['phases'] = dict(_warmup['phases'])
+    # Without a warm-up (FACE_ENGINE_WARMUP=0) the models count as ready once a request loaded them
+    status['ready'] = status['state'] == 'ready' or (status['state'] == 'idle' and _face_app is not None)
+    return status
+
+
 def initialize():
-    """Initialize face engine at startup (thread-safe)"""
+    """
+    Initialize face engine at startup (thread-safe): embedding database and
+    gallery. The model warm-up (warm_up) is left to the process that serves
+    requests, which app.py starts once it knows it is that process.
+    """
     global _initialized
     with _init_lock:
         if _initialized:
             return  # Already initialized
 
+        t0 = time.perf_counter()
         init_embedding_db()
         load_all_embeddings()
-
-        # Pre-warm face detection (optional)
-        # _get_face_app()
+        logger.info(f"Embedding gallery ready in {(time.perf_counter() - t0) * 1000:.0f} ms")
 
         _initialized = True
         logger.info("Face engine initialized")
@@ -887,12 +3907,19 @@ def is_available() -> bool:
 
 
 def get_engine_status() -> Dict[str, Any]:
-    """Get face engine status"""
-    global _embeddings_db, _embeddings_loaded
+    """Get face engine status (does not load the models; see 'warmup')"""
+    gallery = _get_gallery()
+    pool = _inference_pool
+    modules = sorted(_face_app.models) if _face_app is not None else (pool.modules if pool is not None else [])
 
     return {
-        'insightface_available': _get_face_app() is not None,
+        'insightface_available': bool(modules),
+        'insightface_modules': modules,
+        'inference_workers': pool.status() if pool is not None else None,
+        'warmup': warmup_status(),
         'embeddings_loaded': _embeddings_loaded,
+        'gallery_version': gallery.version,
+        'gallery_dead_rows': gallery.dead_rows,
         'total_embeddings': get_embedding_count(),
         'unique_niks': get_unique_nik_count(),
         'recognition_threshold': RECOGNITION_THRESHOLD,
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Recall-vs-exact report for the IVF approximate search in face_engine.
+
+For each nprobe setting it reports top-1 recall against exact search (genuine
+queries), how many accept/reject decisions at RECOGNITION_THRESHOLD change,
+and query latency.
+Pick the smallest nprobe with 0 changed decisions and set ANN_NPROBE to it.
+
+Usage:
+    python scripts/ann_recall_report.py                       # embeddings.db
+    python scripts/ann_recall_report.py --synthetic 20000     # synthetic gallery
+    python scripts/ann_recall_report.py --nprobe 4,8,16,32 --nlist 512 --save
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Shared report harness: repo root on sys.path, auto-init disabled
+from gallery_bench import face_engine, synthetic_gallery, install_gallery, make_queries, compare_decisions
+
+
+def top1(identity_idx, identity_sims, threshold):
+    """(identity index, similarity) of the best identity at/above threshold, or None"""
+    if identity_sims.size == 0:
+        return None
+    best = int(np.argmax(identity_sims))
+    if identity_sims[best] < threshold:
+        return None
+    return int(identity_idx[best]), float(identity_sims[best])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=face_engine.EMBEDDING_DB_PATH, help="embeddings.db to evaluate")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use a synthetic gallery with this many identities")
+    parser.add_argument("--per-identity", type=int, default=5, help="Embeddings per synthetic identity")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF clusters (0 = face_engine default)")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64", help="Comma separated nprobe values")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.35, help="Noise added to genuine queries")
+    parser.add_argument("--impostor-share", type=float, default=0.2, help="Share of non-enrolled queries")
+    parser.add_argument("--threshold", type=float, default=face_engine.RECOGNITION_THRESHOLD)
+    parser.add_argument("--save", action="store_true", help="Persist the trained index to ANN_INDEX_PATH")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    if args.synthetic:
+        install_gallery(*synthetic_gallery(args.synthetic, args.per_identity, rng))
+    else:
+        face_engine.EMBEDDING_DB_PATH = args.db
+        face_engine.load_all_embeddings()
+
+    gallery = face_engine._get_gallery()
+    if gallery.num_rows == 0:
+        print("Gallery is empty - use --synthetic N or point --db at a populated embeddings.db")
+        return 1
+
+    nlist = args.nlist or face_engine._default_nlist(gallery.num_rows)
+    t0 = time.perf_counter()
+    face_engine.build_ann_index(nlist=nlist, save=args.save)
+    train_s = time.perf_counter() - t0
+    face_engine._get_ann_lists(gallery)
+
+    matrix = face_engine._dequantize_embedding(gallery.take(np.arange(gallery.num_rows)))
+    queries = make_queries(matrix, args.queries, args.noise, args.impostor_share, rng)
+    num_genuine = len(queries) - int(len(queries) * args.impostor_share)
+    all_idx = np.arange(gallery.offsets.size)
+
+    t0 = time.perf_counter()
+    exact = [face_engine._score_identities(q, gallery) for q in queries]
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    exact_top = [top1(all_idx, sims, -np.inf) for sims in exact]
+    exact_dec = [top1(all_idx, sims, args.threshold) for sims in exact]
+    accepted = sum(d is not None for d in exact_dec)
+
+    print("=" * 78)
+    print("ANN (IVF) RECALL vs EXACT")
+    print(f"rows={gallery.num_rows}, identities={gallery.num_identities}, nlist={nlist}, train={train_s:.1f}s")
+    print(f"queries={len(queries)} (impostors={args.impostor_share:.0%}), threshold={args.threshold}, "
+          f"exact accepts={accepted}")
+    print(f"exact search: {exact_ms:.3f} ms/query")
+    print("=" * 78)
+    print(f"{'nprobe':>6} {'recall@1':>9} {'changed':>8} {'lost':>5} {'wrong':>6} {'ms/query':>9} {'speedup':>8}")
+
+    for nprobe in [int(n) for n in args.nprobe.split(",") if n.strip()]:
+        t0 = time.perf_counter()
+        approx = [face_engine._ann_score_identities(q, gallery, nprobe=nprobe) for q in queries]
+        ann_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        hits = sum(a_top is not None and a_top[0] == e_top[0] for a_top, e_top in
+                   zip((top1(idx, sims, -np.inf) for idx, sims in approx[:num_genuine]), exact_top))
+        # lost: exact accepts, ANN rejects; wrong: ANN accepts a different NIK (or an exact reject)
+        lost, wrong = compare_decisions(exact_dec, [top1(idx, sims, args.threshold) for idx, sims in approx])
+
+        print(f"{nprobe:>6} {hits / max(num_genuine, 1):9.4f} {lost + wrong:>8} {lost:>5} {wrong:>6} "
+              f"{ann_ms:9.3f} {exact_ms / ann_ms:7.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
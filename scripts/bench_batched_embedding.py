@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark batched ArcFace inference (face_engine._embed_faces) against the
+per-frame loop where the recognition model runs with batch size 1.
+
+Reports, per request of N frames:
+  - recognition model only: N batch-1 calls vs one N x 3 x 112 x 112 call
+  - embedding stage of a request (detect every frame + embed): per-frame
+    vs batched, and whether the embeddings agree
+
+Face crops come from --frames-dir (webcam frames with one face each, cycled
+to fill N); without it only the model-only comparison runs, on random crops.
+
+Usage:
+    python scripts/bench_batched_embedding.py --frames-dir samples/ [--frames 20] [--repeats 5]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def load_frames(frames_dir, count):
+    paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp") for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    return [images[i % len(images)] for i in range(count)] if images else []
+
+
+def best_of(fn, repeats):
+    """(min ms over repeats, last result)"""
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best, result
+
+
+def per_frame_embeddings(frames):
+    """The per-frame loop: detect, then run the recognition model on that one face"""
+    out = []
+    for frame in frames:
+        face = face_engine.detect_largest_face(frame)
+        if face is not None and face.get('embedding') is not None:
+            out.append(face['embedding'])
+    return out
+
+
+def batched_embeddings(frames):
+    """Detect every frame, then embed all faces in one batch (same det_size as the loop)"""
+    kept = [(frame, face) for frame, face in
+            ((f, face_engine.detect_largest_face(f, compute_embedding=False)) for f in frames) if face is not None]
+    embeddings = face_engine._embed_faces([f for f, _ in kept], [face for _, face in kept])
+    return [e for e in embeddings if e is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (one face each)")
+    parser.add_argument("--frames", type=int, default=20, help="Frames per request")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per setting (best is reported)")
+    parser.add_argument("--model-dir", default=None, help="InsightFace root (default face_engine.MODEL_DIR)")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        face_engine.MODEL_DIR = args.model_dir
+    app = face_engine._get_face_app()
+    rec = app.models.get('recognition') if app is not None else None
+    if rec is None:
+        print("InsightFace recognition model not available")
+        return 1
+
+    frames = load_frames(args.frames_dir, args.frames) if args.frames_dir else []
+    faces = [face_engine.detect_largest_face(f, compute_embedding=False) for f in frames]
+    if frames and not all(faces):
+        print(f"No face found in {sum(f is None for f in faces)} of the sample frames; they are skipped")
+    usable = [(img, face) for img, face in zip(frames, faces) if face is not None and face.get('landmarks')]
+
+    if usable:
+        crops = [face_engine.align_face(img, face['landmarks'], rec.input_size[0]) for img, face in usable]
+    else:
+        rng = np.random.default_rng(0)
+        crops = [rng.integers(0, 256, (112, 112, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+    # Warm-up (first ONNX runs allocate)
+    rec.get_feat(crops[:1])
+    rec.get_feat(crops)
+
+    print("=" * 72)
+    print("BATCHED ARCFACE BENCHMARK")
+    print(f"frames/request={len(crops)}, repeats={args.repeats}, input={tuple(rec.input_shape)}, "
+          f"cpus={os.cpu_count()}")
+    print("=" * 72)
+
+    single_ms, _ = best_of(lambda: [rec.get_feat(c) for c in crops], args.repeats)
+    if rec.input_shape[0] == 1:
+        print("Recognition model has a fixed batch of 1; batching falls back to one call per face")
+    batch_ms, _ = best_of(lambda: rec.get_feat(crops), args.repeats)
+    print(f"{'stage':<28} {'per-frame ms':>13} {'batched ms':>11} {'speedup':>8}")
+    print(f"{'recognition model only':<28} {single_ms:13.1f} {batch_ms:11.1f} {single_ms / batch_ms:7.2f}x")
+
+    if usable:
+        request = [img for img, _ in usable]
+        loop_ms, loop_embs = best_of(lambda: per_frame_embeddings(request), args.repeats)
+        batched_ms, batched_embs = best_of(lambda: batched_embeddings(request), args.repeats)
+        print(f"{'request (detect + embed)':<28} {loop_ms:13.1f} {batched_ms:11.1f} {loop_ms / batched_ms:7.2f}x")
+        if len(loop_embs) == len(batched_embs) and loop_embs:
+            diff = float(np.max(np.abs(np.vstack(loop_embs) - np.vstack(batched_embs))))
+            print(f"embeddings: {len(loop_embs)} per path, max |diff| = {diff:.2e}")
+        else:
+            print(f"embeddings: per-frame {len(loop_embs)}, batched {len(batched_embs)}")
+    else:
+        print("No --frames-dir faces: request latency not measured")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
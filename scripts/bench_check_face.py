@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the /api/check_face hot path (detect_closest_face_opencv).
+
+Compares the previous implementation, which parsed the Haar cascade XML and
+allocated new resize/grayscale images on every call, with the current one
+(per-thread cached cascade and reused buffers). Runs single-threaded and with
+several threads polling at once (several kiosks), and checks both agree.
+
+Usage:
+    python scripts/bench_check_face.py [--frames-dir samples/] [--calls 200] [--threads 1,4]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the models and embeddings.db are not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def previous_check_face(img_bgr):
+    """detect_closest_face_opencv before the cascade/buffer caching"""
+    cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+    detector = cv2.CascadeClassifier(cascade_path)
+    scale = face_engine._det_scale(img_bgr.shape, face_engine.CHECK_FACE_DET_SIZE)
+    small_img = cv2.resize(img_bgr, None, fx=scale, fy=scale)
+    gray = cv2.cvtColor(small_img, cv2.COLOR_BGR2GRAY)
+    min_side = max(int(face_engine.MIN_FACE_SIZE * scale), 24)
+    faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(min_side, min_side))
+    return len(faces) > 0
+
+
+def load_frames(frames_dir, rng):
+    if frames_dir:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp")
+                       for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+        frames = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+        if frames:
+            return frames
+    # Webcam-sized noise frames: the cascade scans them like any frame
+    return [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(8)]
+
+
+def run(fn, frames, calls, threads):
+    """(ms per call, calls per second, results of the first pass over frames)"""
+    jobs = [frames[i % len(frames)] for i in range(calls)]
+    fn(frames[0])  # Warm-up (and per-thread cache fill for the main thread)
+    t0 = time.perf_counter()
+    if threads == 1:
+        for frame in jobs:
+            fn(frame)
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(fn, jobs))
+    elapsed = time.perf_counter() - t0
+    return elapsed * 1000 / calls, calls / elapsed, [fn(f) for f in frames]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (default: synthetic)")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per setting")
+    parser.add_argument("--threads", default="1,4", help="Comma separated thread counts")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames_dir, np.random.default_rng(0))
+
+    print("=" * 72)
+    print("CHECK_FACE MICROBENCHMARK")
+    print(f"frames={len(frames)} ({frames[0].shape[1]}x{frames[0].shape[0]}), calls={args.calls}, "
+          f"CHECK_FACE_DET_SIZE={face_engine.CHECK_FACE_DET_SIZE}, cpus={os.cpu_count()}")
+    print("=" * 72)
+
+    t0 = time.perf_counter()
+    cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+    print(f"cascade XML parse: {(time.perf_counter() - t0) * 1000:.1f} ms (previously paid on every call)")
+
+    print(f"{'threads':>7} {'path':>9} {'ms/call':>8} {'calls/s':>8} {'speedup':>8} {'same':>5}")
+    for threads in [int(t) for t in args.threads.split(",") if t.strip()]:
+        old_ms, old_rate, old_hits = run(previous_check_face, frames, args.calls, threads)
+        new_ms, new_rate, new_hits = run(face_engine.detect_closest_face_opencv, frames, args.calls, threads)
+        same = "yes" if old_hits == new_hits else "NO"
+        print(f"{threads:>7} {'previous':>9} {old_ms:8.2f} {old_rate:8.1f} {'1.00x':>8} {'-':>5}")
+        print(f"{threads:>7} {'cached':>9} {new_ms:8.2f} {new_rate:8.1f} {old_ms / new_ms:7.2f}x {same:>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Throughput/latency benchmark of dynamic request batching (DYNAMIC_BATCHING)
+under simulated concurrency.
+
+C clients each send --requests recognition requests of --faces aligned crops
+through face_engine._embed_aligned. The run without batching (every request
+calls the recognition model on its own thread) is compared with the shared
+scheduler at several BATCH_MAX_FACES / BATCH_MAX_WAIT_MS settings, reporting
+requests/s, faces/s, mean batch size and p50/p99 request latency.
+
+Crops come from --frames-dir (aligned faces) or are random 112x112 noise,
+which costs the recognition model the same.
+
+Usage:
+    python scripts/bench_dynamic_batching.py [--concurrency 1,4,16] [--settings 8:2,32:5,64:10]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def load_crops(frames_dir, count, rng):
+    crops = []
+    if frames_dir:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp")
+                       for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+        for img in (cv2.imread(p) for p in paths):
+            face = face_engine.detect_largest_face(img, compute_embedding=False) if img is not None else None
+            if face is not None and face.get('landmarks') is not None:
+                crops.append(face_engine.align_face(img, face['landmarks']))
+    if not crops:
+        return [rng.integers(0, 256, (112, 112, 3), dtype=np.uint8) for _ in range(count)]
+    return [crops[i % len(crops)] for i in range(count)]
+
+
+def client(crops, requests):
+    latencies = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        face_engine._embed_aligned(crops)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def run(crops, concurrency, requests):
+    """(requests/s, latencies ms, mean batch size or None)"""
+    batcher = face_engine._get_batcher() if face_engine.DYNAMIC_BATCHING else None
+    if batcher is not None:
+        batches, faces = batcher.batches, batcher.faces
+    with ThreadPoolExecutor(concurrency) as pool:
+        t0 = time.perf_counter()
+        results = list(pool.map(lambda _: client(crops, requests), range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    latencies = np.array([ms for r in results for ms in r])
+    mean_batch = None
+    if batcher is not None and batcher.batches > batches:
+        mean_batch = (batcher.faces - faces) / (batcher.batches - batches)
+    return len(latencies) / elapsed, latencies, mean_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrent clients")
+    parser.add_argument("--settings", default="8:2,32:5,64:10",
+                        help="Comma separated BATCH_MAX_FACES:BATCH_MAX_WAIT_MS pairs")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--faces", type=int, default=1, help="Aligned crops per request")
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (default: synthetic crops)")
+    parser.add_argument("--model-dir", default=None, help="InsightFace root (default face_engine.MODEL_DIR)")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        face_engine.MODEL_DIR = args.model_dir
+    if face_engine._get_face_app() is None:
+        print("InsightFace not available")
+        return 1
+    crops = load_crops(args.frames_dir, args.faces, np.random.default_rng(0))
+    settings = [tuple(s.split(":")) for s in args.settings.split(",") if s.strip()]
+    face_engine._recognize_crops(crops)  # Warm-up
+
+    print("=" * 84)
+    print("DYNAMIC BATCHING BENCHMARK")
+    print(f"cpus={os.cpu_count()}, faces/request={len(crops)}, requests/client={args.requests}, "
+          f"sessions={face_engine.INFERENCE_SESSIONS}")
+    print("=" * 84)
+    print(f"{'clients':>7} {'batching':>12} {'req/s':>8} {'faces/s':>8} {'batch':>6} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'vs off':>7}")
+
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        face_engine.DYNAMIC_BATCHING = False
+        base_rate, latencies, _ = run(crops, concurrency, args.requests)
+        print(f"{concurrency:>7} {'off':>12} {base_rate:8.1f} {base_rate * len(crops):8.1f} {'-':>6} "
+              f"{np.percentile(latencies, 50):8.1f} {np.percentile(latencies, 99):8.1f} {'1.00x':>7}")
+        face_engine.DYNAMIC_BATCHING = True
+        for max_faces, wait_ms in settings:
+            face_engine.BATCH_MAX_FACES = int(max_faces)
+            face_engine.BATCH_MAX_WAIT_MS = float(wait_ms)
+            rate, latencies, mean_batch = run(crops, concurrency, args.requests)
+            batch = f"{mean_batch:6.1f}" if mean_batch is not None else f"{'-':>6}"
+            print(f"{concurrency:>7} {max_faces + '/' + wait_ms + 'ms':>12} {rate:8.1f} {rate * len(crops):8.1f} "
+                  f"{batch} {np.percentile(latencies, 50):8.1f} {np.percentile(latencies, 99):8.1f} "
+                  f"{rate / base_rate:6.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark find_matching_identity: legacy per-embedding loop vs contiguous
+gallery matrix search, on synthetic galleries of 1k, 10k and 100k identities.
+
+Usage:
+    python scripts/bench_find_matching.py [--sizes 1000,10000,100000] [--per-identity 2] [--queries 20]
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Shared report harness: repo root on sys.path, auto-init disabled
+from gallery_bench import face_engine, synthetic_gallery, install_gallery, make_queries
+
+
+def legacy_find_matching_identity(query_embedding, embeddings_db, threshold, top_k=5):
+    """Reference implementation: the original per-NIK Python loop"""
+    matches = []
+    for nik, embeddings in embeddings_db.items():
+        similarities = [face_engine.cosine_similarity(query_embedding, emb) for emb in embeddings]
+        max_sim = max(similarities) if similarities else 0.0
+        if max_sim >= threshold:
+            matches.append((nik, max_sim))
+    matches.sort(key=lambda x: x[1], reverse=True)
+    return matches[:top_k]
+
+
+def same_results(a, b, tol=1e-5):
+    if len(a) != len(b):
+        return False
+    return all(na == nb and abs(sa - sb) <= tol for (na, sa), (nb, sb) in zip(a, b))
+
+
+def bench(num_identities, per_identity, num_queries, threshold, legacy_limit, rng):
+    matrix, niks, counts = synthetic_gallery(num_identities, per_identity, rng, spread=0.3)
+    # Genuine attempts only: noisy copies of random gallery embeddings
+    queries = make_queries(matrix, num_queries, 0.45, 0.0, rng)
+
+    t0 = time.perf_counter()
+    install_gallery(matrix, niks, counts)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    new_results = [face_engine.find_matching_identity(q, threshold) for q in queries]
+    new_ms = (time.perf_counter() - t0) * 1000 / num_queries
+
+    legacy_ms = None
+    identical = None
+    if num_identities <= legacy_limit:
+        gallery = {int(nik): list(rows) for nik, rows in zip(niks, np.split(matrix, np.cumsum(counts)[:-1]))}
+        t0 = time.perf_counter()
+        old_results = [legacy_find_matching_identity(q, gallery, threshold) for q in queries]
+        legacy_ms = (time.perf_counter() - t0) * 1000 / num_queries
+        identical = all(same_results(a, b) for a, b in zip(old_results, new_results))
+
+    return build_ms, new_ms, legacy_ms, identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated identity counts")
+    parser.add_argument("--per-identity", type=int, default=2, help="Embeddings stored per identity")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per gallery size")
+    parser.add_argument("--threshold", type=float, default=face_engine.RECOGNITION_THRESHOLD)
+    parser.add_argument("--legacy-limit", type=int, default=100000,
+                        help="Skip the (slow) legacy loop above this many identities")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    print("=" * 78)
+    print("find_matching_identity BENCHMARK")
+    print(f"per_identity={args.per_identity}, queries={args.queries}, threshold={args.threshold}")
+    print("=" * 78)
+    print(f"{'identities':>10} {'rows':>9} {'build ms':>9} {'legacy ms/q':>12} {'matrix ms/q':>12} {'speedup':>8} {'same':>5}")
+
+    for n in sizes:
+        build_ms, new_ms, legacy_ms, identical = bench(
+            n, args.per_identity, args.queries, args.threshold, args.legacy_limit, rng
+        )
+        legacy_str = f"{legacy_ms:12.2f}" if legacy_ms is not None else f"{'-':>12}"
+        speedup = f"{legacy_ms / new_ms:7.1f}x" if legacy_ms is not None else f"{'-':>8}"
+        same = ("yes" if identical else "NO") if identical is not None else "-"
+        print(f"{n:>10} {n * args.per_identity:>9} {build_ms:9.1f} {legacy_str} {new_ms:12.3f} {speedup} {same:>5}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
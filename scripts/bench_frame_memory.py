@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Peak memory per request: frames decoded up front (the previous handlers:
+every upload through bytes_to_bgr into a list) vs passed to the engine as
+face_engine.EncodedFrame (decoded one at a time, only as far as the vote or
+enrollment gets).
+
+Each mode runs in a fresh child process. After a warm-up request it measures
+one request of each endpoint: peak RSS above the pre-request RSS (sampled
+every millisecond), peak traced Python/NumPy allocations (tracemalloc), full
+decodes performed and latency. The recognize requests run against a gallery
+enrolled from the same frames. With --workers, inference runs in that many
+worker processes (INFERENCE_WORKERS) and the web process's RSS includes the
+shared-memory frame slots it has written.
+
+Usage:
+    python scripts/bench_frame_memory.py [--frames-dir samples/] [--frames 20] [--size 1280x720] [--workers 1]
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+ENDPOINTS = ("recognize", "recognize_fast", "register")
+
+
+def load_blobs(frames_dir, count, size):
+    """JPEG bytes of one burst (synthetic: a smooth image drifting 2 px per frame)"""
+    images = []
+    if frames_dir:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp")
+                       for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+        images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        w, h = size
+        base = cv2.resize(np.random.default_rng(0).integers(0, 256, (h // 8, w // 8, 3), dtype=np.uint8), (w, h),
+                          interpolation=cv2.INTER_CUBIC)
+        images = [np.roll(base, 2 * i, axis=1) for i in range(count)]
+    return [cv2.imencode(".jpg", images[i % len(images)], [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+            for i in range(count)]
+
+
+class PeakRSS:
+    """Highest RSS seen by a 1 ms sampling thread while active"""
+
+    def __enter__(self):
+        self.peak = face_engine._process_rss() or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, face_engine._process_rss() or 0)
+            time.sleep(0.001)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, face_engine._process_rss() or 0)
+
+
+def child(mode, blobs_path, nik, workers):
+    """Run the requests of one mode in this process; print a JSON result per endpoint"""
+    blobs = np.load(blobs_path, allow_pickle=True).tolist()
+    face_engine.INFERENCE_WORKERS = workers
+    if workers:
+        face_engine._get_inference_pool().warm_up()
+    workdir = tempfile.mkdtemp(prefix="frame_memory_")
+    face_engine.EMBEDDING_DB_PATH = os.path.join(workdir, "embeddings.db")
+    face_engine.EMBEDDING_NPY_PATH = os.path.join(workdir, "embeddings.npy")
+    face_engine.LABELS_PATH = os.path.join(workdir, "labels.json")
+    face_engine.GALLERY_SNAPSHOT = False
+    face_engine.init_embedding_db()
+    face_engine.load_all_embeddings()
+    if not workers and face_engine._get_face_app() is None:
+        print(json.dumps({"error": "InsightFace not available"}))
+        return 1
+    face_engine.enroll_multiple_frames([face_engine.EncodedFrame(b) for b in blobs], nik)
+
+    decodes = [0]
+    decode = face_engine.EncodedFrame.decode
+
+    def counting_decode(self):
+        decodes[0] += 1
+        return decode(self)
+
+    face_engine.EncodedFrame.decode = counting_decode
+
+    def request(endpoint, run):
+        # What the handler does with the uploaded bytes, then the engine call
+        if mode == "eager":
+            frames = [cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR) for b in blobs]
+            decodes[0] += len(frames)
+        else:
+            frames = [face_engine.EncodedFrame(b) for b in blobs]
+        if endpoint == "register":
+            return face_engine.enroll_multiple_frames(frames, nik + 1 + run)
+        return face_engine.recognize_face_multi_frame(frames, fast_mode=endpoint == "recognize_fast")
+
+    for endpoint in ENDPOINTS:
+        request(endpoint, 0)  # Warm-up
+        decodes[0] = 0
+        before = face_engine._process_rss() or 0
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        with PeakRSS() as rss:
+            request(endpoint, 1)
+        ms = (time.perf_counter() - t0) * 1000
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(json.dumps({"endpoint": endpoint, "rss_mb": (rss.peak - before) / 1e6, "traced_mb": traced_peak / 1e6,
+                          "decodes": decodes[0], "ms": ms}), flush=True)
+    face_engine.shutdown_inference_pool()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (default: synthetic)")
+    parser.add_argument("--frames", type=int, default=20, help="Frames per request")
+    parser.add_argument("--size", default="1280x720", help="Synthetic frame size WxH")
+    parser.add_argument("--model-dir", default=None, help="InsightFace root (default face_engine.MODEL_DIR)")
+    parser.add_argument("--workers", type=int, default=0, help="Inference worker processes (0 = in-process)")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--blobs", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.model_dir:
+        face_engine.MODEL_DIR = args.model_dir
+    if args.child:
+        return child(args.child, args.blobs, 3200000000000001, args.workers)
+
+    blobs = load_blobs(args.frames_dir, args.frames, tuple(int(v) for v in args.size.split("x")))
+    first = cv2.imdecode(np.frombuffer(blobs[0], np.uint8), cv2.IMREAD_COLOR)
+    with tempfile.TemporaryDirectory() as tmp:
+        blobs_path = os.path.join(tmp, "blobs.npy")
+        np.save(blobs_path, np.array(blobs, dtype=object), allow_pickle=True)
+
+        print("=" * 80)
+        print("FRAME MEMORY BENCHMARK")
+        print(f"workers={args.workers}, frames/request={len(blobs)} ({first.shape[1]}x{first.shape[0]}, "
+              f"{sum(len(b) for b in blobs) / 1e6:.1f} MB JPEG, {first.nbytes * len(blobs) / 1e6:.1f} MB decoded)")
+        print("=" * 80)
+        print(f"{'endpoint':>15} {'mode':>6} {'peak RSS MB':>12} {'traced MB':>10} {'decodes':>8} {'ms':>8}")
+
+        # Fixed mmap threshold: freed frame buffers go back to the OS, so RSS follows live memory
+        env = dict(os.environ, MALLOC_MMAP_THRESHOLD_="131072")
+        results = {}
+        for mode in ("eager", "lazy"):
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--blobs", blobs_path,
+                   "--workers", str(args.workers)]
+            if args.model_dir:
+                cmd += ["--model-dir", args.model_dir]
+            out = subprocess.run(cmd, env=env, capture_output=True, text=True).stdout
+            rows = [json.loads(line) for line in out.splitlines() if line.startswith("{")]
+            if not rows or "error" in rows[0]:
+                print(rows[0]["error"] if rows else f"{mode} run failed")
+                return 1
+            results[mode] = {row["endpoint"]: row for row in rows}
+
+    for endpoint in ENDPOINTS:
+        for mode in ("eager", "lazy"):
+            row = results[mode][endpoint]
+            print(f"{endpoint:>15} {mode:>6} {row['rss_mb']:12.1f} {row['traced_mb']:10.1f} {row['decodes']:>8} "
+                  f"{row['ms']:8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
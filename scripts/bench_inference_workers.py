@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Isolation benchmark of the inference service mode (INFERENCE_WORKERS).
+
+While --heavy clients keep sending registration-sized requests (detect,
+quality-check and embed --frames frames), one light client polls
+check_face (Haar, as /api/check_face). Reported per mode, in-process
+inference vs N worker processes: check_face p50/p99 latency, heavy request
+latency and throughput, and the time spent shipping frames to the workers.
+
+Usage:
+    python scripts/bench_inference_workers.py [--workers 1,2] [--heavy 2] [--frames-dir samples/]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def load_frames(frames_dir, count, rng):
+    frames = []
+    if frames_dir:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp")
+                       for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+        frames = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not frames:
+        frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def run(frames, heavy, seconds):
+    """(check_face latencies ms, heavy latencies ms, elapsed s)"""
+    stop = threading.Event()
+    heavy_ms = []
+
+    def heavy_client():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            face_engine._registration_embeddings(frames, 20)
+            heavy_ms.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=heavy_client, daemon=True) for _ in range(heavy)]
+    for t in threads:
+        t.start()
+    light_ms = []
+    t_start = time.perf_counter()
+    while time.perf_counter() - t_start < seconds:
+        t0 = time.perf_counter()
+        face_engine.detect_closest_face_opencv(frames[len(light_ms) % len(frames)])
+        light_ms.append((time.perf_counter() - t0) * 1000)
+        time.sleep(0.05)
+    stop.set()
+    for t in threads:
+        t.join()
+    return np.array(light_ms), np.array(heavy_ms or [np.nan]), time.perf_counter() - t_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2", help="Comma separated worker counts (0 = in-process is always run)")
+    parser.add_argument("--heavy", type=int, default=2, help="Concurrent registration clients")
+    parser.add_argument("--frames", type=int, default=20, help="Frames per registration request")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration per mode")
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (default: synthetic)")
+    parser.add_argument("--model-dir", default=None, help="InsightFace root (default face_engine.MODEL_DIR)")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        face_engine.MODEL_DIR = args.model_dir
+    frames = load_frames(args.frames_dir, args.frames, np.random.default_rng(0))
+    frame_mb = sum(f.nbytes for f in frames) / 1e6
+
+    t0 = time.perf_counter()
+    shared = face_engine._SharedFrames(frames)
+    for i in range(len(shared)):
+        shared.write(i)
+    shm_ms = (time.perf_counter() - t0) * 1000
+    shared.close()
+
+    print("=" * 80)
+    print("INFERENCE WORKERS BENCHMARK")
+    print(f"cpus={os.cpu_count()}, heavy clients={args.heavy}, frames/request={len(frames)} ({frame_mb:.1f} MB), "
+          f"shared-memory copy={shm_ms:.1f} ms")
+    print("=" * 80)
+    print(f"{'mode':>12} {'check p50':>10} {'check p99':>10} {'heavy p50':>10} {'heavy/s':>8}")
+
+    for workers in [0] + [int(n) for n in args.workers.split(",") if n.strip() and int(n) > 0]:
+        face_engine.shutdown_inference_pool()
+        face_engine.INFERENCE_WORKERS = workers
+        if workers:
+            face_engine._get_inference_pool().warm_up()
+        elif face_engine._get_face_app() is None:
+            print("InsightFace not available")
+            return 1
+        face_engine._registration_embeddings(frames, 20)  # Warm-up
+        light, heavy, elapsed = run(frames, args.heavy, args.seconds)
+        mode = "in-process" if workers == 0 else f"{workers} workers"
+        print(f"{mode:>12} {np.percentile(light, 50):10.2f} {np.percentile(light, 99):10.2f} "
+              f"{np.nanpercentile(heavy, 50):10.1f} {np.count_nonzero(~np.isnan(heavy)) / elapsed:8.2f}")
+    face_engine.shutdown_inference_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark of the inference session pool (INFERENCE_SESSIONS) and ORT
+session options, for 1..N concurrent requests.
+
+One request is a short burst: detector on each frame plus one recognition
+batch of the aligned faces (synthetic noise frames/crops without
+--frames-dir, which still exercise both networks). For every pool size it
+reports throughput and latency percentiles per concurrency level.
+
+Usage:
+    python scripts/bench_session_pool.py [--sessions 1,2,4] [--concurrency 1,2,4,8] [--frames-dir samples/]
+    ORT_INTRA_OP_THREADS=2 ORT_EXECUTION_MODE=parallel python scripts/bench_session_pool.py
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def load_burst(frames_dir, count, rng):
+    """(frames, aligned crops) of one request"""
+    frames = []
+    if frames_dir:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp")
+                       for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+        frames = [img for img in (cv2.imread(p) for p in paths[:count]) if img is not None]
+    if not frames:
+        frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+
+    crops = []
+    for frame in frames:
+        face = face_engine.detect_largest_face(frame, compute_embedding=False)
+        if face is not None and face.get('landmarks') is not None:
+            crops.append(face_engine.align_face(frame, face['landmarks']))
+    if not crops:
+        crops = [rng.integers(0, 256, (112, 112, 3), dtype=np.uint8) for _ in range(count)]
+    return frames, crops
+
+
+def request(frames, crops):
+    t0 = time.perf_counter()
+    for frame in frames:
+        face_engine.detect_largest_face(frame, compute_embedding=False)
+    face_engine._embed_aligned(crops)
+    return (time.perf_counter() - t0) * 1000
+
+
+def reset_engine(sessions):
+    face_engine.INFERENCE_SESSIONS = sessions
+    face_engine._face_app = None
+    face_engine._face_app_pool = None
+    return face_engine._get_face_app() is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default=None, help="Comma separated pool sizes (default 1,2,4..cpu_count)")
+    parser.add_argument("--concurrency", default=None, help="Comma separated concurrent requests (default = sessions list)")
+    parser.add_argument("--requests", type=int, default=24, help="Requests per setting")
+    parser.add_argument("--frames", type=int, default=4, help="Frames per request")
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (default: synthetic)")
+    parser.add_argument("--model-dir", default=None, help="InsightFace root (default face_engine.MODEL_DIR)")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        face_engine.MODEL_DIR = args.model_dir
+    cpus = os.cpu_count() or 1
+    default = sorted({1, cpus} | {n for n in (2, 4, 8) if n < cpus})
+    pool_sizes = [int(n) for n in args.sessions.split(",")] if args.sessions else default
+    concurrency = [int(n) for n in args.concurrency.split(",")] if args.concurrency else sorted(set(default) | {2})
+
+    if not reset_engine(1):
+        print("InsightFace not available")
+        return 1
+    frames, crops = load_burst(args.frames_dir, args.frames, np.random.default_rng(0))
+
+    print("=" * 78)
+    print("INFERENCE SESSION POOL BENCHMARK")
+    print(f"cpus={cpus}, frames/request={len(frames)}, crops/request={len(crops)}, requests={args.requests}, "
+          f"intra={face_engine.ORT_INTRA_OP_THREADS or 'auto'}, inter={face_engine.ORT_INTER_OP_THREADS or 'auto'}, "
+          f"opt={face_engine.ORT_GRAPH_OPTIMIZATION}, mode={face_engine.ORT_EXECUTION_MODE}")
+    print("=" * 78)
+    print(f"{'sessions':>8} {'concurrent':>10} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+
+    for sessions in pool_sizes:
+        t0 = time.perf_counter()
+        reset_engine(sessions)
+        load_s = time.perf_counter() - t0
+        request(frames, crops)  # Warm-up
+        for level in concurrency:
+            with ThreadPoolExecutor(level) as pool:
+                list(pool.map(lambda _: request(frames, crops), range(level)))  # Warm every session
+                t0 = time.perf_counter()
+                latencies = np.array(list(pool.map(lambda _: request(frames, crops), range(args.requests))))
+                elapsed = time.perf_counter() - t0
+            print(f"{sessions:>8} {level:>10} {args.requests / elapsed:7.2f} {np.percentile(latencies, 50):8.1f} "
+                  f"{np.percentile(latencies, 95):8.1f} {latencies.max():8.1f}")
+        print(f"{'':>8} (pool built in {load_s:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
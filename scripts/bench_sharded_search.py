@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark sharded (multi-process, shared memory) gallery search against
+in-process search, by number of shard workers.
+
+Each worker holds a NIK-hash shard of the gallery; a query is scattered to
+every worker and the per-shard hits are merged. Reports per-query latency for
+single queries (find_matching_identity) and for stacked multi-frame batches
+(the recognize_face_multi_frame scoring step), and checks the results match.
+
+Usage:
+    python scripts/bench_sharded_search.py [--identities 200000] [--per-identity 5] [--workers 1,2,4,8]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def install_synthetic_gallery(num_identities, per_identity, rng):
+    """Publish a synthetic gallery of unit vectors; returns the (rows, 512) matrix"""
+    dim = face_engine.EMBEDDING_DIM
+    matrix = np.empty((num_identities * per_identity, dim), dtype=np.float32)
+    for start in range(0, matrix.shape[0], 65536):
+        block = rng.standard_normal((min(65536, matrix.shape[0] - start), dim)).astype(np.float32)
+        matrix[start:start + block.shape[0]] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    niks = np.arange(num_identities, dtype=np.int64) + 3500000000000000
+    counts = np.full(num_identities, per_identity, dtype=np.int64)
+    face_engine._replace_gallery(face_engine._quantize_embedding(matrix), niks, counts)
+    face_engine._embeddings_loaded = True
+    return matrix
+
+
+def make_queries(matrix, num_queries, rng):
+    """Noisy copies of random gallery rows (genuine attempts)"""
+    rows = rng.integers(0, matrix.shape[0], num_queries)
+    queries = matrix[rows] + 0.02 * rng.standard_normal((num_queries, matrix.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_search(queries, frames, threshold):
+    """(ms per single query, ms per frame batch, results)"""
+    t0 = time.perf_counter()
+    results = [face_engine.find_matching_identity(q, threshold) for q in queries]
+    single_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+    gallery = face_engine._get_gallery()
+    t0 = time.perf_counter()
+    for batch in frames:
+        face_engine._score_frames(batch, gallery, threshold)
+    batch_ms = (time.perf_counter() - t0) * 1000 / len(frames)
+    return single_ms, batch_ms, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identities", type=int, default=200000)
+    parser.add_argument("--per-identity", type=int, default=5, help="Embeddings stored per identity")
+    parser.add_argument("--workers", default=None, help="Comma separated worker counts (default 1,2,4..cpu_count)")
+    parser.add_argument("--queries", type=int, default=50, help="Single queries per setting")
+    parser.add_argument("--frames", type=int, default=8, help="Frames per multi-frame batch")
+    parser.add_argument("--batches", type=int, default=10, help="Multi-frame batches per setting")
+    parser.add_argument("--threshold", type=float, default=face_engine.RECOGNITION_THRESHOLD)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    else:
+        worker_counts = sorted({1, cpus} | {w for w in (2, 4, 8, 16, 32) if w < cpus})
+
+    rng = np.random.default_rng(0)
+    matrix = install_synthetic_gallery(args.identities, args.per_identity, rng)
+    queries = make_queries(matrix, args.queries, rng)
+    frames = [make_queries(matrix, args.frames, rng) for _ in range(args.batches)]
+
+    face_engine.SHARD_MIN_GALLERY = 0
+    face_engine.SHARD_WORKERS = 0
+    base_single, base_batch, reference = time_search(queries, frames, args.threshold)
+
+    print("=" * 78)
+    print("SHARDED GALLERY SEARCH BENCHMARK")
+    print(f"rows={matrix.shape[0]}, identities={args.identities}, cpus={cpus}, "
+          f"dtype={face_engine.GALLERY_DTYPE}, threshold={args.threshold}")
+    print("=" * 78)
+    print(f"{'workers':>7} {'load s':>7} {'ms/query':>9} {'speedup':>8} "
+          f"{f'ms/{args.frames}-frame':>13} {'speedup':>8} {'same':>5}")
+    print(f"{'in-proc':>7} {'-':>7} {base_single:9.2f} {'1.0x':>8} {base_batch:13.2f} {'1.0x':>8} {'-':>5}")
+
+    for workers in worker_counts:
+        if workers < 2:
+            continue  # One worker is just in-process search plus IPC
+        face_engine.SHARD_WORKERS = workers
+        t0 = time.perf_counter()
+        face_engine.build_shard_pool(workers)
+        load_s = time.perf_counter() - t0
+
+        # Warm-up so worker page faults are not counted
+        face_engine.find_matching_identity(queries[0], args.threshold)
+        single_ms, batch_ms, results = time_search(queries, frames, args.threshold)
+        same = "yes" if results == reference else "NO"
+        print(f"{workers:>7} {load_s:7.2f} {single_ms:9.2f} {base_single / single_ms:7.1f}x "
+              f"{batch_ms:13.2f} {base_batch / batch_ms:7.1f}x {same:>5}")
+
+    face_engine.shutdown_shard_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Latency/recall of detector input sizes (DET_SIZE_FULL / DET_SIZE_FAST /
+DET_SIZE_REGISTRATION, CHECK_FACE_DET_SIZE) over a folder of sample frames.
+
+The reference is InsightFace detection at --reference (default 640). For each
+det_size (0 = adaptive from MIN_FACE_SIZE) it reports the detector input,
+detection latency, recall (largest face found and IoU >= 0.5 with the
+reference box) and the cosine similarity between the embedding of that face
+and the reference embedding (landmark precision affects alignment).
+The Haar check_face path is reported the same way (hit rate only).
+
+Usage:
+    python scripts/det_size_report.py --frames-dir samples/ [--sizes 640,480,320,256,0]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init so the real embeddings.db is not loaded
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def load_frames(frames_dir):
+    paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp") for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+    return [img for img in (cv2.imread(p) for p in paths) if img is not None]
+
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def detect_all(frames, det_size):
+    """(faces, ms per frame); best of two passes so the first ONNX run at a new size is not counted"""
+    best_ms, faces = float("inf"), None
+    for _ in range(2):
+        t0 = time.perf_counter()
+        faces = [face_engine.detect_largest_face(f, compute_embedding=False, det_size=det_size) for f in frames]
+        best_ms = min(best_ms, (time.perf_counter() - t0) * 1000 / len(frames))
+    return faces, best_ms
+
+
+def size_label(det_size, frame):
+    app = face_engine._get_face_app()
+    input_size = face_engine._det_input_size(app, frame, det_size)
+    name = "adaptive" if det_size <= 0 else str(det_size)
+    return name, ("fixed" if input_size is None else f"{input_size[0]}x{input_size[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames-dir", required=True, help="Folder of sample kiosk frames")
+    parser.add_argument("--sizes", default="640,480,384,320,256,0", help="Comma separated det sizes (0 = adaptive)")
+    parser.add_argument("--reference", type=int, default=640, help="det_size used as ground truth")
+    parser.add_argument("--check-sizes", default="640,320,256,0", help="Comma separated CHECK_FACE_DET_SIZE values")
+    parser.add_argument("--model-dir", default=None, help="InsightFace root (default face_engine.MODEL_DIR)")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        face_engine.MODEL_DIR = args.model_dir
+    if face_engine._get_face_app() is None:
+        print("InsightFace not available")
+        return 1
+    frames = load_frames(args.frames_dir)
+    if not frames:
+        print(f"No images in {args.frames_dir}")
+        return 1
+
+    reference, _ = detect_all(frames, args.reference)
+    found = [i for i, face in enumerate(reference) if face is not None]
+    ref_embs = face_engine._embed_faces([frames[i] for i in found], [reference[i] for i in found])
+
+    print("=" * 80)
+    print("DETECTION SIZE REPORT")
+    print(f"frames={len(frames)} ({frames[0].shape[1]}x{frames[0].shape[0]}), reference det_size={args.reference} "
+          f"finds {len(found)}, MIN_FACE_SIZE={face_engine.MIN_FACE_SIZE}, "
+          f"DET_MIN_FACE_PIXELS={face_engine.DET_MIN_FACE_PIXELS}")
+    print("=" * 80)
+    print(f"{'det_size':>9} {'input':>9} {'ms/frame':>9} {'speedup':>8} {'recall':>7} {'extra':>6} "
+          f"{'emb cos mean':>13} {'min':>7}")
+
+    base_ms = None
+    for det_size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        faces, ms = detect_all(frames, det_size)
+        base_ms = base_ms or ms
+        matched = [k for k, i in enumerate(found) if faces[i] is not None and
+                   iou(faces[i]['bbox'], reference[i]['bbox']) >= 0.5]
+        extra = sum(1 for i, face in enumerate(faces) if face is not None and reference[i] is None)
+        embs = face_engine._embed_faces([frames[found[k]] for k in matched], [faces[found[k]] for k in matched])
+        sims = np.array([float(np.dot(e, ref_embs[k])) for k, e in zip(matched, embs)
+                         if e is not None and ref_embs[k] is not None])
+        name, input_size = size_label(det_size, frames[0])
+        recall = len(matched) / len(found) if found else float("nan")
+        cos = f"{sims.mean():13.4f} {sims.min():7.4f}" if sims.size else f"{'-':>13} {'-':>7}"
+        print(f"{name:>9} {input_size:>9} {ms:9.1f} {base_ms / ms:7.2f}x {recall:7.1%} {extra:>6} {cos}")
+
+    print()
+    print("check_face (Haar) vs reference InsightFace detection")
+    print(f"{'size':>9} {'ms/frame':>9} {'hit rate':>9} {'false pos':>10}")
+    saved = face_engine.CHECK_FACE_DET_SIZE
+    for det_size in [int(s) for s in args.check_sizes.split(",") if s.strip()]:
+        face_engine.CHECK_FACE_DET_SIZE = det_size
+        t0 = time.perf_counter()
+        hits = [face_engine.detect_closest_face_opencv(f) for f in frames]
+        ms = (time.perf_counter() - t0) * 1000 / len(frames)
+        hit_rate = sum(hits[i] for i in found) / len(found) if found else float("nan")
+        false_pos = sum(1 for i, h in enumerate(hits) if h and reference[i] is None)
+        name = "adaptive" if det_size <= 0 else str(det_size)
+        print(f"{name:>9} {ms:9.2f} {hit_rate:9.1%} {false_pos:>10}")
+    face_engine.CHECK_FACE_DET_SIZE = saved
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Shared harness of the gallery search reports (bench_find_matching.py,
+ann_recall_report.py, quantization_report.py): face_engine imported without
+auto-init, synthetic ArcFace-like galleries and queries, and the comparison of
+accept/reject decisions between two search modes.
+
+Not a script: the reports import it from this directory.
+"""
+
+import os
+import sys
+import sqlite3
+
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init: each report loads or builds the gallery it measures
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+SYNTHETIC_NIK_BASE = 3500000000000000
+
+
+def synthetic_gallery(num_identities, per_identity, rng, spread=0.42):
+    """
+    (matrix, niks, counts): per_identity unit-norm float32 rows around a random
+    center per identity, consecutive per NIK. spread=0.42 gives ArcFace-like
+    ~0.85 intra-class similarity.
+    """
+    dim = face_engine.EMBEDDING_DIM
+    matrix = np.empty((num_identities * per_identity, dim), dtype=np.float32)
+    for start in range(0, num_identities, 4096):
+        centers = rng.standard_normal((min(4096, num_identities - start), dim)).astype(np.float32)
+        centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+        noise = rng.standard_normal((centers.shape[0], per_identity, dim)).astype(np.float32) / np.sqrt(dim)
+        samples = centers[:, None, :] + spread * noise
+        samples /= np.linalg.norm(samples, axis=2, keepdims=True)
+        matrix[start * per_identity:(start + centers.shape[0]) * per_identity] = samples.reshape(-1, dim)
+    niks = SYNTHETIC_NIK_BASE + np.arange(num_identities, dtype=np.int64)
+    counts = np.full(num_identities, per_identity, dtype=np.int64)
+    return matrix, niks, counts
+
+
+def install_gallery(matrix, niks, counts):
+    """Publish a synthetic gallery as the face_engine gallery snapshot (in GALLERY_DTYPE)"""
+    face_engine._replace_gallery(np.ascontiguousarray(face_engine._quantize_embedding(matrix)), niks, counts)
+    face_engine._embeddings_loaded = True
+
+
+def write_synthetic_db(path, matrix, niks, counts):
+    """Create a float32 embeddings.db at path holding a synthetic gallery"""
+    face_engine.EMBEDDING_DB_PATH = path
+    face_engine.init_embedding_db()
+    row_niks = np.repeat(niks, counts)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO embeddings (nik, embedding, created_at, quality_score) VALUES (?, ?, ?, ?)",
+                     ((int(nik), row.tobytes(), "synthetic", 0.5) for nik, row in zip(row_niks, matrix)))
+    conn.commit()
+    conn.close()
+
+
+def make_queries(matrix, num_queries, noise, impostor_share, rng):
+    """Genuine queries are noisy gallery rows; impostors are random unit vectors"""
+    dim = matrix.shape[1]
+    num_impostors = int(num_queries * impostor_share)
+    rows = rng.integers(0, matrix.shape[0], num_queries - num_impostors)
+    genuine = matrix[rows] + noise * rng.standard_normal((rows.size, dim)).astype(np.float32) / np.sqrt(dim)
+    impostors = rng.standard_normal((num_impostors, dim)).astype(np.float32)
+    queries = np.vstack([genuine, impostors])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def compare_decisions(reference, decisions):
+    """
+    (lost, wrong) between two lists of per-query decisions, (identity, sim) or
+    None for a reject: lost = the reference accepts and decisions reject,
+    wrong = decisions accept a different identity or a reference reject
+    """
+    lost = wrong = 0
+    for ref, dec in zip(reference, decisions):
+        if ref is not None and dec is None:
+            lost += 1
+        elif dec is not None and (ref is None or dec[0] != ref[0]):
+            wrong += 1
+    return lost, wrong
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Local load test of the kiosk auto-trigger: HTTP polling of /api/check_face
+(one multipart POST per frame) vs the persistent /ws/check_face WebSocket.
+
+Starts the Flask app in this process (threaded Werkzeug server on a free
+port) and runs --kiosks simulated kiosks, each sending --polls small JPEG
+frames back to back over its own connection. Reported per transport:
+polls/s, p50/p99 round trip, CPU ms per poll (client and server, both run in
+this process) and the overhead over calling detect_closest_face_opencv
+directly on the same frames.
+
+Usage:
+    python scripts/loadtest_check_face.py [--kiosks 1,8] [--polls 200] [--frames-dir samples/]
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import argparse
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Add repo root and app/ (app.py imports face_engine top-level) to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "app"), ROOT]
+
+# The auto-trigger only needs the Haar cascade: skip model warm-up
+os.environ.setdefault("FACE_ENGINE_WARMUP", "0")
+
+
+def load_frames(frames_dir, rng):
+    """Small JPEG frames like captureSingleFrame (200 px wide, quality 50)"""
+    images = []
+    if frames_dir:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp")
+                       for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))
+        images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        images = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(8)]
+    frames = []
+    for img in images:
+        small = cv2.resize(img, (200, int(img.shape[0] * 200 / img.shape[1])))
+        frames.append(cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, 50])[1].tobytes())
+    return frames
+
+
+def http_kiosk(port, frames, polls):
+    latencies = []
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for i in range(polls):
+        boundary = uuid.uuid4().hex
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"frame\"; filename=\"check.jpg\"\r\n"
+                f"Content-Type: image/jpeg\r\n\r\n").encode() + frames[i % len(frames)] + f"\r\n--{boundary}--\r\n".encode()
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", "/api/check_face", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()  # Server closed the keep-alive connection: reconnect, as a browser would
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            conn.request("POST", "/api/check_face", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+            response = conn.getresponse()
+        json.loads(response.read())
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if response.getheader("Connection", "").lower() == "close":
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.close()
+    return latencies
+
+
+def ws_kiosk(port, frames, polls):
+    import simple_websocket
+
+    latencies = []
+    ws = simple_websocket.Client.connect(f"ws://127.0.0.1:{port}/ws/check_face")
+    try:
+        for i in range(polls):
+            t0 = time.perf_counter()
+            ws.send(frames[i % len(frames)])
+            json.loads(ws.receive())
+            latencies.append((time.perf_counter() - t0) * 1000)
+    finally:
+        ws.close()
+    return latencies
+
+
+def run(kiosk, port, frames, kiosks, polls):
+    """(polls/s, latencies ms, CPU ms per poll)"""
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(kiosks) as pool:
+        results = list(pool.map(lambda _: kiosk(port, frames, polls), range(kiosks)))
+    elapsed, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    latencies = np.array([ms for r in results for ms in r])
+    return latencies.size / elapsed, latencies, cpu * 1000 / latencies.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kiosks", default="1,8", help="Comma separated concurrent kiosks")
+    parser.add_argument("--polls", type=int, default=200, help="Frames per kiosk")
+    parser.add_argument("--frames-dir", default=None, help="Folder of sample frames (default: synthetic)")
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    import app as webapp
+    import face_engine
+
+    if webapp.sock is None:
+        print("flask-sock is not installed: only HTTP polling is available")
+    webapp.logging.getLogger("werkzeug").setLevel(webapp.logging.WARNING)  # No access log per poll
+
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    frames = load_frames(args.frames_dir, np.random.default_rng(0))
+    decoded = [cv2.imdecode(np.frombuffer(f, np.uint8), cv2.IMREAD_COLOR) for f in frames]
+    for img in decoded:
+        face_engine.detect_closest_face_opencv(img)  # Warm-up (cascade load)
+    t0 = time.perf_counter()
+    for i in range(args.polls):
+        face_engine.detect_closest_face_opencv(decoded[i % len(decoded)])
+    detect_ms = (time.perf_counter() - t0) * 1000 / args.polls
+
+    transports = [("http", http_kiosk)] + ([("websocket", ws_kiosk)] if webapp.sock is not None else [])
+    print("=" * 78)
+    print("CHECK_FACE LOAD TEST")
+    print(f"cpus={os.cpu_count()}, polls/kiosk={args.polls}, frame={np.mean([len(f) for f in frames]) / 1024:.1f} KB, "
+          f"detect only={detect_ms:.2f} ms")
+    print("=" * 78)
+    print(f"{'kiosks':>6} {'transport':>10} {'polls/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms/poll':>12} "
+          f"{'overhead':>9}")
+    for kiosks in [int(k) for k in args.kiosks.split(",") if k.strip()]:
+        for name, kiosk in transports:
+            kiosk(port, frames, 5)  # Warm-up
+            rate, latencies, cpu_ms = run(kiosk, port, frames, kiosks, args.polls)
+            print(f"{kiosks:>6} {name:>10} {rate:8.1f} {np.percentile(latencies, 50):8.2f} "
+                  f"{np.percentile(latencies, 99):8.2f} {cpu_ms:12.2f} {cpu_ms - detect_ms:8.2f}ms")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Prune embeddings.db to a small diverse set of embeddings per NIK
+(face_engine.prune_gallery) and report what changes.
+
+Before/after it reports gallery size, find_matching_identity latency, and the
+genuine-match similarity: for a sample of stored embeddings, the best
+similarity to the *other* embeddings of the same NIK (leave-one-out), i.e.
+how well a new capture resembling that frame would still match.
+
+Usage:
+    python scripts/prune_gallery.py --dry-run                 # report only
+    python scripts/prune_gallery.py --keep 5                  # prune embeddings.db
+    python scripts/prune_gallery.py --synthetic 2000 --keep 5 # synthetic database
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Disable auto-init; the gallery is loaded explicitly below
+os.environ["FACE_ENGINE_INIT"] = "0"
+
+from app import face_engine
+
+
+def write_synthetic_db(path, num_identities, per_identity, rng):
+    """Enrollment-like data: bursts of near-duplicate frames around a few poses per identity"""
+    dim = face_engine.EMBEDDING_DIM
+    face_engine.EMBEDDING_DB_PATH = path
+    face_engine.init_embedding_db()
+    rows = []
+    for i in range(num_identities):
+        center = rng.standard_normal(dim).astype(np.float32)
+        center /= np.linalg.norm(center)
+        poses = 0.35 * rng.standard_normal((3, dim)).astype(np.float32) / np.sqrt(dim)
+        frames = (center + poses[rng.integers(0, 3, per_identity)] +
+                  0.12 * rng.standard_normal((per_identity, dim)).astype(np.float32) / np.sqrt(dim))
+        frames /= np.linalg.norm(frames, axis=1, keepdims=True)
+        rows.extend((3500000000000000 + i, f.tobytes(), "synthetic", float(rng.uniform(0.3, 1.0))) for f in frames)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO embeddings (nik, embedding, created_at, quality_score) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def genuine_sims(grouped, selection, probes):
+    """Leave-one-out best same-NIK similarity of each probe (nik, row) against the selected rows"""
+    sims = []
+    for nik, row in probes:
+        embs = grouped[nik][1]
+        rows = selection[nik]
+        rows = rows[rows != row]
+        if rows.size:
+            sims.append(float(np.max(embs[rows] @ embs[row])))
+    return np.asarray(sims)
+
+
+def install(grouped, selection):
+    """Publish the selected rows of every NIK as the in-memory gallery; returns its size in bytes"""
+    niks = np.fromiter(grouped.keys(), dtype=np.int64, count=len(grouped))
+    counts = np.array([selection[nik].size for nik in grouped], dtype=np.int64)
+    matrix = face_engine._quantize_embedding(np.vstack([grouped[nik][1][selection[nik]] for nik in grouped]))
+    face_engine._replace_gallery(np.ascontiguousarray(matrix), niks, counts)
+    face_engine._embeddings_loaded = True
+    return matrix.nbytes
+
+
+def time_queries(queries, threshold):
+    t0 = time.perf_counter()
+    for q in queries:
+        face_engine.find_matching_identity(q, threshold)
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=face_engine.EMBEDDING_DB_PATH, help="embeddings.db to prune")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use a synthetic database with this many identities")
+    parser.add_argument("--per-identity", type=int, default=20, help="Embeddings per synthetic identity")
+    parser.add_argument("--keep", type=int, default=face_engine.PRUNE_KEEP, help="Max embeddings kept per NIK")
+    parser.add_argument("--duplicate-sim", type=float, default=face_engine.PRUNE_DUPLICATE_SIM)
+    parser.add_argument("--probes", type=int, default=1000, help="Stored embeddings sampled as genuine probes")
+    parser.add_argument("--threshold", type=float, default=face_engine.RECOGNITION_THRESHOLD)
+    parser.add_argument("--dry-run", action="store_true", help="Report only, do not delete anything")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tmp_dir = None
+    if args.synthetic:
+        tmp_dir = tempfile.TemporaryDirectory()
+        write_synthetic_db(os.path.join(tmp_dir.name, "embeddings.db"), args.synthetic, args.per_identity, rng)
+    else:
+        face_engine.EMBEDDING_DB_PATH = args.db
+    face_engine.GALLERY_SNAPSHOT = False
+
+    grouped = face_engine._load_embeddings_by_nik()
+    if not grouped:
+        print("embeddings.db is empty - use --synthetic N or point --db at a populated database")
+        return 1
+
+    before = {nik: np.arange(len(ids)) for nik, (ids, _) in grouped.items()}
+    after = {nik: face_engine._select_representatives(embs, args.keep, args.duplicate_sim)
+             for nik, (_, embs) in grouped.items()}
+
+    # Genuine probes: stored embeddings of NIKs with at least two rows
+    candidates = [(nik, row) for nik, (ids, _) in grouped.items() if len(ids) > 1 for row in range(len(ids))]
+    picks = rng.choice(len(candidates), min(args.probes, len(candidates)), replace=False) if candidates else []
+    probes = [candidates[i] for i in picks]
+    queries = [grouped[nik][1][row] for nik, row in probes[:200]] or [grouped[next(iter(grouped))][1][0]]
+
+    results = {}
+    for label, selection in (("before", before), ("after", after)):
+        nbytes = install(grouped, selection)
+        results[label] = {
+            'rows': sum(s.size for s in selection.values()),
+            'mb': nbytes / 1e6,
+            'ms': time_queries(queries, args.threshold),
+            'sims': genuine_sims(grouped, selection, probes)
+        }
+
+    print("=" * 78)
+    print("GALLERY PRUNING REPORT")
+    print(f"niks={len(grouped)}, keep={args.keep}, duplicate_sim={args.duplicate_sim}, "
+          f"probes={len(probes)}, threshold={args.threshold}")
+    print("=" * 78)
+    print(f"{'':>7} {'rows':>9} {'MB':>8} {'ms/query':>9} {'genuine mean':>13} {'p5':>7} {'below thr':>10}")
+    for label in ("before", "after"):
+        r = results[label]
+        sims = r['sims']
+        mean = f"{sims.mean():13.4f}" if sims.size else f"{'-':>13}"
+        p5 = f"{np.percentile(sims, 5):7.4f}" if sims.size else f"{'-':>7}"
+        below = f"{np.mean(sims < args.threshold):10.1%}" if sims.size else f"{'-':>10}"
+        print(f"{label:>7} {r['rows']:>9} {r['mb']:8.1f} {r['ms']:9.3f} {mean} {p5} {below}")
+    b, a = results["before"], results["after"]
+    print(f"gallery -{1 - a['rows'] / b['rows']:.0%} rows, search {b['ms'] / a['ms']:.1f}x faster")
+
+    if args.dry_run:
+        print("Dry run: embeddings.db not modified")
+    else:
+        face_engine._embeddings_loaded = False  # prune_gallery must not reload the report gallery
+        print(face_engine.prune_gallery(keep=args.keep, duplicate_sim=args.duplicate_sim))
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Measure the compact gallery modes (GALLERY_DTYPE=float16/int8, optional
+GALLERY_RERANK) against the float32 gallery.
+
+Reports gallery memory, SQLite BLOB size, latency, and how many accept/reject
+decisions at RECOGNITION_THRESHOLD change (and how many queries sit within
++/-0.01 of the threshold, where quantization error matters most).
+
+Usage:
+    python scripts/quantization_report.py                    # embeddings.db
+    python scripts/quantization_report.py --synthetic 5000   # synthetic gallery
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+# Shared report harness: repo root on sys.path, auto-init disabled
+from gallery_bench import face_engine, synthetic_gallery, write_synthetic_db, make_queries, compare_decisions
+
+MODES = [
+    ("float32", 0),
+    ("float16", 0),
+    ("float16", 10),
+    ("int8", 0),
+    ("int8", 10),
+]
+
+
+def decide(queries, threshold):
+    """Top-1 decision per query: (nik, similarity) or None"""
+    out = []
+    for q in queries:
+        matches = face_engine.find_matching_identity(q, threshold=threshold, top_k=1)
+        out.append(matches[0] if matches else None)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=face_engine.EMBEDDING_DB_PATH, help="embeddings.db to evaluate")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use a synthetic gallery with this many identities")
+    parser.add_argument("--per-identity", type=int, default=20, help="Embeddings per synthetic identity")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.4, help="Noise added to genuine queries")
+    parser.add_argument("--impostor-share", type=float, default=0.2, help="Share of non-enrolled queries")
+    parser.add_argument("--threshold", type=float, default=face_engine.RECOGNITION_THRESHOLD)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tmp_dir = None
+    if args.synthetic:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp_dir.name, "embeddings.db")
+        write_synthetic_db(db_path, *synthetic_gallery(args.synthetic, args.per_identity, rng))
+    else:
+        db_path = args.db
+
+    # Load once at full precision; each mode re-quantizes the in-memory gallery
+    face_engine.EMBEDDING_DB_PATH = db_path
+    face_engine.GALLERY_DTYPE = "float32"
+    face_engine.GALLERY_SNAPSHOT = False
+    face_engine.load_all_embeddings()
+    full = face_engine._get_gallery()
+    matrix = np.array(full.take(np.arange(full.num_rows)))
+    niks = full.niks.copy()
+    counts = np.diff(np.append(full.offsets, full.num_rows))
+    if matrix.shape[0] == 0:
+        print("Gallery is empty - use --synthetic N or point --db at a populated embeddings.db")
+        return 1
+
+    queries = make_queries(matrix, args.queries, args.noise, args.impostor_share, rng)
+    blob_sizes = {name: face_engine._quantize_embedding(matrix[0], name).nbytes for name in ("float32", "float16", "int8")}
+
+    print("=" * 84)
+    print("COMPACT GALLERY REPORT")
+    print(f"rows={matrix.shape[0]}, identities={niks.size}, queries={len(queries)}, threshold={args.threshold}")
+    print("=" * 84)
+    print(f"{'mode':<16} {'gallery MB':>10} {'saved':>6} {'BLOB MB':>8} {'ms/query':>9} "
+          f"{'changed':>8} {'near thr':>9} {'max |d|':>8}")
+
+    reference = None
+    base_bytes = None
+    for dtype, rerank in MODES:
+        face_engine.GALLERY_DTYPE = dtype
+        face_engine.GALLERY_RERANK = rerank
+        face_engine._replace_gallery(face_engine._quantize_embedding(matrix), niks, counts)
+        gallery = face_engine._get_gallery().base
+
+        t0 = time.perf_counter()
+        decisions = decide(queries, args.threshold)
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        # Raw top-1 similarity regardless of threshold, for the error column
+        scores = np.array([m[0][1] if m else np.nan for m in
+                           (face_engine.find_matching_identity(q, threshold=-1.0, top_k=1) for q in queries)])
+
+        if reference is None:
+            reference = (decisions, scores)
+            base_bytes = gallery.nbytes
+            near = int(np.sum(np.abs(scores - args.threshold) <= 0.01))
+            changed, max_diff = 0, 0.0
+        else:
+            changed = sum(compare_decisions(reference[0], decisions))
+            max_diff = float(np.nanmax(np.abs(scores - reference[1])))
+
+        label = dtype + (f"+rerank{rerank}" if rerank else "")
+        blob_mb = blob_sizes[dtype] * matrix.shape[0] / 1e6
+        print(f"{label:<16} {gallery.nbytes / 1e6:10.1f} {1 - gallery.nbytes / base_bytes:6.0%} {blob_mb:8.1f} "
+              f"{ms:9.3f} {changed:>8} {near:>9} {max_diff:8.5f}")
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
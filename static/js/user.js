@@ -87,9 +87,14 @@
   let nextScanTimer = null; // Timer untuk 10 detik reset
   let isScanning = false; // True jika sedang proses capture/verifikasi
   let faceDetectedTime = 0; // Waktu (ms) wajah terdeteksi terus menerus
+  let checkSocket = null; // WebSocket /ws/check_face (null = polling HTTP /api/check_face)
+  let checkSocketFailed = false; // Server tanpa WebSocket -> tetap polling HTTP
+  let checkReply = null; // Resolver balasan frame yang sedang dicek
+  let checkInFlight = false;
   const CHECK_INTERVAL = 350; // Cek wajah setiap 350ms (balance between responsiveness and CPU usage)
   const REQUIRED_TIME = 1400; // Butuh 1.4 detik (1400ms) untuk trigger - fast but accurate
   const CIRCLE_FULL = 226; // Dasharray SVG (sesuai r=36 di HTML baru)
+  const SCAN_CHUNK = 4; // Frame per upload saat verifikasi progresif
 
   // --- NAVIGATION ---
   function showPage(id) {
@@ -139,6 +144,9 @@
   function startAutoCheck() {
     if (autoCheckInterval) clearInterval(autoCheckInterval);
     faceDetectedTime = 0;
+    // Countdown di server dimulai ulang (mis. setelah scan selesai)
+    const socket = openCheckSocket();
+    if (socket && socket.readyState === WebSocket.OPEN) socket.send('reset');
 
     autoCheckInterval = setInterval(async () => {
       // Syarat: Halaman Poli aktif, Stream ada, Tidak sedang scanning, Modal loading tidak muncul, Hasil tidak muncul
@@ -147,40 +155,84 @@
       if (isScanning) return;
       if (!modalLoading.classList.contains('hidden')) return;
       if (!verifResult.classList.contains('hidden')) return;
+      if (checkInFlight) return; // Jawaban frame sebelumnya belum datang
 
       // 1. Ambil 1 frame kecil (fast)
       const frameBlob = await captureSingleFrame(videoVerif, 0.5);
       if (!frameBlob) return;
 
-      // 2. Kirim ke API Check Face
-      const fd = new FormData();
-      fd.append('frame', frameBlob, 'check.jpg');
-
+      // 2. Kirim lewat WebSocket (koneksi tetap) atau API Check Face
+      checkInFlight = true;
       try {
-        const r = await fetch('/api/check_face', { method: 'POST', body: fd });
-        const d = await r.json();
-
-        if (d.ok && d.found) {
-          // Wajah DITEMUKAN
-          faceDetectedTime += CHECK_INTERVAL;
-          statusVerif.textContent = `Wajah terdeteksi... ${Math.ceil((REQUIRED_TIME - faceDetectedTime) / 1000)}s`;
-          updateCountdownUI(faceDetectedTime, REQUIRED_TIME);
-
-          if (faceDetectedTime >= REQUIRED_TIME) {
-            triggerAutoScan();
-          }
-        } else {
-          // Wajah HILANG
-          faceDetectedTime = 0;
-          statusVerif.textContent = 'Menunggu wajah...';
-          resetCountdownUI();
-        }
+        const ws = openCheckSocket();
+        const d = ws && ws.readyState === WebSocket.OPEN ? await checkFaceSocket(ws, frameBlob) : await checkFaceHttp(frameBlob);
+        if (!isScanning) handleCheckResult(d);
       } catch (err) {
         // Silent fail
+      } finally {
+        checkInFlight = false;
       }
     }, CHECK_INTERVAL);
   }
 
+  function handleCheckResult(d) {
+    if (d.ok && d.found) {
+      // Wajah DITEMUKAN (lewat WebSocket, lama wajah terdeteksi dihitung server)
+      const required = d.required_ms || REQUIRED_TIME;
+      faceDetectedTime = d.held_ms !== undefined ? d.held_ms : faceDetectedTime + CHECK_INTERVAL;
+      statusVerif.textContent = `Wajah terdeteksi... ${Math.ceil((required - faceDetectedTime) / 1000)}s`;
+      updateCountdownUI(faceDetectedTime, required);
+
+      if (d.trigger !== undefined ? d.trigger : faceDetectedTime >= required) {
+        triggerAutoScan();
+      }
+    } else {
+      // Wajah HILANG
+      faceDetectedTime = 0;
+      statusVerif.textContent = 'Menunggu wajah...';
+      resetCountdownUI();
+    }
+  }
+
+  function openCheckSocket() {
+    if (checkSocketFailed || !('WebSocket' in window)) return null;
+    if (checkSocket) return checkSocket;
+    const proto = location.protocol === 'https:' ? 'wss' : 'ws';
+    const ws = new WebSocket(`${proto}://${location.host}/ws/check_face`);
+    let opened = false;
+    ws.onopen = () => {
+      opened = true;
+    };
+    ws.onmessage = (ev) => {
+      const resolve = checkReply;
+      checkReply = null;
+      if (resolve) resolve(JSON.parse(ev.data));
+    };
+    ws.onclose = () => {
+      // Tidak pernah terbuka -> server tanpa WebSocket, pakai HTTP. Putus -> sambung lagi di cek berikutnya
+      if (!opened) checkSocketFailed = true;
+      if (checkSocket === ws) checkSocket = null;
+      if (checkReply) checkReply({ ok: false, found: false });
+      checkReply = null;
+    };
+    checkSocket = ws;
+    return ws;
+  }
+
+  function checkFaceSocket(ws, frameBlob) {
+    return new Promise((resolve) => {
+      checkReply = resolve;
+      ws.send(frameBlob);
+    });
+  }
+
+  async function checkFaceHttp(frameBlob) {
+    const fd = new FormData();
+    fd.append('frame', frameBlob, 'check.jpg');
+    const r = await fetch('/api/check_face', { method: 'POST', body: fd });
+    return r.json();
+  }
+
   function stopAutoCheck() {
     if (autoCheckInterval) {
       clearInterval(autoCheckInterval);
@@ -232,18 +284,9 @@
     showLoading('Verifikasi Otomatis: mengambil foto...');
     const scanStartTime = Date.now();
 
-    // Capture 20 frames for accuracy, but with minimal gap (25ms) for speed
-    const frames = await captureFrames(videoVerif, 20, 25, null, 'Verifikasi', 0.8);
-    updateProgress(20, 20, 'Memproses');
-
-    const fd = new FormData();
-    frames.forEach((b, i) => fd.append('frames[]', b, `scan_${i}.jpg`));
-    // Enable fast_mode for auto-detection flow (uses optimized recognition)
-    fd.append('fast_mode', 'true');
-
     try {
-      const r = await fetch('/api/recognize', { method: 'POST', body: fd });
-      const d = await r.json();
+      // Enable fast_mode for auto-detection flow (uses optimized recognition)
+      const d = await recognizeProgressive(videoVerif, true);
       hideLoading();
       const scanDuration = (Date.now() - scanStartTime) / 1000;
 
@@ -431,7 +474,8 @@
     }
   }
 
-  function captureFrames(videoEl, total = 20, gap = 120, counterEl = null, label = 'Frame', quality = 0.85) {
+  // onFrame(blob) dipanggil tiap frame; return false untuk berhenti lebih awal
+  function captureFrames(videoEl, total = 20, gap = 120, counterEl = null, label = 'Frame', quality = 0.85, onFrame = null) {
     return new Promise((resolve) => {
       const canvas = document.createElement('canvas');
       const ctx = canvas.getContext('2d');
@@ -448,7 +492,8 @@
             taken++;
             if (counterEl) counterEl.textContent = taken;
             updateProgress(taken, total, label);
-            if (taken >= total) resolve(frames);
+            const more = onFrame ? onFrame(b) !== false : true;
+            if (taken >= total || !more) resolve(frames);
             else setTimeout(grab, gap);
           },
           'image/jpeg',
@@ -459,6 +504,51 @@
     });
   }
 
+  // --- PROGRESSIVE RECOGNITION ---
+  // Frame dikirim per SCAN_CHUNK selama capture berjalan; server menjawab done
+  // begitu voting sudah memutuskan, lalu capture dihentikan. Hasil akhir sama
+  // formatnya dengan /api/recognize.
+  async function recognizeProgressive(videoEl, fastMode, total = 20, gap = 25) {
+    const startFd = new FormData();
+    startFd.append('fast_mode', fastMode ? 'true' : 'false');
+    const rs = await fetch('/api/recognize/session', { method: 'POST', body: startFd });
+    const s = await rs.json();
+    if (!s.ok) return s;
+    const base = `/api/recognize/session/${s.session_id}`;
+
+    let decision = null;
+    let uploads = Promise.resolve();
+    let chunk = [];
+    let sent = 0;
+    const upload = (blobs) => {
+      uploads = uploads.then(async () => {
+        if (decision) return;
+        const fd = new FormData();
+        blobs.forEach((b) => fd.append('frames[]', b, `scan_${sent++}.jpg`));
+        const r = await fetch(`${base}/frames`, { method: 'POST', body: fd });
+        const d = await r.json();
+        if (!d.ok || d.done) decision = d;
+      });
+    };
+
+    // Capture 20 frames at most, with minimal gap (25ms) for speed
+    await captureFrames(videoEl, total, gap, null, 'Verifikasi', 0.8, (blob) => {
+      chunk.push(blob);
+      if (chunk.length >= SCAN_CHUNK) {
+        upload(chunk);
+        chunk = [];
+      }
+      return !decision;
+    });
+    if (chunk.length) upload(chunk);
+    updateProgress(total, total, 'Memproses');
+    await uploads;
+    if (decision) return decision;
+
+    const r = await fetch(`${base}/finish`, { method: 'POST' });
+    return r.json();
+  }
+
   // --- EVENT LISTENERS ---
 
   // 1. Registrasi
@@ -541,18 +631,9 @@
     showLoading('Verifikasi Manual: mengambil foto...');
     const scanStartTime = Date.now();
 
-    // Capture 20 frames for accuracy, but with minimal gap (25ms) for speed
-    const frames = await captureFrames(videoVerif, 20, 25, null, 'Verifikasi', 0.8);
-    updateProgress(20, 20, 'Memproses');
-
-    const fd = new FormData();
-    frames.forEach((b, i) => fd.append('frames[]', b, `scan_${i}.jpg`));
-    // Disable fast_mode for manual verification (uses InsightFace directly, no OpenCV pre-check)
-    fd.append('fast_mode', 'false');
-
     try {
-      const r = await fetch('/api/recognize', { method: 'POST', body: fd });
-      const d = await r.json();
+      // Disable fast_mode for manual verification (uses InsightFace directly, no OpenCV pre-check)
+      const d = await recognizeProgressive(videoVerif, false);
       hideLoading();
       const scanDuration = (Date.now() - scanStartTime) / 1000;
 